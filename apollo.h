@@ -30,8 +30,12 @@ static const omp_sched_t sched[] = {
     omp_sched_guided};
 static const int chunk[] = {0, 16, 64, 256, 1024};
 
+#elif __has_include("machineProfiles/apolloProfile.h")
+// generated from the node's topology by exploreHyperparams/machineProfiles.py
+#include "machineProfiles/apolloProfile.h"
+
 #else
-#error "Ruby or Lassen Machine Unspecified"
+#error "Ruby or Lassen Machine Unspecified, and no machineProfiles/apolloProfile.h generated"
 static const int nthreads[] = {72, 60, 48, 36, 18};
 static const int bind[] = {CLOSE, SPREAD};
 static const omp_sched_t sched[] = {omp_sched_static, omp_sched_dynamic, omp_sched_guided};
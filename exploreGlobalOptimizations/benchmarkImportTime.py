@@ -0,0 +1,103 @@
+import argparse
+import subprocess
+import statistics
+import json
+import sys
+import os
+from benchmarks import *
+
+# Measures the cold-start cost of a simulated run: each rep is a fresh
+# interpreter that imports simulateGlobalOptimRunOnNode, loads the
+# database tables and imports the one optimizer library the run needs.
+# One more interpreter runs the import under -X importtime to show which
+# modules the import time goes to.
+
+# the library each optimizer's manager imports when it gets built
+OPTIM_LIBS = {'bo': 'bayes_opt', 'pso': 'sko.PSO', 'cma': 'cma'}
+
+COLD_START = '''
+import time, json
+start = time.perf_counter()
+import simulateGlobalOptimRunOnNode as sim
+imported = time.perf_counter()
+tables = sim.LookupTables({database!r}, {progname!r}, {probsize!r}, {schedEncoding!r})
+loaded = time.perf_counter()
+import {optimLib}
+done = time.perf_counter()
+print(json.dumps({{'import': imported-start, 'database': loaded-imported, 'optimizer': done-loaded, 'total': done-start}}))
+'''
+
+
+def runColdStart(args):
+  code = COLD_START.format(database=args.database, progname=args.progname, probsize=args.probsize,
+                           schedEncoding=args.schedEncoding, optimLib=OPTIM_LIBS[args.optim])
+  result = subprocess.run([sys.executable, '-c', code], cwd=ROOT_DIR, capture_output=True, text=True)
+  if result.returncode != 0:
+    print(result.stdout, result.stderr)
+    raise RuntimeError('cold start run failed')
+
+  # the database load may print, the timings are the last line
+  return json.loads(result.stdout.strip().split('\n')[-1])
+
+
+# returns the cumulative secs of `import module` and [(cumulative secs, name)]
+# of what it imports itself and what those import, slowest first
+def getImportTimes(module):
+  result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import '+module],
+                          cwd=ROOT_DIR, capture_output=True, text=True)
+  if result.returncode != 0:
+    print(result.stderr)
+    raise RuntimeError('import of '+module+' failed')
+
+  # lines look like: 'import time:   self [us] | cumulative | imported package'
+  # with each nested import indented two more spaces than its importer
+  total = None
+  times = []
+  for line in result.stderr.split('\n'):
+    if not line.startswith('import time:') or 'cumulative' in line:
+      continue
+    _, cumulative, name = line[len('import time:'):].split('|')
+    depth = (len(name) - len(name.lstrip()) - 1)//2
+    if depth == 0 and name.strip() == module:
+      total = int(cumulative)/1e6
+    elif depth in [1, 2]:
+      times += [(int(cumulative)/1e6, '  '*(depth-1)+name.strip())]
+
+  return total, sorted(times, reverse=True)
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Cold-start import benchmark of a simulated run')
+
+  parser.add_argument('--progname', help='What program to load the tables of', required=False, default='lulesh', type=str)
+  parser.add_argument('--probsize', help='What problem size to use', required=False, default='smlprob', type=str)
+  parser.add_argument('--database', help='Database file in databases/, defaults to the one of this machine', required=False, type=str, default=None)
+  parser.add_argument('--optim', help='Which optimizer library to import', required=False, default='bo', type=str, choices=list(OPTIM_LIBS.keys()))
+  parser.add_argument('--schedEncoding', help='Schedule encoding of the tables (structured,lexicographic)',
+                      required=False, type=str, default='structured', choices=['structured', 'lexicographic'])
+  parser.add_argument('--reps', help='Number of fresh interpreters to time', required=False, type=int, default=5)
+  parser.add_argument('--top', help='Number of the slowest imports to list', required=False, type=int, default=10)
+
+  args = parser.parse_args()
+  if args.database is None:
+    args.database = getDefaultDatabase()
+  print('Got input args:', args)
+
+  # the first run also compiles the database artifacts if they're missing
+  runColdStart(args)
+
+  reps = [runColdStart(args) for rep in range(args.reps)]
+  print('median cold start over', args.reps, 'fresh interpreters (seconds):')
+  for phase in ['import', 'database', 'optimizer', 'total']:
+    print(f'  {phase:10s} {statistics.median([rep[phase] for rep in reps]):.4f}')
+
+  total, times = getImportTimes('simulateGlobalOptimRunOnNode')
+  print(f'import simulateGlobalOptimRunOnNode takes {total:.4f} seconds, its slowest imports (cumulative seconds):')
+  for secs, name in times[:args.top]:
+    print(f'  {secs:.4f} {name}')
+
+  return
+
+
+if __name__ == "__main__":
+  main()
@@ -1,79 +1,168 @@
-import platform, sys, os
+import platform, sys, os, glob, json
 
 # figure out the root directory
 ROOT_DIR = os.path.dirname(os.path.realpath(__file__))
 #ROOT_DIR = ROOT_DIR.replace('/usr/WS2/bolet1', '/g/g15/bolet1/workspace')
-print('ROOT_DIR', ROOT_DIR)
 
-# figure out what machine we're on, we only assume single node runs
-MACHINE=None
+PROFILES_DIR = os.path.realpath(ROOT_DIR+'/../machineProfiles')
+
+# figure out what machine we're on, we only assume single node runs.
+# Importing this module has no side effects: ruby and lassen are known by
+# their hostnames, the machine profiles only get read by the first
+# getMachine() call, and the entry points that launch programs pin
+# themselves to the machine's cpus with applyAffinity()
 uname = str(platform.uname().node)
+currMachine = None
 if 'lassen' in uname:
-    MACHINE = 'lassen'
-    os.sched_setaffinity(0, list(range(8,88))+list(range(96,176)))
+    currMachine = 'lassen'
 elif 'ruby' in uname:
-    MACHINE = 'ruby'
-    os.sched_setaffinity(0, {i for i in range(112)})
-else:
-    sys.exit('Unrecognized Machine Type from uname')
+    currMachine = 'ruby'
+
+# thread counts of the local machine profile: 1/8, 1/4, 1/2 and all of its cpus
+NUM_LOCAL_CPUS = len(os.sched_getaffinity(0))
+LOCAL_THREADS = sorted({max(NUM_LOCAL_CPUS*k//8, 1) for k in [1,2,4,8]})
 
 # we're going to use the environment vars to control the num threads,
 # proc binds, and places while the Apollo instrumentation controls the
 # schedule for each of the regions
-if MACHINE == 'lassen':
-  num_threads_policies = 9
-  num_places_policies = 3
-  num_bind_policies = 2
-  num_region_policies = 22
-
-elif MACHINE == 'ruby':
-  num_threads_policies = 10
-  num_places_policies = 3
-  num_bind_policies = 2
-  num_region_policies = 22
+num_region_policies = 22
 
 
 # specify the job launching approach for each machine
 # the timeouts are in units of seconds
 machines = {
     'ruby' : {
-        #'envvars': {
-        #    'OMP_NUM_THREADS': [str(a) for a in [4,8,14,28,42,56,70,84,98,112]],
-        #    'OMP_PROC_BIND': ['close', 'spread'],
-        #    'OMP_PLACES': ['threads', 'cores', 'sockets'],
-        #    'OMP_SCHEDULE': ['static']+[ a+','+str(b) for a in ['static', 'guided', 'dynamic'] for b in [1,4,8,32,64,128,256,512] ],
-        #},
+        'envvars': {
+            'OMP_NUM_THREADS': [str(a) for a in [4,8,14,28,42,56,70,84,98,112]],
+            'OMP_PROC_BIND': ['close', 'spread'],
+            'OMP_PLACES': ['threads', 'cores', 'sockets'],
+            'OMP_SCHEDULE': ['static']+[ a+','+str(b) for a in ['static', 'guided', 'dynamic'] for b in [1,4,8,32,64,128,256,512] ],
+        },
+        # cpus the runs get pinned to, see applyAffinity()
+        'affinity' : set(range(112)),
         'pythonToModLoad' : 'python/3.10.8',
         'jobsystem' : {
             'runner' : 'sbatch --nodes=1 ',
             'debug' : '--partition=pdebug ', 
             'nodetime' : '--time=', # in format of: minutes
-            'output' : '--output=' # can do "path/to/file.log"
+            'output' : '--output=', # can do "path/to/file.log"
+            'array' : '--array={} ', # in format of: 1-N
+            'arrayIndex' : 'SLURM_ARRAY_TASK_ID',
+            'arrayLogIndex' : '%a', # array index in the output log name
+            'maxArraySize' : 1000
         }
     },
 
     'lassen' : {
-        #'envvars': {
-        #    'OMP_NUM_THREADS': [str(a) for a in [10,20,40,60,80,100,120,140,160]],
-        #    'OMP_PROC_BIND': ['close', 'spread'],
-        #    'OMP_PLACES': ['threads', 'cores', 'sockets'],
-        #    'OMP_SCHEDULE': ['static']+[ a+','+str(b) for a in ['static', 'guided', 'dynamic'] for b in [1,4,8,32,64,128,256,512] ],
-        #},
+        'envvars': {
+            'OMP_NUM_THREADS': [str(a) for a in [10,20,40,60,80,100,120,140,160]],
+            'OMP_PROC_BIND': ['close', 'spread'],
+            'OMP_PLACES': ['threads', 'cores', 'sockets'],
+            'OMP_SCHEDULE': ['static']+[ a+','+str(b) for a in ['static', 'guided', 'dynamic'] for b in [1,4,8,32,64,128,256,512] ],
+        },
+        # skips the cores the OS and daemons run on
+        'affinity' : list(range(8,88))+list(range(96,176)),
         'pythonToModLoad' : 'python/3.8.2',
         'jobsystem' : {
             'runner' : 'bsub -nnodes 1 ',
             'debug' : '-qpdebug ', 
             'nodetime' : '-W ', # in format of: minutes
-            'output' : '-o ' # can do "path/to/file.log"
+            'output' : '-o ', # can do "path/to/file.log"
+            'array' : '-J gosweep[{}] ', # in format of: 1-N
+            'arrayIndex' : 'LSB_JOBINDEX',
+            'arrayLogIndex' : '%I', # array index in the output log name
+            'maxArraySize' : 1000
+        }
+    },
+
+    'local' : {
+        'envvars': {
+            'OMP_NUM_THREADS': [str(a) for a in LOCAL_THREADS],
+            'OMP_PROC_BIND': ['close', 'spread'],
+            'OMP_PLACES': ['threads', 'cores', 'sockets'],
+            'OMP_SCHEDULE': ['static']+[ a+','+str(b) for a in ['static', 'guided', 'dynamic'] for b in [1,4,8,32,64,128,256,512] ],
+        },
+        # keeps whatever cpus we were started with
+        'affinity' : None,
+        # no modules to load, jobs run in a process pool on this machine
+        'pythonToModLoad' : '',
+        'jobsystem' : {
+            'runner' : 'local',
         }
     }
 }
 
+# the profile generated for this node type from its topology by
+# exploreHyperparams/machineProfiles.py: the one whose hostPrefix our short
+# hostname starts with, None if there's none
+def findMachineProfile():
+    hostname = uname.split('.')[0]
+    for profilePath in sorted(glob.glob(PROFILES_DIR+'/*.json')):
+        with open(profilePath) as profileFile:
+            profile = json.load(profileFile)
+        if hostname.startswith(profile['hostPrefix']):
+            return profile
+    return None
+
+# name of the machine we're on, its entry in machines. Other node types than
+# ruby and lassen get theirs from their profile, any other machine (dev
+# workstations, containers) runs the pipeline itself with the local job
+# system, see localJobSystem.py
+def getMachine():
+    global currMachine
+    if currMachine is not None:
+        return currMachine
+
+    profile = findMachineProfile()
+    if profile is None:
+        currMachine = 'local'
+        return currMachine
+
+    # a generated profile names its job system, whose commands are the
+    # same as ruby's (slurm), lassen's (lsf) or the local one
+    jobsystems = {'slurm': 'ruby', 'lsf': 'lassen', 'local': 'local'}
+    machines[profile['name']] = {**profile, 'jobsystem': machines[jobsystems[profile['jobsystem']]]['jobsystem']}
+    currMachine = profile['name']
+    return currMachine
+
+# pins this process (and everything it launches from now on) to the
+# current machine's cpus, call it before any runs are timed
+def applyAffinity():
+    cpus = machines[getMachine()]['affinity']
+    if cpus is not None:
+        os.sched_setaffinity(0, cpus)
+    return
+
+# the database (a file name in databases/) the simulated runs replay by
+# default: the one built on this machine, or on machines without one (local
+# runs, generated profiles) the only one there is
+def getDefaultDatabase():
+    machine = getMachine()
+    databases = sorted(os.path.basename(path) for path in glob.glob(ROOT_DIR+'/databases/*-fullExploreDataset.csv'))
+    if machine+'-fullExploreDataset.csv' in databases:
+        return machine+'-fullExploreDataset.csv'
+    if len(databases) == 1:
+        print('no database of', machine, '-- using', databases[0])
+        return databases[0]
+    raise ValueError('No database of '+machine+' in '+ROOT_DIR+'/databases to default to, pick one with --database', databases)
+
+# num of levels of each policy on the current machine, the schedule is
+# one of the region policies
+def getNumPolicies():
+    envvars = machines[getMachine()]['envvars']
+    return {'OMP_NUM_THREADS': len(envvars['OMP_NUM_THREADS']),
+            'OMP_PROC_BIND': len(envvars['OMP_PROC_BIND']),
+            'OMP_PLACES': len(envvars['OMP_PLACES']),
+            'OMP_SCHEDULE': num_region_policies}
+
 # specify each program and how to gather/check it's output
 progs = {
     'bt_nas': {
         'xtime-regex':r'(?<=Time in seconds =)(\s*\d*\.\d*)(?=\s)',
         'valid-regex':r'(Verification\s*=\s*SUCCESSFUL)(?=\s)',
+        # progress lines for extrapolating the total runtime while it runs
+        'iters-regex':r'(?<=Iterations:)\s*(\d+)',
+        'progress-regex':r'(?<=Time step)\s*(\d+)',
         'dirname' : 'bt',
         'exe': {
             'smlprob': './bt.B.x',
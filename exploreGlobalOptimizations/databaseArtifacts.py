@@ -0,0 +1,98 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+# Precompiled slices of a full-explore database, one per (prog, probsize):
+#   <prog>-<probsize>.npy   float64 planes x threads x bind x places x schedule
+#   <prog>-<probsize>.json  the planes ('xtime', 'stddev' and 'censored' if
+#                           the database has it) and the sorted labels of each axis
+# They live in a dir named after the database CSV next to it, so copying
+# a database over means copying its dir along with it (cp -p, the CSV's
+# mtime says whether they're current, else the first run recompiles them
+# from the CSV). Loading one is an np.load with mmap_mode='r': no CSV
+# parsing, and every worker on a node shares the same pages of the page cache.
+# This module only needs numpy/pandas, the database builder of
+# exploreHyperparams imports it too.
+
+AXES = ['OMP_NUM_THREADS', 'OMP_PROC_BIND', 'OMP_PLACES', 'OMP_SCHEDULE']
+
+
+def getArtifactDir(databaseCSV):
+  return os.path.splitext(databaseCSV)[0]
+
+
+def getArtifactPaths(databaseCSV, progname, probsize):
+  stem = getArtifactDir(databaseCSV)+'/'+progname+'-'+probsize
+  return stem+'.npy', stem+'.json'
+
+
+# np.save and json.dump both go through a temp file that replaces the old
+# one, so concurrent writers of the same artifact never leave a torn file
+def replaceFile(path, write):
+  tmpPath = path+'.'+str(os.getpid())+'.tmp'
+  with open(tmpPath, 'wb') as f:
+    write(f)
+  os.replace(tmpPath, path)
+  return
+
+
+# db is the averaged database (one row per config), writes the artifacts
+# of every (prog, probsize) in it. The database CSV's size and mtime go in
+# the JSON, so readers can tell when the CSV changed under its artifacts.
+def writeDatabaseArtifacts(db, databaseCSV):
+  artifactDir = getArtifactDir(databaseCSV)
+  if not os.path.exists(artifactDir):
+    os.makedirs(artifactDir)
+
+  stat = os.stat(databaseCSV)
+  planes = ['xtime', 'stddev'] + (['censored'] if 'censored' in db.columns else [])
+
+  for (progname, probsize), df in db.groupby(['progname', 'probsize']):
+    labels = [sorted(df[axis].unique()) for axis in AXES]
+    idxs = tuple(pd.Index(axisLabels).get_indexer(df[axis]) for axisLabels,axis in zip(labels, AXES))
+
+    shape = tuple(len(axisLabels) for axisLabels in labels)
+    flatIdxs = np.ravel_multi_index(idxs, shape)
+    assert(len(np.unique(flatIdxs)) == len(flatIdxs))
+
+    # missing configurations are left as NaN
+    tensor = np.full((len(planes),)+shape, np.nan)
+    for planeIdx,plane in enumerate(planes):
+      tensor[planeIdx][idxs] = df[plane].to_numpy(dtype=float)
+
+    meta = {'planes': planes,
+            'axes': {axis:[label.item() if isinstance(label, np.generic) else label for label in axisLabels]
+                     for axis,axisLabels in zip(AXES, labels)},
+            'databaseSize': stat.st_size, 'databaseMtime': stat.st_mtime}
+
+    npyPath, jsonPath = getArtifactPaths(databaseCSV, progname, probsize)
+    replaceFile(npyPath, lambda f: np.save(f, tensor))
+    replaceFile(jsonPath, lambda f: f.write(json.dumps(meta).encode('utf-8')))
+
+  print('wrote database artifacts to', artifactDir)
+  return
+
+
+# returns (planes, meta) with planes mapping each plane name to its
+# read-only memory-mapped tensor, or None when the artifact is missing or
+# older than the database CSV
+def loadDatabaseArtifact(databaseCSV, progname, probsize):
+  npyPath, jsonPath = getArtifactPaths(databaseCSV, progname, probsize)
+  if not (os.path.exists(npyPath) and os.path.exists(jsonPath)):
+    return None
+
+  with open(jsonPath) as f:
+    meta = json.load(f)
+
+  if os.path.exists(databaseCSV):
+    stat = os.stat(databaseCSV)
+    if (stat.st_size, stat.st_mtime) != (meta['databaseSize'], meta['databaseMtime']):
+      print('database artifact', npyPath, 'is older than', Path(databaseCSV).name, '-- ignoring it')
+      return None
+
+  tensor = np.load(npyPath, mmap_mode='r')
+  assert(tensor.shape == (len(meta['planes']),)+tuple(len(meta['axes'][axis]) for axis in AXES))
+
+  return {plane:tensor[planeIdx] for planeIdx,plane in enumerate(meta['planes'])}, meta
@@ -0,0 +1,274 @@
+import time
+import os
+import numpy as np
+import random
+from benchmarks import *
+from globalOptimizers import ExplorationLogger, PSOManager, CMAManager, searchBounds
+
+# These ensembles run many instances of one optimization method in lockstep
+# against the database lookup tables. Each instance writes the same log
+# (and DONE file) that its PSOManager/CMAManager run would have written, so
+# the sweep analysis doesn't care which of the two produced it.
+
+
+# builds one logger per instance and drops the instances
+# whose DONE file already exists
+def setupInstanceLoggers(suffixes, logfilename, logfiledir, maxSamples, logfileCols, logFlushInterval):
+  keep = []
+  loggers = []
+  for idx,suffix in enumerate(suffixes):
+    logger = ExplorationLogger(logfilename+suffix, logfiledir, maxSamples,
+                               list(logfileCols), logFlushInterval)
+    if os.path.exists(logger.donelogfilepath):
+      print('Data already gathered at: ', logger.donelogfilepath)
+      continue
+    keep += [idx]
+    loggers += [logger]
+  return keep, loggers
+
+
+# PSO swarms that share a seed and population size draw the exact same
+# random numbers, regardless of w/c1/c2. So we keep one random stream for
+# the whole ensemble and stack the swarm state of every instance into
+# (instance, particle, dim) arrays that all get updated at once.
+# The math follows sko's PSO step-by-step so each instance reproduces
+# the trajectory of its PSOManager run.
+class PSOEnsemble:
+
+  def __init__(self, seed, population, ws, c1s, c2s, tables, logfilename, logfiledir, maxSamples, logFlushInterval=25):
+    self.seed = seed
+    self.pop = population
+    self.tables = tables
+    self.maxSamples = maxSamples
+
+    suffixes = [PSOManager.logSuffix(self.pop, w, c1, c2) for w,c1,c2 in zip(ws, c1s, c2s)]
+    keep, self.loggers = setupInstanceLoggers(suffixes, logfilename, logfiledir, maxSamples,
+                                              ['iter', 'sample'], logFlushInterval)
+
+    self.numInstances = len(keep)
+
+    # hyperparameters broadcast against the (instance, particle, dim) state
+    self.w = np.array([ws[idx] for idx in keep], dtype=float).reshape(-1, 1, 1)
+    self.c1 = np.array([c1s[idx] for idx in keep], dtype=float).reshape(-1, 1, 1)
+    self.c2 = np.array([c2s[idx] for idx in keep], dtype=float).reshape(-1, 1, 1)
+
+    lower, upper = searchBounds(tables.searchDims)
+    self.numDims = len(tables.searchDims)
+    self.lb = np.array(lower, dtype=float)
+    self.ub = np.array(upper)
+
+    # same draws as np.random.seed(seed) followed by sko's PSO constructor
+    self.rng = np.random.RandomState(self.seed)
+
+    shape = (self.numInstances, self.pop, self.numDims)
+    X = self.rng.uniform(low=self.lb, high=self.ub, size=(self.pop, self.numDims))
+    v_high = self.ub - self.lb
+    V = self.rng.uniform(low=-v_high, high=v_high, size=(self.pop, self.numDims))
+
+    self.X = np.broadcast_to(X, shape).copy()
+    self.V = np.broadcast_to(V, shape).copy()
+
+    self.iter = 0
+    self.globalSample = 0
+    self.optimXtime = 0
+
+    if self.numInstances == 0:
+      return
+
+    # the initial swarm always gets fully evaluated, like in PSOManager
+    self.Y = self.evaluate(enforceBudget=False)
+
+    self.pbest_x = self.X.copy()
+    self.pbest_y = np.full((self.numInstances, self.pop, 1), np.inf)
+    self.gbest_x = np.broadcast_to(X.mean(axis=0).reshape(1, -1), (self.numInstances, 1, self.numDims)).copy()
+    self.gbest_y = np.full(self.numInstances, np.inf)
+    self.update_gbest()
+
+    return
+
+  def __str__(self):
+    return f'pso-ensemble-pop{self.pop}-x{self.numInstances}'
+
+  def evaluate(self, enforceBudget=True):
+    numPoints = self.pop
+
+    # every instance has taken the same number of samples
+    if enforceBudget:
+      numPoints = min(self.pop, self.maxSamples - self.globalSample)
+      if numPoints <= 0:
+        raise StopIteration('Reached max samples to take! -- Stopping execution')
+
+    policies = np.round(self.X).astype(int)
+    xtimes, resultCols = self.tables.lookupBatch(policies.reshape(-1, self.numDims))
+
+    xtimes = xtimes.reshape(self.numInstances, self.pop)
+    resultCols = {k:v.reshape(self.numInstances, self.pop) for k,v in resultCols.items()}
+
+    # the array math is shared, so split its xtime evenly across the instances
+    optimXtime = self.optimXtime / self.numInstances / self.pop
+
+    for idx,logger in enumerate(self.loggers):
+      toLog = {k:v[idx, :numPoints] for k,v in resultCols.items()}
+      toLog['globalSample'] = self.globalSample + np.arange(numPoints)
+      toLog['iter'] = np.full(numPoints, self.iter)
+      toLog['sample'] = np.arange(numPoints)
+      toLog['optimXtime'] = np.full(numPoints, optimXtime)
+      logger.logPoints(toLog)
+
+    self.globalSample += numPoints
+    self.iter += 1
+
+    if numPoints < self.pop:
+      raise StopIteration('Reached max samples to take! -- Stopping execution')
+
+    return xtimes.reshape(self.numInstances, self.pop, 1)
+
+  def update_V(self):
+    r1 = self.rng.rand(self.pop, self.numDims)
+    r2 = self.rng.rand(self.pop, self.numDims)
+    self.V = self.w * self.V + \
+             self.c1 * r1 * (self.pbest_x - self.X) + \
+             self.c2 * r2 * (self.gbest_x - self.X)
+
+  def update_X(self):
+    self.X = self.X + self.V
+    self.X = np.clip(self.X, self.lb, self.ub)
+
+  def update_pbest(self):
+    need_update = self.pbest_y > self.Y
+    self.pbest_x = np.where(need_update, self.X, self.pbest_x)
+    self.pbest_y = np.where(need_update, self.Y, self.pbest_y)
+
+  def update_gbest(self):
+    instances = np.arange(self.numInstances)
+    idx_min = self.pbest_y[:, :, 0].argmin(axis=1)
+    best_y = self.pbest_y[instances, idx_min, 0]
+
+    # like sko, the new gbest_x comes from the current positions
+    better = self.gbest_y > best_y
+    self.gbest_x[better, 0, :] = self.X[instances[better], idx_min[better], :]
+    self.gbest_y[better] = best_y[better]
+
+  def takeNextStep(self):
+    self.optimXtime = 0
+    start = time.time()
+    self.update_V()
+    self.update_X()
+    self.optimXtime += (time.time() - start)
+    self.Y = self.evaluate()
+    self.update_pbest()
+    self.update_gbest()
+    return
+
+  def doRuns(self):
+    if self.numInstances == 0:
+      return
+
+    while True:
+      try:
+        self.takeNextStep()
+      except StopIteration as e:
+        print(str(self), 'stopping execution:', e)
+        break
+
+    for logger in self.loggers:
+      logger.markLogFileAsComplete()
+    return
+
+
+# pycma keeps its state in python objects (and draws from the global numpy
+# random state), so the CMA updates themselves can't be stacked the way PSO
+# can. Instead the instances step in lockstep: every instance asks with its
+# own saved random state, all the candidates are looked up in one batch,
+# then every instance gets told its results.
+class CMAEnsemble:
+
+  def __init__(self, seed, sigmas, popsizes, popsize_factors, tables, logfilename, logfiledir, maxSamples, logFlushInterval=25):
+    self.seed = seed
+    self.tables = tables
+    self.maxSamples = maxSamples
+
+    suffixes = [CMAManager.logSuffix(sigma, popsize, factor)
+                for sigma,popsize,factor in zip(sigmas, popsizes, popsize_factors)]
+    keep, self.loggers = setupInstanceLoggers(suffixes, logfilename, logfiledir, maxSamples,
+                                              [], logFlushInterval)
+
+    self.numInstances = len(keep)
+
+    self.esList = []
+    self.rngStates = []
+    for idx in keep:
+      # same seeding as CMAManager
+      np.random.seed(self.seed)
+      random.seed(self.seed)
+      self.esList += [CMAManager.makeES(self.seed, sigmas[idx], popsizes[idx], popsize_factors[idx],
+                                           tables.searchDims)]
+      self.rngStates += [np.random.get_state()]
+
+    self.active = list(range(self.numInstances))
+    self.iter = 0
+
+    return
+
+  def __str__(self):
+    return f'cma-ensemble-x{self.numInstances}'
+
+  def takeNextStep(self):
+    candidates = []
+    optimXtimes = []
+    for idx in self.active:
+      np.random.set_state(self.rngStates[idx])
+      start = time.time()
+      candidates += [self.esList[idx].ask()]
+      optimXtimes += [time.time() - start]
+      self.rngStates[idx] = np.random.get_state()
+
+    sizes = [len(cands) for cands in candidates]
+    policies = np.round(np.concatenate([np.array(cands) for cands in candidates])).astype(int)
+    xtimes, resultCols = self.tables.lookupBatch(policies)
+
+    stillActive = []
+    offset = 0
+    for idx,size,cands,optimXtime in zip(self.active, sizes, candidates, optimXtimes):
+      logger = self.loggers[idx]
+      numPoints = min(size, logger.maxSamples - logger.numRows)
+
+      if numPoints > 0:
+        toLog = {k:v[offset:offset+numPoints] for k,v in resultCols.items()}
+        toLog['globalSample'] = logger.numRows + np.arange(numPoints)
+        toLog['iter'] = np.full(numPoints, self.iter)
+        toLog['sample'] = np.arange(numPoints)
+        toLog['optimXtime'] = np.full(numPoints, optimXtime / size)
+        logger.logPoints(toLog)
+
+      # an instance that ran out of samples part-way through never gets told
+      if numPoints == size:
+        np.random.set_state(self.rngStates[idx])
+        self.esList[idx].tell(cands, list(xtimes[offset:offset+size]))
+        self.rngStates[idx] = np.random.get_state()
+        stillActive += [idx]
+
+      offset += size
+
+    self.active = stillActive
+    self.iter += 1
+
+    if len(self.active) == 0:
+      raise StopIteration('Reached max samples to take! -- Stopping execution')
+
+    return
+
+  def doRuns(self):
+    if self.numInstances == 0:
+      return
+
+    while True:
+      try:
+        self.takeNextStep()
+      except StopIteration as e:
+        print(str(self), 'stopping execution:', e)
+        break
+
+    for logger in self.loggers:
+      logger.markLogFileAsComplete()
+    return
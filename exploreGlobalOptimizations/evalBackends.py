@@ -0,0 +1,386 @@
+import os
+import sys
+import multiprocessing as mp
+import numpy as np
+import pandas as pd
+from benchmarks import *
+from databaseArtifacts import loadDatabaseArtifact, writeDatabaseArtifacts
+
+# The evaluation backends answer the optimizer managers' queries. Both map
+# the integer search points the optimizers hand out to OMP configurations
+# the same way (see SearchSpace), they differ in where the xtimes come from:
+#   LookupTables: replays the exhaustive exploration database
+#   LiveBackend: runs the benchmark with the configuration, via ProgRunner
+
+
+# the OMP hyperparameter values with their index maps, along with the
+# encoding of the search points handed to the optimizers
+class SearchSpace:
+  def __init__(self, threads, procs, places, scheds, schedEncoding='structured'):
+    # map each OMP hyperparameter to some indices
+    threads = sorted(threads)
+    print('num threads is:', len(threads))
+    self.threads_to_index = {thrd:idx for idx,thrd in enumerate(threads)}
+    self.index_to_threads = threads
+
+    procs = sorted(procs)
+    print('num procs is:', len(procs))
+    self.procs_to_index = {proc:idx for idx,proc in enumerate(procs)}
+    self.index_to_procs = procs
+
+    places = sorted(places)
+    print('num places is:', len(places))
+    self.places_to_index = {place:idx for idx,place in enumerate(places)}
+    self.index_to_places = places
+
+    scheds = sorted(scheds)
+    print('num schedules is:', len(scheds))
+    self.sched_to_index = {sched:idx for idx,sched in enumerate(scheds)}
+    self.index_to_sched = scheds
+
+    # array versions of the index maps for fancy-indexing whole populations
+    self.threadsArr = np.array(self.index_to_threads)
+    self.procsArr = np.array(self.index_to_procs, dtype=object)
+    self.placesArr = np.array(self.index_to_places, dtype=object)
+    self.schedArr = np.array(self.index_to_sched, dtype=object)
+
+    # how the optimizers see the schedules:
+    # structured: a categorical schedule kind and an ordinal chunk size dimension
+    # lexicographic: one dimension indexing the sorted schedule names
+    self.schedEncoding = schedEncoding
+    if schedEncoding == 'structured':
+      self.buildScheduleGrid()
+      self.schedDims = ['OMP_SCHEDULE_KIND', 'OMP_SCHEDULE_CHUNK']
+    elif schedEncoding == 'lexicographic':
+      self.schedIndex = np.arange(len(scheds))
+      self.schedDims = ['OMP_SCHEDULE']
+    else:
+      raise ValueError('Unknown schedule encoding requested', schedEncoding)
+
+    # the search space handed to the optimizer managers
+    dimNames = ['OMP_NUM_THREADS', 'OMP_PROC_BIND', 'OMP_PLACES'] + self.schedDims
+    dimSizes = [len(threads), len(procs), len(places)] + list(self.schedIndex.shape)
+    self.searchDims = list(zip(dimNames, dimSizes))
+
+    return
+
+  def buildScheduleGrid(self):
+    # sorting the schedule names interleaves the chunk sizes
+    # ('dynamic,1', 'dynamic,128', 'dynamic,256', 'dynamic,32', ...), so
+    # neighbouring indices can be wildly different schedules. Instead we
+    # split each schedule into its kind and its chunk size, where the
+    # chunk sizes are ordered by size -- they're powers of two, so each
+    # step along that axis is a roughly constant factor in chunk size
+    parsed = []
+    for sched in self.index_to_sched:
+      kind, _, chunk = sched.partition(',')
+      parsed += [(kind, int(chunk) if chunk else None)]
+
+    kinds = sorted({kind for kind,_ in parsed})
+
+    # a schedule without a chunk size (plain 'static') lets the runtime
+    # pick it, for static that is one block per thread -- the largest chunk
+    chunks = sorted({chunk for _,chunk in parsed if chunk is not None})
+    if any(chunk is None for _,chunk in parsed):
+      chunks += [None]
+
+    # (kind, chunk) index -> lexicographic schedule index
+    grid = np.full((len(kinds), len(chunks)), -1)
+    for schedIdx,(kind,chunk) in enumerate(parsed):
+      grid[kinds.index(kind), chunks.index(chunk)] = schedIdx
+
+    # kinds that don't come with every chunk size (e.g. there is no plain
+    # 'dynamic') answer with their schedule at the nearest chunk index
+    for kindIdx in range(len(kinds)):
+      valid = np.flatnonzero(grid[kindIdx] >= 0)
+      for chunkIdx in np.flatnonzero(grid[kindIdx] < 0):
+        grid[kindIdx, chunkIdx] = grid[kindIdx, valid[np.argmin(np.abs(valid - chunkIdx))]]
+
+    print('num schedule kinds is:', len(kinds), 'num chunk sizes is:', len(chunks))
+    self.index_to_sched_kind = kinds
+    self.index_to_sched_chunk = chunks
+    self.schedIndex = grid
+
+    return
+
+  # maps the schedule coordinates of a search point (the trailing
+  # schedDims entries) to the lexicographic schedule index
+  def toSchedIndex(self, schedCoords):
+    return self.schedIndex[tuple(schedCoords)]
+
+  # policies is an integer array with one row per point, ordered like
+  # searchDims, returns the (threads, bind, places, schedule) index arrays
+  def toConfigIndices(self, policies):
+    return (policies[:, 0], policies[:, 1], policies[:, 2],
+            self.toSchedIndex(policies[:, 3:].T))
+
+  # the OMP configuration columns of the log for the given config indices
+  def toConfigCols(self, THREADS_IDX, PROC_IDX, PLACES_IDX, SCHED_IDX):
+    return {'OMP_NUM_THREADS':self.threadsArr[THREADS_IDX],
+            'OMP_PROC_BIND':self.procsArr[PROC_IDX],
+            'OMP_PLACES':self.placesArr[PLACES_IDX],
+            'OMP_SCHEDULE':self.schedArr[SCHED_IDX]}
+
+  # single point version of lookupBatch, policy maps each search dimension to its index
+  def lookup(self, policy, cutoff=None):
+    policies = np.array([[policy[name] for name,_ in self.searchDims]])
+    xtimes, resultCols = self.lookupBatch(policies, cutoff)
+    return xtimes[0], {k:v[0] for k,v in resultCols.items()}
+
+
+# the database slice for one (prog, probsize) along with its index maps
+# and dense lookup tensors -- loaded once and shared by every RunManager
+# that simulates runs on the same program and problem size
+class LookupTables(SearchSpace):
+  def __init__(self, database, progname, probsize, schedEncoding='structured'):
+    databaseCSV = ROOT_DIR+'/databases/'+database
+    self.progname = progname
+    self.probsize = probsize
+    self.timeoutSecs = float(progs[progname]['timeout'][probsize])
+
+    # the (prog, probsize) slice comes precompiled into dense tensors (see
+    # databaseArtifacts.py), the first run on a new database CSV compiles them
+    artifact = loadDatabaseArtifact(databaseCSV, progname, probsize)
+    if artifact is None:
+      writeDatabaseArtifacts(pd.read_csv(databaseCSV), databaseCSV)
+      artifact = loadDatabaseArtifact(databaseCSV, progname, probsize)
+    if artifact is None:
+      raise ValueError('No database entries for', progname, probsize, 'in', database)
+
+    planes, meta = artifact
+    axes = meta['axes']
+    super().__init__(axes['OMP_NUM_THREADS'], axes['OMP_PROC_BIND'],
+                     axes['OMP_PLACES'], axes['OMP_SCHEDULE'], schedEncoding)
+
+    # the optimizers hand us integer policies, so the database is laid out
+    # as a dense threads x bind x places x schedule array that each
+    # query can index directly. Missing configurations are NaN
+    self.xtimeTensor = planes['xtime']
+    self.stddevTensor = planes['stddev']
+
+    # censored xtimes are only lower bounds, databases built before runs
+    # were marked censored only have the runs that hit the timeout
+    if 'censored' in planes:
+      self.censoredTensor = planes['censored'] == 1
+    else:
+      self.censoredTensor = self.xtimeTensor >= self.timeoutSecs
+
+    return
+
+  # policies is an integer array with one row per point, ordered like
+  # searchDims, answers come back as arrays instead of one dict per point.
+  # Every xtime past the cutoff (the timeout without one) gets cut off there
+  # like a live run would have been. Censored database entries only tell us
+  # the run took longer than when the sweep killed it, so they answer at the
+  # cutoff too, and a censored column says which xtimes are lower bounds
+  def lookupBatch(self, policies, cutoff=None):
+    configIdxs = self.toConfigIndices(policies)
+
+    xtimes = self.xtimeTensor[configIdxs]
+
+    # NaN means the configuration was never recorded in the database
+    assert(not np.isnan(xtimes).any())
+
+    resultCols = self.toConfigCols(*configIdxs)
+
+    if cutoff is None:
+      cutoff = self.timeoutSecs
+
+    censored = self.censoredTensor[configIdxs] | (xtimes > cutoff)
+    xtimes = np.where(censored, cutoff, xtimes)
+    resultCols['censored'] = censored
+
+    resultCols['xtime'] = xtimes
+
+    return xtimes, resultCols
+
+  def getBestPolicies(self, n=10):
+    # NaN (never recorded) sorts last
+    order = np.argsort(self.xtimeTensor, axis=None, kind='stable')[:n]
+    configIdxs = np.unravel_index(order, self.xtimeTensor.shape)
+    best = pd.DataFrame({'progname':self.progname, 'probsize':self.probsize, **self.toConfigCols(*configIdxs)})
+    best['xtime'] = self.xtimeTensor[configIdxs]
+    best['stddev'] = self.stddevTensor[configIdxs]
+    return best
+
+
+# ProgRunner returns -1 when it couldn't find an xtime in the output,
+# those runs count as (censored) timeouts so the optimizers steer away from them
+def xtimeOrTimeout(result, timeoutSecs, envvars):
+  xtime, censored = result
+  if xtime < 0:
+    print('no xtime found for', envvars, '-- counting it as a timeout')
+    return timeoutSecs, True
+  return xtime, censored
+
+# the CPUs we're allowed to run on, grouped into physical cores per socket:
+# a list of sockets, each a list of cores, each a list of cpus
+def readCoreTopology():
+  sockets = {}
+  for cpu in sorted(os.sched_getaffinity(0)):
+    topoDir = '/sys/devices/system/cpu/cpu'+str(cpu)+'/topology/'
+    try:
+      with open(topoDir+'physical_package_id') as topoFile:
+        socket = int(topoFile.read())
+      with open(topoDir+'core_id') as topoFile:
+        core = int(topoFile.read())
+    except (OSError, ValueError):
+      socket, core = 0, cpu
+    sockets.setdefault(socket, {}).setdefault(core, []).append(cpu)
+
+  return [list(cores.values()) for _,cores in sorted(sockets.items())]
+
+# executed in a forked worker, so the pinning doesn't leak into the tuner
+def runPinned(task):
+  runner, envvars, cpus, cutoff = task
+  os.sched_setaffinity(0, cpus)
+  return runner.runProgCensored(envvars, cutoff)
+
+# Runs the candidates of one generation concurrently on disjoint sets of
+# cores. Candidates are packed first-fit-decreasing by thread count into
+# waves, each candidate gets one physical core (with its hyperthreads) per
+# thread on a single socket, and a wave runs all its candidates at once.
+# Candidates with more threads than a socket has cores run alone with the
+# whole node, just like the exhaustive exploration measured them.
+# Co-runners can still slow each other down through shared caches and
+# memory bandwidth, so the fastest shared candidates get re-timed alone.
+# If any of them got more than interferenceTol faster, none of that
+# generation's shared timings are trusted and they all get re-timed alone.
+class PartitionedEvaluator:
+  def __init__(self, runner, timeoutSecs, numRetimes=2, interferenceTol=0.1):
+    self.runner = runner
+    self.timeoutSecs = timeoutSecs
+    self.numRetimes = numRetimes
+    self.interferenceTol = interferenceTol
+
+    self.sockets = readCoreTopology()
+    self.allCpus = sorted(cpu for cores in self.sockets for core in cores for cpu in core)
+    self.coresPerSocket = min(len(cores) for cores in self.sockets)
+    print('partitioning', len(self.allCpus), 'cpus in', len(self.sockets), 'sockets with', 
+          self.coresPerSocket, 'cores each')
+
+    self.ctx = mp.get_context('fork')
+    return
+
+  # a wave maps a candidate to its cpus, free holds each socket's unused cores
+  def placeInWave(self, wave, idx, numThreads):
+    for free in wave['free']:
+      if len(free) >= numThreads:
+        cores = free[:numThreads]
+        del free[:numThreads]
+        wave['tasks'] += [(idx, [cpu for core in cores for cpu in core])]
+        return True
+    return False
+
+  def planWaves(self, threads):
+    waves = []
+    for idx in np.argsort(-np.asarray(threads), kind='stable'):
+      numThreads = threads[idx]
+
+      if numThreads > self.coresPerSocket:
+        waves += [{'free': [], 'tasks': [(idx, self.allCpus)]}]
+        continue
+
+      if not any(self.placeInWave(wave, idx, numThreads) for wave in waves):
+        wave = {'free': [list(cores) for cores in self.sockets], 'tasks': []}
+        self.placeInWave(wave, idx, numThreads)
+        waves += [wave]
+
+    return waves
+
+  def runTasks(self, tasks, numProcs):
+    with self.ctx.Pool(numProcs) as pool:
+      return pool.map(runPinned, tasks)
+
+  # runs the idxs candidates one at a time with the whole node
+  def runIsolated(self, envvarsList, idxs, cutoff, xtimes, censored):
+    tasks = [(self.runner, dict(envvarsList[idx]), self.allCpus, cutoff) for idx in idxs]
+    for idx,result in zip(idxs, self.runTasks(tasks, 1)):
+      xtimes[idx], censored[idx] = xtimeOrTimeout(result, self.timeoutSecs, envvarsList[idx])
+    return
+
+  # cutoff is the racing cutoff in seconds (None for no cutoff), 
+  # returns the xtimes of the candidates along with which ones got censored
+  def evaluate(self, envvarsList, cutoff=None):
+    threads = [int(envvars['OMP_NUM_THREADS']) for envvars in envvarsList]
+    waves = self.planWaves(threads)
+    print('running', len(envvarsList), 'candidates in', len(waves), 'waves')
+
+    xtimes = np.zeros(len(envvarsList))
+    censored = np.zeros(len(envvarsList), dtype=bool)
+    shared = np.zeros(len(envvarsList), dtype=bool)
+    for wave in waves:
+      tasks = [(self.runner, dict(envvarsList[idx]), cpus, cutoff) for idx,cpus in wave['tasks']]
+      for (idx,_),result in zip(wave['tasks'], self.runTasks(tasks, len(tasks))):
+        xtimes[idx], censored[idx] = xtimeOrTimeout(result, self.timeoutSecs, envvarsList[idx])
+        shared[idx] = len(tasks) > 1
+
+    # interference guard, only the runs that finished can tell us about slowdowns
+    sharedIdxs = np.flatnonzero(shared & ~censored)
+    if len(sharedIdxs) == 0 or self.numRetimes <= 0:
+      return xtimes, censored
+
+    winners = sharedIdxs[np.argsort(xtimes[sharedIdxs], kind='stable')[:self.numRetimes]]
+    sharedXtimes = xtimes[winners]
+    self.runIsolated(envvarsList, winners, cutoff, xtimes, censored)
+    slowdowns = sharedXtimes / xtimes[winners] - 1.0
+    print('slowdown of the best shared candidates vs running alone:', slowdowns)
+
+    if (slowdowns > self.interferenceTol).any():
+      print('shared timings slowed down by more than', self.interferenceTol, '-- re-timing them all alone')
+      rest = np.setdiff1d(np.flatnonzero(shared), winners)
+      self.runIsolated(envvarsList, rest, cutoff, xtimes, censored)
+
+    return xtimes, censored
+
+
+# runs the benchmark itself for every queried point, with the OMP
+# configuration set through the environment -- this lets the optimizers
+# tune programs and inputs that were never exhaustively explored.
+# With concurrent set, the points of one batch share the node (see
+# PartitionedEvaluator) instead of running one after the other
+class LiveBackend(SearchSpace):
+  def __init__(self, progname, probsize, schedEncoding='structured', concurrent=False, 
+               numRetimes=2, interferenceTol=0.1):
+    # ProgRunner lives with the exhaustive exploration scripts. Its own
+    # 'from benchmarks import *' picks up our already imported benchmarks,
+    # so it sees the same progs table that RunManager checks against
+    sys.path.append(ROOT_DIR+'/../exploreHyperparams')
+    from doRunsOnNode import ProgRunner
+
+    # the values the exhaustive exploration sweeps over on this machine
+    envvars = machines[getMachine()]['envvars']
+    super().__init__([int(thrd) for thrd in envvars['OMP_NUM_THREADS']], envvars['OMP_PROC_BIND'],
+                     envvars['OMP_PLACES'], envvars['OMP_SCHEDULE'], schedEncoding)
+
+    self.runner = ProgRunner(progname, probsize)
+    self.timeoutSecs = float(progs[progname]['timeout'][probsize])
+
+    self.evaluator = None
+    if concurrent:
+      self.evaluator = PartitionedEvaluator(self.runner, self.timeoutSecs, numRetimes, interferenceTol)
+
+    return
+
+  # same interface as LookupTables.lookupBatch, the runs get killed at the cutoff
+  def lookupBatch(self, policies, cutoff=None):
+    resultCols = self.toConfigCols(*self.toConfigIndices(policies))
+    envvarsList = [{k:v[idx] for k,v in resultCols.items()} for idx in range(policies.shape[0])]
+
+    if self.evaluator is not None and len(envvarsList) > 1:
+      xtimes, censored = self.evaluator.evaluate(envvarsList, cutoff)
+    else:
+      xtimes = np.zeros(len(envvarsList))
+      censored = np.zeros(len(envvarsList), dtype=bool)
+      for idx,envvars in enumerate(envvarsList):
+        # this is a blocking call
+        result = self.runner.runProgCensored(envvars, cutoff)
+        xtimes[idx], censored[idx] = xtimeOrTimeout(result, self.timeoutSecs, envvars)
+
+    resultCols['xtime'] = xtimes
+    resultCols['censored'] = censored
+    return xtimes, resultCols
+
+  # there is no exhaustive data to compare against
+  def getBestPolicies(self, n=10):
+    return None
@@ -1,31 +1,62 @@
 import time
 import os
+import copy
+import pickle
 import numpy as np
 import random
+import warnings
 import pandas as pd
 from benchmarks import *
-from sko.PSO import PSO
-import cma
-from bayes_opt import BayesianOptimization
-from bayes_opt import UtilityFunction
+
+# sko, cma and bayes_opt (and sklearn under it) get imported by the manager
+# that uses them, so a run only pays the import time of its own optimizer
+
+# a search space is a list of (policy key, number of integer levels) pairs,
+# one per dimension. This is the original space of the current machine, with
+# the schedules indexed in the lexicographic order of their names, managers
+# use it when they aren't handed a search space of their own
+def getLexicographicSearchDims():
+  numPolicies = getNumPolicies()
+  return [(policy, numPolicies[policy]) for policy in ['OMP_NUM_THREADS', 'OMP_PROC_BIND', 'OMP_PLACES', 'OMP_SCHEDULE']]
+
+# inclusive (lower, upper) bounds of each dimension of a search space
+def searchBounds(searchDims):
+  lower = [0]*len(searchDims)
+  upper = [float(numLevels-1) for _,numLevels in searchDims]
+  return lower, upper
 
 class ExplorationLogger:
-  def __init__(self, logfilename, logfiledir, maxSamples, logfileCols=[]):
+  def __init__(self, logfilename, logfiledir, maxSamples, logfileCols=[], flushInterval=25):
 
     self.logfiledir = logfiledir
     self.logfilename = logfilename
     self.maxSamples = maxSamples
 
+    # number of logged points to buffer before appending them to the live logfile
+    self.flushInterval = max(int(flushInterval), 1)
+
     # globalSample and optimXtime are supplied in the resultDict by their respective GO Managers
     self.logfileCols = logfileCols+['OMP_NUM_THREADS', 'OMP_PROC_BIND', 'OMP_PLACES', 
                                     'OMP_SCHEDULE', 'xtime', 'timesSampled', 
                                     'globalSample', 'optimXtime']
 
-    self.log = pd.DataFrame(columns=self.logfileCols)
+    # rows are held in preallocated columnar buffers, columns that
+    # show up later in a resultDict get their own buffer on first use
+    self.capacity = max(int(maxSamples), 1)
+    self.numRows = 0
+    self.buffers = {col:np.full(self.capacity, None, dtype=object) for col in self.logfileCols}
+
+    # maps an OMP config to the row ids it was logged at, so that
+    # counting repeat samples doesn't need to scan the whole log
+    self.configToRows = {}
+
+    # rows [numFlushed, numRows) haven't been appended to the live logfile yet
+    self.numFlushed = 0
+    self.flushedCols = None
 
-    # setup the logilfe path if it doesn't exist 
-    if not os.path.exists(self.logfiledir):
-      os.makedirs(self.logfiledir)
+    # setup the logilfe path if it doesn't exist -- concurrent sweep 
+    # workers can race to create the same directory
+    os.makedirs(self.logfiledir, exist_ok=True)
 
     self.logfilepath = self.logfiledir+'/'+self.logfilename+'.csv'
 
@@ -45,69 +76,216 @@ class ExplorationLogger:
 
     return
 
+  def growBuffers(self):
+    newCapacity = self.capacity*2
+    for col,buf in self.buffers.items():
+      newBuf = np.full(newCapacity, None, dtype=object)
+      newBuf[:self.capacity] = buf
+      self.buffers[col] = newBuf
+    self.capacity = newCapacity
+    return
+
   def logPoint(self, resultDict):
-    # check if we've already logged the point we're going to add
-    finds = self.log.index[(self.log['OMP_NUM_THREADS'] == resultDict['OMP_NUM_THREADS']) & 
-                           (self.log['OMP_PROC_BIND'] == resultDict['OMP_PROC_BIND']) &
-                           (self.log['OMP_PLACES'] == resultDict['OMP_PLACES']) & 
-                           (self.log['OMP_SCHEDULE'] == resultDict['OMP_SCHEDULE'])].tolist()
+    self.logPoints({k:[v] for k,v in resultDict.items()})
+    return
+
+  # resultCols maps each column to an array holding one value per point,
+  # points get logged in order as if logPoint was called on each of them
+  def logPoints(self, resultCols):
+    numPoints = len(resultCols['xtime'])
+
+    while self.numRows + numPoints > self.capacity:
+      self.growBuffers()
 
-    numRepeats = len(finds) + 1
+    start = self.numRows
+    stop = start + numPoints
+    for k,v in resultCols.items():
+      if k not in self.buffers:
+        self.buffers[k] = np.full(self.capacity, None, dtype=object)
+      self.buffers[k][start:stop] = v
 
-    self.log.loc[finds, 'timesSampled'] = numRepeats
+    configs = zip(resultCols['OMP_NUM_THREADS'], resultCols['OMP_PROC_BIND'],
+                  resultCols['OMP_PLACES'], resultCols['OMP_SCHEDULE'])
 
-    # count the number of times this sample was queried
-    resultDict['timesSampled'] = numRepeats
+    for row,config in enumerate(configs, start):
+      # check if we've already logged the point we're going to add
+      finds = self.configToRows.setdefault(config, [])
+      finds.append(row)
 
-    # convert the dict to a pandas-friendly format
-    resultDict = {k:[v] for k,v in resultDict.items()}
-    toAdd = pd.DataFrame.from_dict(resultDict)
+      # count the number of times this sample was queried
+      self.buffers['timesSampled'][finds] = len(finds)
 
-    self.log = pd.concat([self.log, toAdd], sort=True, ignore_index=True)
+    self.numRows = stop
 
-    # write out the CSV file -- need to overwrite the whole file
-    # since multiple elements can get updated at each step
-    self.log.to_csv(self.logfilepath, index=False)
+    if (self.numRows - self.numFlushed) >= self.flushInterval:
+      self.flush()
+    return
+
+  def getLogSlice(self, start, stop):
+    # columns are sorted to match the ordering we've always written out
+    cols = sorted(self.buffers.keys())
+    df = pd.DataFrame({col:self.buffers[col][start:stop] for col in cols})
+    return df.infer_objects()
+
+  @property
+  def log(self):
+    return self.getLogSlice(0, self.numRows)
+
+  def flush(self):
+    # the live logfile is append-only, so the timesSampled of rows already
+    # written is the count at the time they were sampled -- the DONE file
+    # gets the final counts for every row
+    if self.numFlushed == self.numRows:
+      return
+
+    cols = sorted(self.buffers.keys())
+
+    if self.flushedCols != cols:
+      # first write, or a new column showed up -- (re)write the whole file
+      self.getLogSlice(0, self.numRows).to_csv(self.logfilepath, index=False)
+      self.flushedCols = cols
+    else:
+      self.getLogSlice(self.numFlushed, self.numRows).to_csv(self.logfilepath, index=False, 
+                                                             mode='a', header=False)
+
+    self.numFlushed = self.numRows
     return
 
   def getBestFoundPolicies(self, n=10):
     #uniquePts = self.log[self.log['repeatSample'] == 0]
-    return self.log.copy(deep=True).sort_values(by=['xtime', 'globalSample'], ascending=True).iloc[:min(n, self.log.shape[0])]
+    return self.log.sort_values(by=['xtime', 'globalSample'], ascending=True).iloc[:min(n, self.numRows)]
 
   def getOptimizerXtime(self):
-    return self.log['optimXtime'].sum()
+    return self.buffers['optimXtime'][:self.numRows].astype(float).sum()
 
   def getExecutionXtime(self):
-    return self.log['xtime'].sum()
+    return self.buffers['xtime'][:self.numRows].astype(float).sum()
 
   def markLogFileAsComplete(self):
+    self.flush()
     print('Wrote:', self.donelogfilepath)
     self.log.to_csv(self.donelogfilepath, index=False)
     return
 
   def hasReachedMaxSamples(self):
-    return self.log.shape[0] >= self.maxSamples
+    return self.numRows >= self.maxSamples
+
+  # a run resumed from a checkpoint can find rows in its live logfile that
+  # were logged after the checkpoint was taken, rewrite it from the buffers
+  def rewriteLiveLog(self):
+    self.numFlushed = 0
+    self.flushedCols = None
+    self.flush()
+    return
+
+
+# pycma holds on to np.random.randn, which would otherwise get pickled
+# as a bound method of a private copy of the global RandomState -- so
+# after a resume it would stop drawing from the same stream as the rest
+# of the run. The global RandomState is saved by reference instead.
+class CheckpointPickler(pickle.Pickler):
+  def persistent_id(self, obj):
+    if obj is np.random.mtrand._rand:
+      return 'np.random'
+    return None
+
+class CheckpointUnpickler(pickle.Unpickler):
+  def persistent_load(self, pid):
+    if pid == 'np.random':
+      return np.random.mtrand._rand
+    raise pickle.UnpicklingError('Unknown persistent id in checkpoint', pid)
 
 
 class GlobalOptimManager:
 
-  def __init__(self, seed, queryDBFnct, logfilename, logfiledir, maxSamples, logfileCols=[]):
+  def __init__(self, seed, queryDBFnct, logfilename, logfiledir, maxSamples, logfileCols=[], logFlushInterval=25,
+               queryDBBatchFnct=None, searchDims=None):
     self.queryDBFnct = queryDBFnct
+    self.queryDBBatchFnct = queryDBBatchFnct
     self.seed = seed
     self.logfilename = logfilename
     self.logfiledir = logfiledir 
     self.logfileCols = logfileCols
     self.maxSamples = maxSamples
+    self.logFlushInterval = logFlushInterval
+
+    if searchDims is None:
+      searchDims = getLexicographicSearchDims()
+    self.searchDims = list(searchDims)
+    self.dimNames = [name for name,_ in self.searchDims]
 
     # setup the logger and log file
-    self.logger = ExplorationLogger(self.logfilename, self.logfiledir, self.maxSamples, self.logfileCols)
+    self.logger = ExplorationLogger(self.logfilename, self.logfiledir, self.maxSamples, 
+                                    self.logfileCols, self.logFlushInterval)
+
+    # snapshot of the whole manager that a relaunched job resumes from
+    self.checkpointfilepath = self.logfiledir+'/'+self.logfilename+'--CKPT.pkl'
+    return
+
+  # the database query functions belong to the RunManager, they
+  # get left out of checkpoints and rebound when resuming
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    state['queryDBFnct'] = None
+    state['queryDBBatchFnct'] = None
+    return state
+
+  def bindQueryFncts(self, queryDBFnct, queryDBBatchFnct=None):
+    self.queryDBFnct = queryDBFnct
+    self.queryDBBatchFnct = queryDBBatchFnct
+
+    # PSO and CMA query the database through their function wrapper
+    if hasattr(self, 'wrapper'):
+      if isinstance(self.wrapper, BatchFunctionWrapper):
+        self.wrapper.f = queryDBBatchFnct
+      else:
+        self.wrapper.f = queryDBFnct
+    return
+
+  def saveCheckpoint(self):
+    # pycma and sko draw from the global random states, so they
+    # have to be saved for the resumed run to take the same path
+    ckpt = {'manager': self,
+            'npRandomState': np.random.get_state(),
+            'randomState': random.getstate()}
+
+    # write-then-rename so a job killed mid-write keeps its previous checkpoint
+    tmpfilepath = self.checkpointfilepath+'.tmp'
+    with open(tmpfilepath, 'wb') as ckptFile:
+      CheckpointPickler(ckptFile, protocol=pickle.HIGHEST_PROTOCOL).dump(ckpt)
+    os.replace(tmpfilepath, self.checkpointfilepath)
+    return
+
+  def hasCheckpoint(self):
+    return os.path.exists(self.checkpointfilepath)
+
+  # returns the manager saved in our checkpoint, hooked up to our query functions
+  def loadCheckpoint(self):
+    with open(self.checkpointfilepath, 'rb') as ckptFile:
+      ckpt = CheckpointUnpickler(ckptFile).load()
+
+    np.random.set_state(ckpt['npRandomState'])
+    random.setstate(ckpt['randomState'])
+
+    manager = ckpt['manager']
+    manager.bindQueryFncts(self.queryDBFnct, self.queryDBBatchFnct)
+    manager.logger.rewriteLiveLog()
+    return manager
+
+  def removeCheckpoint(self):
+    if self.hasCheckpoint():
+      os.remove(self.checkpointfilepath)
     return
 
 
 # this is going to use the BO Optimizer for runs
 class BOManager(GlobalOptimManager):
   def __init__(self, seed, utilFnct, kappa, xi, kappaDecay, 
-               kappaDecayDelay, queryDBFnct, logfilename, logfiledir, maxSamples):
+               kappaDecayDelay, queryDBFnct, logfilename, logfiledir, maxSamples, logFlushInterval=25,
+               acqMode='continuous', gpRefitEvery=0, gpDriftTol=0.25, searchDims=None):
+
+    from bayes_opt import BayesianOptimization, UtilityFunction
+    from incrementalGP import IncrementalGP
 
     self.utilFnct = utilFnct
     self.kappa = kappa
@@ -116,12 +294,21 @@ class BOManager(GlobalOptimManager):
     self.kappaDecayDelay = kappaDecayDelay
     self.maxSamples = maxSamples
 
-    if self.utilFnct == 'ucb':
-      logfilename += f'-BO-{self.utilFnct}-k{self.kappa}-kd{self.kappaDecay}-kdd{self.kappaDecayDelay}'
-    else:
-      logfilename += f'-BO-{self.utilFnct}-xi{self.xi}'
+    # continuous: bayes_opt maximizes the acquisition over the box and we round
+    # discrete: the acquisition is scored on every grid point, unsampled points win
+    if acqMode not in ['continuous', 'discrete']:
+      raise ValueError('Unknown acquisition mode requested', acqMode)
+    self.acqMode = acqMode
+
+    # 0 refits the GP from scratch on every step (bayes_opt's default),
+    # k > 0 uses incremental updates with a kernel refit every k points
+    self.gpRefitEvery = gpRefitEvery
+    self.gpDriftTol = gpDriftTol
 
-    super().__init__(seed, queryDBFnct, logfilename, logfiledir, maxSamples) 
+    logfilename += '-BO-'+self.nameSuffix()
+
+    super().__init__(seed, queryDBFnct, logfilename, logfiledir, maxSamples, logFlushInterval=logFlushInterval,
+                     searchDims=searchDims) 
 
     # keep track of the global step of the algorithm
     self.globalSample = 0
@@ -130,13 +317,8 @@ class BOManager(GlobalOptimManager):
     np.random.seed(self.seed)
     random.seed(self.seed)
 
-    # Range is inclusive, sub 1 from num_region_policies.
-    pbounds = {
-      'OMP_NUM_THREADS': (0, num_threads_policies - 1),
-      'OMP_PROC_BIND' : (0, num_bind_policies - 1),
-      'OMP_PLACES' : (0, num_places_policies - 1),
-      'OMP_SCHEDULE' : (0, num_region_policies - 1)
-    }
+    # Range is inclusive, sub 1 from the number of levels
+    pbounds = {name:(0, numLevels - 1) for name,numLevels in self.searchDims}
 
     # set up the optimizer
     self.opt = BayesianOptimization(
@@ -153,14 +335,73 @@ class BOManager(GlobalOptimManager):
 
     self.optimXtime = 0
 
+    self.incGP = None
+    if self.gpRefitEvery > 0:
+      self.incGP = IncrementalGP(self.gpRefitEvery, self.gpDriftTol, np.random.RandomState(seed))
+
+    if self.acqMode == 'discrete':
+      # every integer policy, with columns in the (sorted) key order bayes_opt uses
+      self.gridShape = tuple(int(self.opt.space.bounds[idx][1])+1 for idx in range(len(self.opt.space.keys)))
+      self.grid = np.indices(self.gridShape).reshape(len(self.gridShape), -1).T.astype(float)
+      self.gridSampled = np.zeros(self.grid.shape[0], dtype=bool)
+
     return
 
-  def __str__(self):
+  def nameSuffix(self):
     if self.utilFnct == 'ucb':
-      return f'bo-{self.utilFnct}-k{self.kappa}-kd{self.kappaDecay}-kdd{self.kappaDecayDelay}'
+      suffix = f'{self.utilFnct}-k{self.kappa}-kd{self.kappaDecay}-kdd{self.kappaDecayDelay}'
     else:
-      return f'bo-{self.utilFnct}-xi{self.xi}'
+      suffix = f'{self.utilFnct}-xi{self.xi}'
+
+    if self.gpRefitEvery > 0:
+      suffix += f'-gpr{self.gpRefitEvery}'
 
+    if self.acqMode == 'discrete':
+      suffix += '-discrete'
+
+    return suffix
+
+  def __str__(self):
+    return 'bo-'+self.nameSuffix()
+
+  def getFittedGP(self):
+    if self.incGP is not None:
+      # fold in the points registered since the last step
+      for idx in range(len(self.incGP.y), len(self.opt.space)):
+        self.incGP.addPoint(self.opt.space.params[idx], self.opt.space.target[idx])
+      return self.incGP
+
+    gp = self.opt._gp
+    with warnings.catch_warnings():
+      warnings.simplefilter("ignore")
+      gp.fit(self.opt.space.params, self.opt.space.target)
+    return gp
+
+  def suggest(self):
+    # the first point is a random sample, and the default setup 
+    # is left entirely to bayes_opt
+    if len(self.opt.space) == 0 or (self.acqMode == 'continuous' and self.incGP is None):
+      return self.opt.suggest(self.utility)
+
+    gp = self.getFittedGP()
+    y_max = self.opt.space.target.max()
+
+    if self.acqMode == 'continuous':
+      from bayes_opt.util import acq_max
+      suggestion = acq_max(ac=self.utility.utility, gp=gp, y_max=y_max,
+                           bounds=self.opt.space.bounds, 
+                           random_state=self.opt._random_state)
+      return self.opt.space.array_to_params(suggestion)
+
+    # one GP prediction over the whole grid
+    scores = self.utility.utility(self.grid, gp, y_max)
+
+    # only fall back to re-sampling once every point has been sampled
+    if not self.gridSampled.all():
+      scores = np.where(self.gridSampled, -np.inf, scores)
+
+    best = self.grid[np.argmax(scores)]
+    return self.opt.space.array_to_params(best)
 
   def takeNextStep(self):
 
@@ -168,7 +409,7 @@ class BOManager(GlobalOptimManager):
 
     # get the next point
     start = time.time()
-    raw_policy = self.opt.suggest(self.utility)
+    raw_policy = self.suggest()
     self.optimXtime += (time.time() - start)
 
     # suggested point is represented with floating point values
@@ -177,6 +418,10 @@ class BOManager(GlobalOptimManager):
     for k,v in raw_policy.items():
       policy[k] = int(np.round(v))
 
+    if self.acqMode == 'discrete':
+      gridIdx = np.ravel_multi_index([policy[k] for k in self.opt.space.keys], self.gridShape)
+      self.gridSampled[gridIdx] = True
+
     xtime, resultDict = self.queryDBFnct(policy)
 
     resultDict['globalSample'] = self.globalSample
@@ -197,7 +442,7 @@ class BOManager(GlobalOptimManager):
 # of iteration information for logging purposes along
 # with the xtime of the optimizer being used
 class IterativeFunctionWrapper:
-  def __init__(self, f, logger, xtimeHolder):
+  def __init__(self, f, logger, xtimeHolder, dimNames=None):
     self.f = f
     self.logger = logger
     self.iter = 0
@@ -206,16 +451,26 @@ class IterativeFunctionWrapper:
     self.globalSample = 0
     self.xtimeHolder = xtimeHolder
 
+    if dimNames is None:
+      dimNames = [name for name,_ in getLexicographicSearchDims()]
+    self.dimNames = dimNames
+
   def setPop(self, pop):
     self.pop = pop
 
+  # f is a query function of the RunManager, the manager rebinds it on resume
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    state['f'] = None
+    return state
+
   def __call__(self, x):
 
-    # x is a simple array of shape (4,)
+    # x is a simple array with one entry per search dimension
     # we preprocess the input array here to pass to the database function
     x = np.round(x).astype(int)
 
-    x_dict = {'OMP_NUM_THREADS':x[0], 'OMP_PROC_BIND':x[1], 'OMP_PLACES':x[2], 'OMP_SCHEDULE':x[3]}
+    x_dict = dict(zip(self.dimNames, x))
     xtime, resultDict = self.f(x_dict)
 
     resultDict['globalSample'] = int(self.globalSample)
@@ -238,9 +493,48 @@ class IterativeFunctionWrapper:
 
 
 
+# batch-aware version of the wrapper above, x holds a whole population
+# (one point per row) that gets rounded, queried, and logged at once
+class BatchFunctionWrapper(IterativeFunctionWrapper):
+
+  def __call__(self, x):
+
+    x = np.round(np.atleast_2d(x)).astype(int)
+
+    # the query can return fewer points than asked for 
+    # if the sample budget runs out part-way through
+    xtimes, resultCols = self.f(x)
+    numPoints = len(xtimes)
+
+    # each point gets the same bookkeeping it would have gotten
+    # from being evaluated one at a time
+    offsets = self.sample + np.arange(numPoints)
+    resultCols['globalSample'] = self.globalSample + np.arange(numPoints)
+    resultCols['iter'] = self.iter + offsets // self.pop
+    resultCols['sample'] = offsets % self.pop
+
+    # calculate the xtime per sample, assumed the same for each sample in one iteration
+    resultCols['optimXtime'] = np.full(numPoints, self.xtimeHolder.optimXtime / self.pop)
+
+    self.logger.logPoints(resultCols)
+
+    self.globalSample += numPoints
+    self.iter += (self.sample + numPoints) // self.pop
+    self.sample = (self.sample + numPoints) % self.pop
+
+    if numPoints < x.shape[0]:
+      raise StopIteration('Reached max samples to take! -- Stopping execution')
+
+    return xtimes
+
+
 class PSOManager(GlobalOptimManager):
 
-  def __init__(self, seed, population, w, c1, c2, queryDBFnct, logfilename, logfiledir, maxSamples):
+  def __init__(self, seed, population, w, c1, c2, queryDBFnct, logfilename, logfiledir, maxSamples, logFlushInterval=25,
+               queryDBBatchFnct=None, searchDims=None):
+
+    from sko.PSO import PSO
+    from sko.tools import set_run_mode
 
     # These are the extra columns we're going to be printing to the logfile
     logfileCols = ['iter', 'sample']
@@ -252,24 +546,28 @@ class PSOManager(GlobalOptimManager):
     self.optimXtime = 0
     self.maxSamples = maxSamples
 
-    logfilename = logfilename+f'-PSO-pop{self.pop}-w{self.w}-c1{self.c1}-c2{self.c2}'
+    logfilename = logfilename+PSOManager.logSuffix(self.pop, self.w, self.c1, self.c2)
 
-    super().__init__(seed, queryDBFnct, logfilename, logfiledir, maxSamples, logfileCols) 
+    super().__init__(seed, queryDBFnct, logfilename, logfiledir, maxSamples, logfileCols, logFlushInterval,
+                     queryDBBatchFnct, searchDims) 
 
     # set the global random state seed
     np.random.seed(self.seed)
     random.seed(self.seed)
 
-    self.lower = [0]*4
-    self.upper = [float(num_threads_policies-1), float(num_bind_policies-1), 
-                  float(num_places_policies-1), float(num_region_policies-1)]
+    self.lower, self.upper = searchBounds(self.searchDims)
 
-    self.wrapper = IterativeFunctionWrapper(self.queryDBFnct, self.logger, self)
+    if self.queryDBBatchFnct is not None:
+      self.wrapper = BatchFunctionWrapper(self.queryDBBatchFnct, self.logger, self)
+      # sko only hands the whole swarm to functions marked as vectorized
+      set_run_mode(self.wrapper, 'vectorization')
+    else:
+      self.wrapper = IterativeFunctionWrapper(self.queryDBFnct, self.logger, self, self.dimNames)
 
     self.wrapper.setPop(self.pop)
 
     self.pso = PSO(func=self.wrapper, 
-                   n_dim=4, pop=self.pop, lb=self.lower, ub=self.upper, 
+                   n_dim=len(self.searchDims), pop=self.pop, lb=self.lower, ub=self.upper, 
                    w=self.w, c1=self.c1, c2=self.c2)
 
     return
@@ -277,6 +575,23 @@ class PSOManager(GlobalOptimManager):
   def __str__(self):
     return f'pso-pop{self.pop}-w{self.w}-c1{self.c1}-c2{self.c2}'
 
+  # sko wraps non-vectorized functions in a closure, which can't be pickled
+  def __getstate__(self):
+    state = super().__getstate__()
+    state['pso'] = copy.copy(self.pso)
+    state['pso'].func = None
+    return state
+
+  def bindQueryFncts(self, queryDBFnct, queryDBBatchFnct=None):
+    from sko.tools import func_transformer
+    super().bindQueryFncts(queryDBFnct, queryDBBatchFnct)
+    self.pso.func = func_transformer(self.wrapper)
+    return
+
+  @staticmethod
+  def logSuffix(population, w, c1, c2):
+    return f'-PSO-pop{population}-w{w}-c1{c1}-c2{c2}'
+
   def takeNextStep(self):
     # the following code is equivalent to calling this commented line
     # below, but we added timing instrumentation
@@ -321,7 +636,8 @@ class PSOManager(GlobalOptimManager):
 
 class CMAManager(GlobalOptimManager):
 
-  def __init__(self, seed, sigma, popsize, popsize_factor, queryDBFnct, logfilename, logfiledir, maxSamples):
+  def __init__(self, seed, sigma, popsize, popsize_factor, queryDBFnct, logfilename, logfiledir, maxSamples, logFlushInterval=25,
+               queryDBBatchFnct=None, searchDims=None):
 
     # These are the extra columns we're going to be printing to the logfile
     self.sigma = sigma
@@ -330,32 +646,21 @@ class CMAManager(GlobalOptimManager):
     self.optimXtime = 0
     self.maxSamples = maxSamples
 
-    logfilename = logfilename+f'-CMA-sigma{self.sigma}-pop{self.popsize}-popdecay{self.popsize_factor}'
+    logfilename = logfilename+CMAManager.logSuffix(self.sigma, self.popsize, self.popsize_factor)
 
-    super().__init__(seed, queryDBFnct, logfilename, logfiledir, maxSamples) 
+    super().__init__(seed, queryDBFnct, logfilename, logfiledir, maxSamples, logFlushInterval=logFlushInterval,
+                     queryDBBatchFnct=queryDBBatchFnct, searchDims=searchDims) 
 
     # set the global random state seed
     np.random.seed(self.seed)
     random.seed(self.seed)
 
-    self.lower = [0]*4
-    self.upper = [float(num_threads_policies-1), float(num_bind_policies-1), 
-                  float(num_places_policies-1), float(num_region_policies-1)]
-    pbounds = [ self.lower, self.upper ]
-    x0 = [0]*4
-
-    self.wrapper = IterativeFunctionWrapper(self.queryDBFnct, self.logger, self)
-
-    esOpts = {
-              'integer_variables' : list(range(len(x0))),
-              'bounds' : pbounds,
-              'maxiter' : 100,
-              'seed': self.seed,
-              'popsize': self.popsize,
-              'popsize_factor': self.popsize_factor,
-             }
+    if self.queryDBBatchFnct is not None:
+      self.wrapper = BatchFunctionWrapper(self.queryDBBatchFnct, self.logger, self)
+    else:
+      self.wrapper = IterativeFunctionWrapper(self.queryDBFnct, self.logger, self, self.dimNames)
 
-    self.es = cma.CMAEvolutionStrategy(x0, self.sigma, esOpts)
+    self.es = CMAManager.makeES(self.seed, self.sigma, self.popsize, self.popsize_factor, self.searchDims)
 
     # use this to print options for future extra hyperparameters
     # self.es.opts.pprint()
@@ -365,6 +670,30 @@ class CMAManager(GlobalOptimManager):
   def __str__(self):
     return f'-CMA-sigma{self.sigma}-pop{self.popsize}-popdecay{self.popsize_factor}'
 
+  @staticmethod
+  def logSuffix(sigma, popsize, popsize_factor):
+    return f'-CMA-sigma{sigma}-pop{popsize}-popdecay{popsize_factor}'
+
+  @staticmethod
+  def makeES(seed, sigma, popsize, popsize_factor, searchDims=None):
+    import cma
+    if searchDims is None:
+      searchDims = getLexicographicSearchDims()
+    lower, upper = searchBounds(searchDims)
+    pbounds = [ lower, upper ]
+    x0 = [0]*len(searchDims)
+
+    esOpts = {
+              'integer_variables' : list(range(len(x0))),
+              'bounds' : pbounds,
+              'maxiter' : 100,
+              'seed': seed,
+              'popsize': popsize,
+              'popsize_factor': popsize_factor,
+             }
+
+    return cma.CMAEvolutionStrategy(x0, sigma, esOpts)
+
   def takeNextStep(self):
 
     # CMA offers an ask-and-tell interface
@@ -385,7 +714,10 @@ class CMAManager(GlobalOptimManager):
       # over time
       self.wrapper.setPop(len(candidates))
 
-      evaluations = [self.wrapper(point) for point in candidates]
+      if self.queryDBBatchFnct is not None:
+        evaluations = list(self.wrapper(np.array(candidates)))
+      else:
+        evaluations = [self.wrapper(point) for point in candidates]
       self.es.tell(candidates, evaluations)
     else:
       print('CMA stopped itself')
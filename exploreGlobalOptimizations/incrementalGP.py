@@ -0,0 +1,135 @@
+import numpy as np
+import warnings
+from scipy.linalg import cho_solve, solve_triangular
+from sklearn.gaussian_process import GaussianProcessRegressor
+from sklearn.gaussian_process.kernels import Matern
+
+# A GP that keeps its Cholesky factor around between samples. New points
+# are folded in with a rank-one (bordered) update of the factor, which is
+# O(n^2) instead of the O(n^3) refactorization plus kernel hyperparameter
+# search that bayes_opt does on every suggest. The kernel hyperparameters
+# are only refit every refitEvery points, or sooner when the per-point log
+# marginal likelihood drifts more than driftTol below where it was at the
+# last refit.
+# It uses the same GP setup as bayes_opt and has the predict() interface
+# its UtilityFunction expects, so it can stand in for bayes_opt's GP.
+class IncrementalGP:
+
+  def __init__(self, refitEvery, driftTol=0.25, random_state=None):
+    self.refitEvery = refitEvery
+    self.driftTol = driftTol
+    self.random_state = random_state
+
+    self.X = np.empty((0, 0))
+    self.y = np.empty(0)
+
+    self.kernel_ = None
+    self.L = None
+    self.numSinceRefit = 0
+    self.lmlAtRefit = None
+    self.numRefits = 0
+
+    return
+
+  def makeRegressor(self):
+    # same settings as the GP inside bayes_opt's BayesianOptimization
+    return GaussianProcessRegressor(
+            kernel=Matern(nu=2.5),
+            alpha=1e-6,
+            normalize_y=True,
+            n_restarts_optimizer=5,
+            random_state=self.random_state,
+    )
+
+  def refit(self):
+    gp = self.makeRegressor()
+    with warnings.catch_warnings():
+      warnings.simplefilter("ignore")
+      gp.fit(self.X, self.y)
+
+    self.kernel_ = gp.kernel_
+    self.alphaNoise = gp.alpha
+    self.L = gp.L_
+    self.updateAlpha()
+
+    self.numSinceRefit = 0
+    self.lmlAtRefit = self.logMarginalLikelihood() / len(self.y)
+    self.numRefits += 1
+    return
+
+  def updateAlpha(self):
+    # targets are normalized the same way sklearn does with normalize_y
+    self.y_mean = np.mean(self.y)
+    self.y_std = np.std(self.y)
+    if self.y_std == 0:
+      self.y_std = 1.0
+
+    self.yNorm = (self.y - self.y_mean) / self.y_std
+    self.alpha_ = cho_solve((self.L, True), self.yNorm, check_finite=False)
+    return
+
+  def logMarginalLikelihood(self):
+    return (-0.5 * self.yNorm.dot(self.alpha_)
+            - np.log(np.diag(self.L)).sum()
+            - 0.5 * len(self.y) * np.log(2 * np.pi))
+
+  def choleskyAppend(self, x):
+    # bordered update: [[L, 0], [l^T, d]] factors the kernel matrix grown by x
+    k = self.kernel_(self.X[:-1], x.reshape(1, -1)).ravel()
+    kxx = self.kernel_.diag(x.reshape(1, -1))[0] + self.alphaNoise
+
+    l = solve_triangular(self.L, k, lower=True, check_finite=False)
+    d2 = kxx - l.dot(l)
+
+    # lost positive definiteness (e.g. a duplicate point), refactor from scratch
+    if d2 <= 1e-12:
+      return False
+
+    n = self.L.shape[0]
+    L = np.zeros((n+1, n+1))
+    L[:n, :n] = self.L
+    L[n, :n] = l
+    L[n, n] = np.sqrt(d2)
+    self.L = L
+    return True
+
+  def addPoint(self, x, y):
+    x = np.asarray(x, dtype=float).ravel()
+
+    if len(self.y) == 0:
+      self.X = x.reshape(1, -1)
+    else:
+      self.X = np.vstack([self.X, x])
+    self.y = np.append(self.y, y)
+
+    self.numSinceRefit += 1
+
+    if self.kernel_ is None or self.numSinceRefit >= self.refitEvery:
+      self.refit()
+      return
+
+    if not self.choleskyAppend(x):
+      self.refit()
+      return
+
+    self.updateAlpha()
+
+    # the data moved away from what the kernel was fit to
+    if (self.lmlAtRefit - self.logMarginalLikelihood() / len(self.y)) > self.driftTol:
+      self.refit()
+
+    return
+
+  def predict(self, X, return_std=False):
+    X = np.atleast_2d(X)
+    K_trans = self.kernel_(X, self.X)
+    mean = K_trans.dot(self.alpha_) * self.y_std + self.y_mean
+
+    if not return_std:
+      return mean
+
+    v = solve_triangular(self.L, K_trans.T, lower=True, check_finite=False)
+    var = self.kernel_.diag(X) - np.einsum('ij,ij->j', v, v)
+    var = np.maximum(var, 0.0)
+
+    return mean, np.sqrt(var) * self.y_std
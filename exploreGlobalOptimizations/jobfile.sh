@@ -1,11 +1,23 @@
 #!/bin/bash
 
-module load $MOD_LOAD_PYTHON
+# the local job system has no modules to load
+if [[ -n $MOD_LOAD_PYTHON ]]; then
+	module load $MOD_LOAD_PYTHON
+fi
 cd $PYTHON_SCRIPT_EXEC_DIR
 echo "Starting execution"
 pwd
 python3 --version
 
+# job array tasks look up their work file in the manifest, and
+# relaunch just their own index of the array
+if [[ -z $TODO_WORK_FILE && -n $WORK_MANIFEST ]]; then
+	ARRAY_INDEX=${!ARRAY_INDEX_VAR}
+	TODO_WORK_FILE=$(sed -n "${ARRAY_INDEX}p" $WORK_MANIFEST)
+	PROPAGATE_CMD=${PROPAGATE_CMD//@ARRAY_INDEX@/$ARRAY_INDEX}
+	echo "array task $ARRAY_INDEX of manifest $WORK_MANIFEST"
+fi
+
 if [[ -z $TODO_WORK_FILE ]]; then
  echo "no work file specified, terminating"
  exit 1
@@ -23,5 +35,6 @@ else
 	# all the envvars will live on to the next run
 	echo "still more work to do, relaunching"
 	echo "executing command [$PROPAGATE_CMD]"
-	$PROPAGATE_CMD
+	# the launcher shell-quotes its arguments (e.g. lsf's gosweep[N] job name)
+	eval "$PROPAGATE_CMD"
 fi
\ No newline at end of file
@@ -13,11 +13,13 @@ from itertools import product
 from pathlib import Path
 
 MAX_ITERATIONS=0
-if MACHINE == 'lassen':
+if currMachine == 'lassen':
     MAX_ITERATIONS = 300 #1188//4
-elif MACHINE == 'ruby':
+elif currMachine == 'ruby':
     # stop exploration after 330 samples (a quarter of the exploration space)
     MAX_ITERATIONS = 300 #1320//4
+else:
+    MAX_ITERATIONS = 300
 
 seeds = [1337, 3827, 9999, 4873]
 
@@ -40,11 +42,15 @@ paramsToSweep = {
         'c1': np.round(np.linspace(0.1, 1.5, 5, endpoint=True), ROUND_PREC),
         'c2': np.round(np.linspace(0.1, 1.5, 5, endpoint=True), ROUND_PREC),
     },
+    # gp_refit_every of 0 refits the GP from scratch every step, k > 0 does
+    # incremental GP updates with a kernel refit every k samples
     'bo-ei':{
         'xi': np.round(np.linspace(0.0, 5.0, 15, endpoint=True), ROUND_PREC),
+        'gp_refit_every': np.array([0, 5, 20]),
     },
     'bo-poi':{
         'xi': np.round(np.linspace(0.0, 5.0, 15, endpoint=True), ROUND_PREC),
+        'gp_refit_every': np.array([0, 5, 20]),
     },
     # drop kappa_decay and kappa_decay_delay by fixing them to their defaults
     'bo-ucb':{
@@ -53,17 +59,32 @@ paramsToSweep = {
         'kappa_decay': np.round(np.linspace(1.0, 1.0, 1, endpoint=True), ROUND_PREC),
         #'kappa_decay_delay': np.linspace(1,50, 20, endpoint=True).astype(int),
         'kappa_decay_delay': np.linspace(0, 0, 1, endpoint=True).astype(int),
+        'gp_refit_every': np.array([0, 5, 20]),
     },
 }
 
-def writeTodoFiles(progname, probsize, seed, goMethod, combos, numExecsPerFile, basefilepath):
-    basecommand = f'python3 -u simulateGlobalOptimRunOnNode.py --progname={progname} --probsize={probsize} --seed={seed} --maxSteps={MAX_ITERATIONS}'
+def genRunArgs(progname, probsize, seed, goMethod, combo, maxSteps=MAX_ITERATIONS):
+    '''
+        Build the simulateGlobalOptimRunOnNode.py arguments for one
+        hyperparameter combo. Used both for the lines of the todo files
+        and by the sweep engine, so that both produce the same logfile names.
+    '''
+    runArgs = [f'--progname={progname}', f'--probsize={probsize}', 
+               f'--seed={seed}', f'--maxSteps={maxSteps}']
 
     if 'bo' in goMethod:
         utilFnct = goMethod.split('-')[1]
-        basecommand += f' --optim=bo --utilFnct={utilFnct}'
+        runArgs += ['--optim=bo', f'--utilFnct={utilFnct}']
     else:
-        basecommand += f' --optim={goMethod}'
+        runArgs += [f'--optim={goMethod}']
+
+    for argname,arg in combo.items():
+        runArgs += [f'--{argname}={arg}']
+
+    return runArgs
+
+def writeTodoFiles(progname, probsize, seed, goMethod, combos, numExecsPerFile, basefilepath, database):
+    basecommand = 'python3 -u simulateGlobalOptimRunOnNode.py'
 
     # combos is assumed to be a list of dicts containing 
     # pytohn args that we will write to the todo file
@@ -86,9 +107,8 @@ def writeTodoFiles(progname, probsize, seed, goMethod, combos, numExecsPerFile,
         shfile.write('#!/bin/bash\n\n')
 
         for combo in combos[currIdx:stopIdx]:
-            command = basecommand
-            for argname,arg in combo.items():
-                command += f' --{argname}={arg}'
+            command = basecommand+' '+' '.join(genRunArgs(progname, probsize, seed, goMethod, combo))
+            command += ' --database='+shlex.quote(database)
 
             shfile.write(command+'\n')
 
@@ -99,6 +119,25 @@ def writeTodoFiles(progname, probsize, seed, goMethod, combos, numExecsPerFile,
     
     return writtenFiles
 
+def writeSweepTodoFile(progname, probsize, seed, goMethod, basefilepath, database):
+    '''
+        Write a todo file that runs every combo of this 
+        (progname, probsize, seed, goMethod) with the sweep engine
+        in one process pool, instead of one python3 call per combo.
+    '''
+    command = (f'python3 -u sweepSimulatedRuns.py --progname={progname} --probsize={probsize} '
+               f'--seed={seed} --method={goMethod} --database={shlex.quote(database)}')
+
+    outfilename = basefilepath+'/'+f'{progname}-{probsize}-{seed}-{goMethod}-sweep.sh'
+
+    shfile = open(outfilename, 'w')
+    shfile.write('#!/bin/bash\n\n')
+    shfile.write(command+'\n')
+    shfile.write(f'exit {CLEAN_FINISH_EXIT_CODE}\n')
+    shfile.close()
+
+    return [outfilename]
+
 def genSweepCombos(goMethod):
     method = paramsToSweep[goMethod]
     combos = []
@@ -119,7 +158,7 @@ def genSweepCombos(goMethod):
     
     return toRet
 
-def genJobs(goMethod, maxExecsPerJob):
+def genJobs(goMethod, maxExecsPerJob, database, useSweepEngine=False):
     '''
         Create files in /logs/todoFiles that simply have all the python
         commands for a job to run.
@@ -129,6 +168,9 @@ def genJobs(goMethod, maxExecsPerJob):
         completion.
         The work is considered finished when the exit code of 111 is returned by
         the todo.sh script
+        With useSweepEngine, each job instead runs all the combos of its
+        GOmethod+seed+progname+probsize through sweepSimulatedRuns.py
+        Every run replays the given database (a file in databases/)
     '''
     jobfileBasePath = ROOT_DIR+'/logs/todoFiles'
 
@@ -139,7 +181,7 @@ def genJobs(goMethod, maxExecsPerJob):
     prognames = list(progs.keys())
     probsizes = ['smlprob', 'medprob', 'lrgprob']
 
-    modloadPy =  machines[MACHINE]['pythonToModLoad']
+    modloadPy =  machines[getMachine()]['pythonToModLoad']
 
     # write/generate all the job files
     jobFiles = []
@@ -151,28 +193,70 @@ def genJobs(goMethod, maxExecsPerJob):
     for seed in seeds:
         for progname in prognames:
             for probsize in probsizes:
-                files = writeTodoFiles(progname, probsize, seed, goMethod, 
-                                       combos, maxExecsPerJob, jobfileBasePath)
+                if useSweepEngine:
+                    files = writeSweepTodoFile(progname, probsize, seed, goMethod, jobfileBasePath, database)
+                else:
+                    files = writeTodoFiles(progname, probsize, seed, goMethod, 
+                                           combos, maxExecsPerJob, jobfileBasePath, database)
                 jobFiles += files
 
     print(goMethod, 'num job files', len(jobFiles))
     return jobFiles
 
 
-def launchJobs(jobsArr, nodeRuntime, useDebugNodes=False):
+def writeManifests(jobsArr, maxArraySize):
+    '''
+        Split the job files into manifests of at most maxArraySize
+        files, one file path per line. Line i of a manifest is the 
+        work file of task i of its job array.
+        Returns a list of (manifestPath, numTasks)
+    '''
+    manifestBasePath = ROOT_DIR+'/logs/manifests'
+
+    # setup the manifest path if it doesn't exist 
+    if not os.path.exists(manifestBasePath):
+        os.makedirs(manifestBasePath)
+
+    timestamp = int(time.time())
+
+    manifests = []
+    for idx,start in enumerate(range(0, len(jobsArr), maxArraySize)):
+        tasks = jobsArr[start:start+maxArraySize]
+        manifestPath = manifestBasePath+f'/manifest-{timestamp}-{idx+1}.txt'
+        with open(manifestPath, 'w') as manifest:
+            manifest.write('\n'.join(tasks)+'\n')
+        manifests += [(manifestPath, len(tasks))]
+
+    print('wrote', len(manifests), 'manifests to', manifestBasePath)
+    return manifests
+
+
+def formatArrayOption(jobSys, indices):
+    '''
+        The job array option of jobSys for the given indices, shell
+        quoted: the brackets of LSF's gosweep[1-N] job name would
+        otherwise glob.
+    '''
+    return ' '.join(shlex.quote(arg) for arg in shlex.split(jobSys['array'].format(indices)))+' '
+
+
+def launchJobs(jobsArr, nodeRuntime, useDebugNodes=False, jobSystem=None, localSlots=None, dryRun=False):
     '''
-        This will make multiple sbatch script invocations.
+        This will make one sbatch/bsub job array invocation per
+        manifest of job files (see writeManifests), instead of one
+        invocation per job file.
         We assume that the jobsArr is a list of filenames 
         for the jobfile to execute with.
         nodeRuntime is assumed to be in minutes (at least 3 minutes)
+        With the local job system the jobs instead run in a process pool
+        of localSlots (default: one per cpu) on this machine.
+        With dryRun we only write the manifests and print the commands.
     '''
-    jobSys = machines[MACHINE]['jobsystem']
-    jobRunner = jobSys['runner']
-    jobNodetime = jobSys['nodetime']
-    jobOutput = jobSys['output']
-    jobDebug = jobSys['debug']
+    jobSys = machines[getMachine()]['jobsystem']
+    if jobSystem is None:
+        jobSystem = jobSys['runner']
 
-    modloadPy =  machines[MACHINE]['pythonToModLoad']
+    modloadPy =  machines[getMachine()]['pythonToModLoad']
 
     runLogsBasePath = ROOT_DIR+'/logs/runLogs'
 
@@ -188,31 +272,37 @@ def launchJobs(jobsArr, nodeRuntime, useDebugNodes=False):
                    'XTIME_LIMIT':str(nodeRuntime-3),
                    'CLEAN_FINISH_EXIT_CODE':str(CLEAN_FINISH_EXIT_CODE)}
 
-    for idx,filename in enumerate(jobsArr):
-        vars_to_use = {**os.environ.copy(), **baseenvvars}
-        vars_to_use['TODO_WORK_FILE'] = filename
+    if jobSystem == 'local':
+        launchLocalJobs(jobsArr, nodeRuntime, baseenvvars, runLogsBasePath, localSlots, dryRun)
+        return
 
-        plainname = Path(filename).stem
-        jobOutputLogName = f'{plainname}.out'
+    manifests = writeManifests(jobsArr, jobSys['maxArraySize'])
 
-        # truncate for bsub restruction of 255 chars in outfile name
-        if len(jobOutputLogName) > 251:
-            jobOutputLogName = jobOutputLogName[:251]
+    for manifestPath, numTasks in manifests:
+        vars_to_use = {**os.environ.copy(), **baseenvvars}
+        vars_to_use['WORK_MANIFEST'] = manifestPath
+        vars_to_use['ARRAY_INDEX_VAR'] = jobSys['arrayIndex']
 
-        jobOutputLog = runLogsBasePath+'/'+jobOutputLogName
+        # one log per task, named after the manifest and the task's index
+        jobOutputLog = runLogsBasePath+'/'+Path(manifestPath).stem+'-'+jobSys['arrayLogIndex']+'.out'
 
         # prepare the command to execute
-        command = jobRunner+jobNodetime+str(nodeRuntime)+' '+jobOutput+jobOutputLog+' '
+        command = jobSys['runner']+jobSys['nodetime']+str(nodeRuntime)+' '+jobSys['output']+shlex.quote(jobOutputLog)+' '
 
         if useDebugNodes:
-            command += jobDebug
+            command += jobSys['debug']
+
+        # a task that hits the xtime cap re-executes this command as a
+        # one-task array of its own index, jobfile.sh fills in the index
+        # and evals it so the quoting holds
+        vars_to_use['PROPAGATE_CMD'] = command+formatArrayOption(jobSys, '@ARRAY_INDEX@')+'jobfile.sh'
 
-        command += 'jobfile.sh'
+        command += formatArrayOption(jobSys, f'1-{numTasks}')+'jobfile.sh'
 
-        print('executing command:', command, '\nworkfile', plainname) #'\nwith envvars', vars_to_use)
+        print('executing command:', command, '\nmanifest', manifestPath, 'with', numTasks, 'tasks')
 
-        # re-execute this command if the xtime cap gets hit
-        vars_to_use['PROPAGATE_CMD'] = command
+        if dryRun:
+            continue
 
         result = subprocess.run(command, shell=True, text=True, check=True, 
                                 env=vars_to_use, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
@@ -225,6 +315,39 @@ def launchJobs(jobsArr, nodeRuntime, useDebugNodes=False):
     return
 
 
+def launchLocalJobs(jobsArr, nodeRuntime, baseenvvars, runLogsBasePath, localSlots=None, dryRun=False):
+    '''
+        Run each job file as its own job in a local process pool.
+    '''
+    # the local job system lives with the exhaustive exploration scripts
+    sys.path.append(ROOT_DIR+'/../exploreHyperparams')
+    from localJobSystem import LocalJobPool
+    localPool = LocalJobPool(localSlots if localSlots is not None else os.cpu_count())
+
+    for idx,filename in enumerate(jobsArr):
+        vars_to_use = {**os.environ.copy(), **baseenvvars}
+        vars_to_use['TODO_WORK_FILE'] = filename
+
+        plainname = Path(filename).stem
+        jobOutputLogName = f'{plainname}.out'
+
+        # truncate for bsub restruction of 255 chars in outfile name
+        if len(jobOutputLogName) > 251:
+            jobOutputLogName = jobOutputLogName[:251]
+
+        jobOutputLog = runLogsBasePath+'/'+jobOutputLogName
+
+        localPool.submit('jobfile.sh', vars_to_use, jobOutputLog, nodeRuntime, ROOT_DIR)
+
+    if dryRun:
+        writeManifests(jobsArr, max(len(jobsArr), 1))
+        print('would run', len(jobsArr), 'jobs on', localPool.numSlots, 'local slots')
+        return
+
+    localPool.run()
+    return
+
+
 # Defining main function
 def main():
     parser = argparse.ArgumentParser(description='Global Optimization Hyperparam Space Exploration Launcher')
@@ -232,19 +355,31 @@ def main():
     parser.add_argument('--useDebugNodes', help='Should we use debug nodes for testing launches?', default=False, type=bool)
     parser.add_argument('--nodeRuntime', help='How long for each node to run in MINUTES format', required=False, type=int, default=360)
     parser.add_argument('--execsPerJob', help='Max number of executions to perform per job', required=False, type=int, default=625)
+    parser.add_argument('--useSweepEngine', help='Run all combos of a job in one process pool with sweepSimulatedRuns.py', action='store_true')
+    parser.add_argument('--jobSystem', help='Submit with the machine\'s job system, or run the jobs in a process pool on this machine (local)', 
+                        required=False, type=str, default=None, choices=['local'])
+    parser.add_argument('--localSlots', help='Num jobs the local job system runs at once, defaults to the num of cpus', required=False, type=int, default=None)
+    parser.add_argument('--dryRun', help='Only write the job array manifests and print the launch commands', action='store_true')
+    parser.add_argument('--database', help='Database file in databases/ the runs replay, defaults to the one of this machine', 
+                        required=False, type=str, default=None)
     
     args = parser.parse_args()
+    if args.database is None:
+        args.database = getDefaultDatabase()
     print('Got input args:', args)
 
+    if not os.path.exists(ROOT_DIR+'/databases/'+args.database):
+        raise ValueError('No such database in '+ROOT_DIR+'/databases', args.database)
+
     goMethods = list(paramsToSweep.keys())
     
     jobsToLaunch = []
     for method in goMethods:
-        jobsToLaunch += genJobs(method, args.execsPerJob)
+        jobsToLaunch += genJobs(method, args.execsPerJob, args.database, args.useSweepEngine)
 
     print('')
     print('launching', len(jobsToLaunch), 'jobs')
-    launchJobs(jobsToLaunch, args.nodeRuntime, args.useDebugNodes)
+    launchJobs(jobsToLaunch, args.nodeRuntime, args.useDebugNodes, args.jobSystem, args.localSlots, args.dryRun)
     return
   
 if __name__=="__main__":
@@ -5,19 +5,44 @@
 # search to return execution times. This simulated execution approach allows
 # us to more quickly sweep over the optimizer hyperparameters to find good
 # search settings.
+# With --backend=live the same optimizers instead run the program itself
+# for every sample, to tune programs and inputs that were never explored.
 
 from benchmarks import *
 from globalOptimizers import *
+from evalBackends import *
 import subprocess
 import os
 import csv
 import re
 import sys
 import argparse
+import numpy as np
 import pandas as pd
 
+# base logfile name and directory of a run, the optimizer managers
+# append their hyperparameters to the name
+def getLogNames(progname, probsize, optim, seed, maxSteps, schedEncoding='lexicographic', backend='database',
+                cutoffFactor=0.0, censoredPenalty=2.0):
+  logfilename = progname+'-'+probsize+'-seed'+str(seed)+'-maxSteps'+str(maxSteps)
+
+  # runs on the original lexicographic schedule axis keep their old names
+  if schedEncoding == 'structured':
+    logfilename += '-kindchunk'
+
+  if cutoffFactor > 0:
+    logfilename += '-cutoff'+str(cutoffFactor)+'-par'+str(censoredPenalty)
+
+  # runs of the real programs are kept apart from the simulated ones
+  logsdir = '/logs/' if backend == 'database' else '/liveLogs/'
+
+  loggingdir = ROOT_DIR+logsdir+progname+'-'+probsize+'/'+optim+'-'+str(seed)
+  return logfilename, loggingdir
+
 class RunManager:
-  def __init__(self, args):
+  # backend answers the optimizers' queries (see evalBackends.py), the sweep
+  # engine hands every worker the same preloaded LookupTables
+  def __init__(self, args, backend=None):
     self.optim = args.optim.lower()
     self.progname = args.progname.lower()
     self.probsize = args.probsize.lower()
@@ -38,56 +63,61 @@ class RunManager:
     self.exe_dir = ROOT_DIR+'/../'+self.dirname+'/buildWithApollo'
     self.timeoutSecs = int(self.prog['timeout'][self.probsize])
 
-    
-    # read in the CSV file with the data to use
-    self.db = pd.read_csv(ROOT_DIR+'/databases/'+args.database)
-
-    # get the data for this program and problem size
-    self.db = self.db[(self.db['progname'] == self.progname) &
-                      (self.db['probsize'] == self.probsize)]
-
-    # map each OMP hyperparameter to some indices
-    threads = list(self.db['OMP_NUM_THREADS'].unique())
-    threads.sort()
-    print('num threads is:', len(threads))
-    self.threads_to_index = {thrd:idx for idx,thrd in enumerate(threads)} 
-    self.index_to_threads = threads
-
-    procs = list(self.db['OMP_PROC_BIND'].unique())
-    procs.sort()
-    print('num procs is:', len(procs))
-    self.procs_to_index = {proc:idx for idx,proc in enumerate(procs)} 
-    self.index_to_procs = procs
-
-    places = list(self.db['OMP_PLACES'].unique())
-    places.sort()
-    print('num places is:', len(places))
-    self.places_to_index = {place:idx for idx,place in enumerate(places)} 
-    self.index_to_places = places
-
-    scheds = list(self.db['OMP_SCHEDULE'].unique())
-    scheds.sort()
-    print('num schedules is:', len(scheds))
-    self.sched_to_index = {sched:idx for idx,sched in enumerate(scheds)}
-    self.index_to_sched = scheds 
-
-    logfilename = self.progname+'-'+self.probsize+'-seed'+str(self.seed)+'-maxSteps'+str(args.maxSteps)
-    loggingdir = ROOT_DIR+'/logs/'+self.progname+'-'+self.probsize+'/'+self.optim+'-'+str(self.seed)
+    if backend is None:
+      if args.backend == 'database':
+        backend = LookupTables(args.database, self.progname, self.probsize, args.schedEncoding)
+      elif args.backend == 'live':
+        backend = LiveBackend(self.progname, self.probsize, args.schedEncoding, args.concurrentEvals,
+                              args.isolationRetimes, args.interferenceTol)
+      else:
+        raise ValueError('Unknown evaluation backend requested', args.backend)
+
+    if backend.schedEncoding != args.schedEncoding:
+      raise ValueError('Evaluation backend uses a different schedule encoding', backend.schedEncoding)
+
+    self.backend = backend
+
+    # racing: each sample gets cut off at cutoffFactor x the best xtime found
+    # so far, 0 turns it off
+    self.cutoffFactor = args.cutoffFactor
+    self.censoredPenalty = args.censoredPenalty
+    if self.cutoffFactor != 0 and self.cutoffFactor <= 1:
+      raise ValueError('Cutoff factor has to be 0 (off) or bigger than 1', self.cutoffFactor)
+
+    logfilename, loggingdir = getLogNames(self.progname, self.probsize, self.optim, self.seed, args.maxSteps,
+                                          args.schedEncoding, args.backend, self.cutoffFactor, 
+                                          self.censoredPenalty)
 
     if 'bo' in self.optim:
       self.optimizer = BOManager(args.seed, args.utilFnct, args.kappa, 
                                  args.xi, args.kappa_decay, args.kappa_decay_delay,
-                                 self.queryDatabase, logfilename, loggingdir, args.maxSteps)
+                                 self.queryDatabase, logfilename, loggingdir, args.maxSteps,
+                                 args.logFlushInterval, args.acqMode, args.gp_refit_every, args.gp_drift_tol,
+                                 backend.searchDims)
     elif 'pso' in self.optim:
       self.optimizer = PSOManager(args.seed, args.popsize, args.w, 
                                   args.c1, args.c2, self.queryDatabase, 
-                                  logfilename, loggingdir, args.maxSteps)
+                                  logfilename, loggingdir, args.maxSteps,
+                                  args.logFlushInterval, self.queryDatabaseBatch, backend.searchDims)
     elif 'cma' in self.optim:
       self.optimizer = CMAManager(args.seed, args.sigma, args.popsize, args.popsize_factor, 
-                                  self.queryDatabase, logfilename, loggingdir, args.maxSteps)
+                                  self.queryDatabase, logfilename, loggingdir, args.maxSteps,
+                                  args.logFlushInterval, self.queryDatabaseBatch, backend.searchDims)
     else:
       raise ValueError('Unknown optimization method requested', optim)
 
+    # a job that got killed part-way through a run (e.g. hitting the
+    # XTIME_LIMIT of jobfile.sh) picks up from its last checkpoint
+    self.checkpointEvery = args.checkpointEvery
+    if self.optimizer.hasCheckpoint() and not self.isDataAlreadyGathered():
+      print('Resuming from checkpoint:', self.optimizer.checkpointfilepath)
+      try:
+        self.optimizer = self.optimizer.loadCheckpoint()
+        print('Resumed with num samples:', self.optimizer.logger.numRows)
+      except Exception as e:
+        # e.g. a checkpoint written by an older version of the managers
+        print('Could not load checkpoint, starting over:', repr(e))
+
     return
 
   def isDataAlreadyGathered(self):
@@ -104,42 +134,54 @@ class RunManager:
     if hasattr(self, 'optimizer') and self.optimizer.logger.hasReachedMaxSamples():
       raise StopIteration('Reached max samples to take! -- Stopping execution')
 
-    THREADS_IDX = policy['OMP_NUM_THREADS']
-    PROC_IDX = policy['OMP_PROC_BIND']
-    PLACES_IDX = policy['OMP_PLACES']
-    SCHED_IDX = policy['OMP_SCHEDULE']
-
-    # need to convert the schedule index to a schedule name
-    NUM_THREADS = self.index_to_threads[THREADS_IDX]
-    PROC_BIND = self.index_to_procs[PROC_IDX]
-    PLACES = self.index_to_places[PLACES_IDX]
-    SCHEDULE = self.index_to_sched[SCHED_IDX]
-
-
-    finds = self.db[(self.db['OMP_NUM_THREADS'] == NUM_THREADS) & 
-                    (self.db['OMP_PROC_BIND'] == PROC_BIND) &
-                    (self.db['OMP_PLACES'] == PLACES) & 
-                    (self.db['OMP_SCHEDULE'] == SCHEDULE)]
-
-    #print(finds)
-    assert(len(finds) == 1)
-
-    xtime = finds.iloc[0]['xtime']
-
-    #print(NUM_THREADS, PROC_BIND, PLACES, SCHEDULE, xtime)
-
-    resultDict = {'OMP_NUM_THREADS':NUM_THREADS,
-                  'OMP_PROC_BIND':PROC_BIND,
-                  'OMP_PLACES':PLACES,
-                  'OMP_SCHEDULE':SCHEDULE,
-                  'xtime': xtime}
-
-    return xtime, resultDict
-
+    if self.cutoffFactor > 0:
+      xtimes, resultCols = self.raceBatch(np.array([[policy[name] for name,_ in self.backend.searchDims]]))
+      return xtimes[0], {k:v[0] for k,v in resultCols.items()}
+
+    return self.backend.lookup(policy)
+
+  # batch version of queryDatabase, see the backends' lookupBatch
+  def queryDatabaseBatch(self, policies):
+
+    numPoints = policies.shape[0]
+
+    # same sample budget as queryDatabase, when it runs out part-way through
+    # we only answer the leading points that still fit in the budget
+    if hasattr(self, 'optimizer'):
+      logger = self.optimizer.logger
+      if logger.hasReachedMaxSamples():
+        raise StopIteration('Reached max samples to take! -- Stopping execution')
+      numPoints = min(numPoints, logger.maxSamples - logger.numRows)
+
+    if self.cutoffFactor > 0:
+      return self.raceBatch(policies[:numPoints])
+
+    return self.backend.lookupBatch(policies[:numPoints])
+
+  # best uncensored xtime in the log, it's rebuilt from the log on
+  # every query so a run resumed from a checkpoint races the same way
+  def getIncumbentXtime(self):
+    if not hasattr(self, 'optimizer'):
+      return np.inf
+    logger = self.optimizer.logger
+    xtimes = logger.buffers['xtime'][:logger.numRows].astype(float)
+    if 'censored' in logger.buffers:
+      xtimes = xtimes[~logger.buffers['censored'][:logger.numRows].astype(bool)]
+    if len(xtimes) == 0:
+      return np.inf
+    return xtimes.min()
+
+  # the logs keep the xtime we observed (a lower bound for censored samples)
+  # while the optimizers get censored samples scaled by censoredPenalty, 
+  # like the PAR-k scores of algorithm configuration
+  def raceBatch(self, policies):
+    incumbent = self.getIncumbentXtime()
+    cutoff = None if np.isinf(incumbent) else self.cutoffFactor * incumbent
+    xtimes, resultCols = self.backend.lookupBatch(policies, cutoff)
+    return np.where(resultCols['censored'], xtimes * self.censoredPenalty, xtimes), resultCols
 
   def getBestPolicies(self, n=10):
-    best = self.db.sort_values(by=['xtime'], ascending=True)
-    return best.iloc[:n]
+    return self.backend.getBestPolicies(n)
 
   def getBestFoundPolicies(self, n=10):
     return self.optimizer.logger.getBestFoundPolicies(n)
@@ -158,14 +200,21 @@ class RunManager:
       except StopIteration as e:
         print('Stopping execution! (either due to a method stopping or maxSamples reached)')
         print('Exception message:', e)
-        print('Log num samples:', self.optimizer.logger.log.shape[0])
+        print('Log num samples:', self.optimizer.logger.numRows)
         break
+
+      self.step += 1
+      if self.checkpointEvery > 0 and (self.step % self.checkpointEvery) == 0:
+        self.optimizer.saveCheckpoint()
     
     # this saves the log file with a DONE postfix to indicate completed data
     self.optimizer.logger.markLogFileAsComplete()
+    self.optimizer.removeCheckpoint()
 
-    print('best database policies')
-    print(self.getBestPolicies(5))
+    bestPolicies = self.getBestPolicies(5)
+    if bestPolicies is not None:
+      print('best database policies')
+      print(bestPolicies)
 
     print('best found policies')
     print(self.getBestFoundPolicies(5))
@@ -179,19 +228,37 @@ class RunManager:
     return
     
 
-def main():
+# argv defaults to the command line, the sweep engine passes in
+# the same argument strings that would go in a todo file
+def parseArgs(argv=None):
+  if argv is None:
+    argv = sys.argv[1:]
+
   parser = argparse.ArgumentParser(description='Global Optim Job Runner')
 
   parser.add_argument('--progname', help='What program to test on', required=False, default='lulesh', type=str)
   parser.add_argument('--probsize', help='What problem size to use', required=False, default='smlprob', type=str)
-  parser.add_argument('--database', help='Path to database file', required=False, type=str, default=MACHINE+'-fullExploreDataset.csv')
+  parser.add_argument('--database', help='Database file in databases/, defaults to the one of this machine', required=False, type=str, default=None)
+  parser.add_argument('--backend', help='Replay the database or run the real program for each sample (database,live)', 
+                      required=False, type=str, default='database', choices=['database', 'live'])
+
+  # only used by the live backend
+  parser.add_argument('--concurrentEvals', help='Run the points of a PSO/CMA population concurrently on disjoint cores', action='store_true')
+  parser.add_argument('--isolationRetimes', help='Num of the best concurrently run points to re-time alone', required=False, type=int, default=2)
+  parser.add_argument('--interferenceTol', help='Slowdown vs running alone above which all concurrent timings get redone alone', required=False, type=float, default=0.1)
 
   parser.add_argument('--optim', help='What global optimizer to use', required=False, default='bo', type=str)
   parser.add_argument('--seed', help='What optimizer seed to use for reproducibility', required=False, type=int, default=1337)
   parser.add_argument('--maxSteps', help='How many steps of the algo should we take?', required=False, type=int, default=50)
+  parser.add_argument('--logFlushInterval', help='How many samples to buffer before appending to the live logfile', required=False, type=int, default=25)
+  parser.add_argument('--checkpointEvery', help='Num optimizer steps between state checkpoints to resume from, 0 disables them', required=False, type=int, default=10)
+  parser.add_argument('--cutoffFactor', help='Cut samples off at this many times the best xtime so far and log them as censored, 0 disables it', required=False, type=float, default=0.0)
+  parser.add_argument('--censoredPenalty', help='Factor the optimizers see censored xtimes scaled by', required=False, type=float, default=2.0)
+  parser.add_argument('--schedEncoding', help='Search over schedule kind x chunk size, or the old lexicographic schedule index (structured,lexicographic)', 
+                      required=False, type=str, default='structured', choices=['structured', 'lexicographic'])
 
   # BO-specific arguments
-  if '--optim=bo' in sys.argv:
+  if '--optim=bo' in argv:
     parser.add_argument('--utilFnct', help='What utility funciton should BO use? (ucb,poi,ei)', required=False, type=str, default='ucb')
 
     # kappa only used in ucb
@@ -202,20 +269,36 @@ def main():
     # xi is only used in poi and ei
     parser.add_argument('--xi', help='', required=False, type=float, default=0.0)
 
-  elif '--optim=pso' in sys.argv:
+    parser.add_argument('--acqMode', help='Maximize the acquisition over the continuous box or score every grid point (continuous,discrete)', 
+                        required=False, type=str, default='continuous', choices=['continuous', 'discrete'])
+
+    # 0 refits the GP from scratch every step
+    parser.add_argument('--gp_refit_every', help='Num samples between GP kernel refits, incremental updates in between', required=False, type=int, default=0)
+    parser.add_argument('--gp_drift_tol', help='Per-sample log-likelihood drop that forces an early kernel refit', required=False, type=float, default=0.25)
+
+  elif '--optim=pso' in argv:
     parser.add_argument('--popsize', help='Swarm Population Size', required=False, type=int, default=10)
     parser.add_argument('--w', help='', required=False, type=float, default=0.8)
     parser.add_argument('--c1', help='', required=False, type=float, default=0.5)
     parser.add_argument('--c2', help='', required=False, type=float, default=0.5)
 
-  elif '--optim=cma' in sys.argv:
+  elif '--optim=cma' in argv:
     parser.add_argument('--sigma', help='Standard Deviation of Search Space', required=False, type=float, default=100.0)
     parser.add_argument('--popsize', help='Population Size', required=False, type=int, default=8)
     parser.add_argument('--popsize_factor', help='Population Size Decay Factor', required=False, type=float, default=1.0)
 
-  args = parser.parse_args()
+  return parser.parse_args(argv)
+
+def main():
+  args = parseArgs()
   print('Got input args:', args)
 
+  # database replays don't time anything, only live runs get pinned
+  if args.backend == 'live':
+    applyAffinity()
+  elif args.database is None:
+    args.database = getDefaultDatabase()
+
   runMan = RunManager(args)
 
   if runMan.isDataAlreadyGathered():
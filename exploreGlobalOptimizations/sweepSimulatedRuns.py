@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+# this program runs every hyperparameter combo of one optimization method
+# for a given benchmark, problem size, and seed. The database is loaded
+# once and the combos are fanned out across a process pool sized to the
+# node, instead of paying for a python3 startup, the optimizer imports,
+# and a re-read of the database for each combo.
+# With --ensemble, the PSO/CMA combos are instead run as ensembles that
+# step many instances in lockstep (see ensembleOptimizers.py).
+
+import os
+
+# each worker is one simulated run, keep the numeric libraries
+# from spawning their own thread pools on top of ours
+for var in ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']:
+  os.environ.setdefault(var, '1')
+
+from benchmarks import *
+from simulateGlobalOptimRunOnNode import LookupTables, RunManager, parseArgs, getLogNames
+from ensembleOptimizers import PSOEnsemble, CMAEnsemble
+from setupAndLaunchSimulatedJobs import paramsToSweep, genSweepCombos, genRunArgs, MAX_ITERATIONS
+import multiprocessing as mp
+import argparse
+import time
+import sys
+
+# set in the parent before the pool gets forked, so every
+# worker inherits the preloaded lookup tables
+sharedTables = None
+
+def initWorker(verbose):
+  # the runs are chatty, only keep the parent's progress output by default
+  if not verbose:
+    sys.stdout = open(os.devnull, 'w')
+  return
+
+def runCombo(runArgs):
+  desc = ' '.join(runArgs)
+  try:
+    args = parseArgs(runArgs)
+    runMan = RunManager(args, sharedTables)
+
+    # keep skipping runs that already wrote their DONE file
+    if runMan.isDataAlreadyGathered():
+      return desc, 'skipped'
+
+    runMan.doRuns()
+    return desc, 'done'
+
+  except Exception as e:
+    return desc, 'failed: '+repr(e)
+
+def runEnsemble(task):
+  optim, runArgsList = task
+  desc = f'{optim} ensemble of {len(runArgsList)} combos, first: '+' '.join(runArgsList[0])
+  try:
+    argsList = [parseArgs(runArgs) for runArgs in runArgsList]
+    args = argsList[0]
+
+    logfilename, loggingdir = getLogNames(args.progname.lower(), args.probsize.lower(), 
+                                          optim, args.seed, args.maxSteps, args.schedEncoding)
+
+    if optim == 'pso':
+      ensemble = PSOEnsemble(args.seed, args.popsize, [a.w for a in argsList], 
+                             [a.c1 for a in argsList], [a.c2 for a in argsList],
+                             sharedTables, logfilename, loggingdir, args.maxSteps, 
+                             args.logFlushInterval)
+    else:
+      ensemble = CMAEnsemble(args.seed, [a.sigma for a in argsList], [a.popsize for a in argsList], 
+                             [a.popsize_factor for a in argsList], sharedTables, 
+                             logfilename, loggingdir, args.maxSteps, args.logFlushInterval)
+
+    if ensemble.numInstances == 0:
+      return desc, 'skipped'
+
+    ensemble.doRuns()
+    return desc, 'done'
+
+  except Exception as e:
+    return desc, 'failed: '+repr(e)
+
+# PSO instances can only be stacked when they share a population size,
+# CMA instances are just split evenly across the workers
+def genEnsembleTasks(method, toRun, numProcs):
+  if method == 'pso':
+    groups = {}
+    for runArgs in toRun:
+      groups.setdefault(parseArgs(runArgs).popsize, []).append(runArgs)
+    return [(method, group) for group in groups.values()]
+
+  numTasks = min(numProcs, len(toRun))
+  return [(method, toRun[idx::numTasks]) for idx in range(numTasks)]
+
+
+def main():
+  global sharedTables
+
+  # one worker per cpu of the machine profile by default
+  applyAffinity()
+
+  parser = argparse.ArgumentParser(description='Global Optim Sweep Runner')
+
+  parser.add_argument('--progname', help='What program to test on', required=True, type=str)
+  parser.add_argument('--probsize', help='What problem size to use', required=True, type=str)
+  parser.add_argument('--seed', help='What optimizer seed to use for reproducibility', required=True, type=int)
+  parser.add_argument('--method', help='Which paramsToSweep method to sweep', required=True, type=str, choices=list(paramsToSweep.keys()))
+  parser.add_argument('--maxSteps', help='How many steps of the algo should we take?', required=False, type=int, default=MAX_ITERATIONS)
+  parser.add_argument('--database', help='Database file in databases/, defaults to the one of this machine', required=False, type=str, default=None)
+  parser.add_argument('--numProcs', help='Number of worker processes', required=False, type=int, default=len(os.sched_getaffinity(0)))
+  parser.add_argument('--verbose', help='Keep the stdout of each run', action='store_true')
+  parser.add_argument('--ensemble', help='Run the pso/cma combos as lockstep ensembles', action='store_true')
+  parser.add_argument('--schedEncoding', help='Search over schedule kind x chunk size, or the old lexicographic schedule index (structured,lexicographic)', 
+                      required=False, type=str, default='structured', choices=['structured', 'lexicographic'])
+
+  args = parser.parse_args()
+  print('Got input args:', args)
+
+  progname = args.progname.lower()
+  probsize = args.probsize.lower()
+
+  if probsize not in ['smlprob', 'medprob', 'lrgprob']:
+    raise ValueError('Unknown problem size requested', probsize)
+
+  if progname not in list(progs.keys()):
+    raise ValueError('Unknown benchmark requested', progname)
+
+  if args.database is None:
+    args.database = getDefaultDatabase()
+
+  start = time.time()
+  sharedTables = LookupTables(args.database, progname, probsize, args.schedEncoding)
+  print('loaded database in', time.time()-start, 'seconds')
+
+  combos = genSweepCombos(args.method)
+  toRun = [genRunArgs(progname, probsize, args.seed, args.method, combo, args.maxSteps) + 
+           [f'--database={args.database}', f'--schedEncoding={args.schedEncoding}'] 
+           for combo in combos]
+
+  workFnct = runCombo
+  if args.ensemble:
+    if args.method not in ['pso', 'cma']:
+      raise ValueError('Ensembles are only supported for pso and cma', args.method)
+    workFnct = runEnsemble
+    toRun = genEnsembleTasks(args.method, toRun, args.numProcs)
+
+  print('running', len(toRun), 'tasks on', args.numProcs, 'processes')
+
+  counts = {'done':0, 'skipped':0, 'failed':0}
+
+  # fork so the workers share the tables we just loaded
+  ctx = mp.get_context('fork')
+  with ctx.Pool(args.numProcs, initializer=initWorker, initargs=(args.verbose,)) as pool:
+    for idx,(desc,status) in enumerate(pool.imap_unordered(workFnct, toRun)):
+      counts[status.split(':')[0]] += 1
+      if status != 'skipped':
+        print(f'[{idx+1}/{len(toRun)}]', status, desc)
+
+  print('sweep finished in', time.time()-start, 'seconds', counts)
+
+  if counts['failed'] != 0:
+    sys.exit(1)
+
+  return
+
+
+if __name__ == "__main__":
+    main()
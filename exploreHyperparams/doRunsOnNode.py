@@ -6,14 +6,199 @@ import re
 from benchmarks import *
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 import glob
 import sys
+import queue
+import signal
+import threading
+import json
+import zlib
+from workQueue import WorkQueue
+from resultStore import ResultStore, DEFAULT_STORE_PATH
+
+# Append-only log of the runs a JobRunner finished since complete.csv was
+# last compacted. Every record goes on its own line as
+#   <seq>\t<crc32 of the payload>\t<json payload>
+# and gets fsync'd before the next run starts, so a node that gets killed
+# (e.g. by the XTIME_LIMIT of jobfile.sh) loses at most the run it was on.
+# Replaying stops at the first record that's torn or out of sequence.
+class ResultJournal:
+
+    def __init__(self, journalPath):
+        self.journalPath = journalPath
+        self.records = self.replay()
+        self.seq = len(self.records)
+
+        # drop whatever torn tail the replay stopped at, so new records
+        # get appended right after the last good one
+        with open(self.journalPath, 'a+b') as f:
+            f.truncate(self.goodBytes)
+            os.fsync(f.fileno())
+
+        self.journal = open(self.journalPath, 'ab')
+        return
+
+    def replay(self):
+        records = []
+        self.goodBytes = 0
+        if not os.path.exists(self.journalPath):
+            return records
+
+        with open(self.journalPath, 'rb') as f:
+            for line in f:
+                record = self.parseRecord(line, len(records))
+                if record is None:
+                    print('journal', self.journalPath, 'stops being valid after', len(records), 'records')
+                    break
+                records += [record]
+                self.goodBytes += len(line)
+        return records
+
+    @staticmethod
+    def parseRecord(line, expectedSeq):
+        if not line.endswith(b'\n'):
+            return None
+        fields = line[:-1].split(b'\t', 2)
+        if len(fields) != 3:
+            return None
+        seq, crc, payload = fields
+        try:
+            if int(seq) != expectedSeq or int(crc, 16) != zlib.crc32(payload):
+                return None
+            return json.loads(payload)
+        except ValueError:
+            return None
+
+    def append(self, record):
+        payload = json.dumps(record).encode('utf-8')
+        self.journal.write(b'%d\t%08x\t%s\n' % (self.seq, zlib.crc32(payload), payload))
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+        self.seq += 1
+        self.records += [record]
+        return
+
+    # called once the records made it into complete.csv
+    def clear(self):
+        self.journal.truncate(0)
+        os.fsync(self.journal.fileno())
+        self.seq = 0
+        self.records = []
+        return
 
+
+# complete.csv keeps one row per todo.csv job that was run, its job column
+# holds the job's row index in todo.csv. Journal records carry their job
+# too, a record replaces the row of its job (a re-run of a -1 job) or adds
+# one. The records are checked against todo.csv first, so a row never gets
+# replaced by a run of a different config.
+def mergeJournalRecords(completeDF, records, todoDF):
+    if len(records) == 0:
+        return completeDF
+
+    newRows = pd.DataFrame(records).drop_duplicates('job', keep='last')
+    checkJobKnobs(newRows, todoDF, 'the journal')
+
+    kept = completeDF[~completeDF['job'].isin(newRows['job'])]
+    return pd.concat([kept, newRows], ignore_index=True)
+
+
+# raises when a row's knobs aren't the ones of its todo job (e.g. todo.csv
+# got regenerated under an old complete.csv). Jobs past the end of todo.csv
+# are extra trials of old complete.csv files, see assignJobIds.
+def checkJobKnobs(df, todoDF, what):
+    jobs = df['job'].astype(int).to_numpy()
+    if (jobs < 0).any():
+        raise ValueError('Negative job ids in '+what, jobs[jobs < 0])
+
+    inTodo = jobs < todoDF.shape[0]
+    rows, todoRows = df[inTodo], todoDF.iloc[jobs[inTodo]]
+    same = np.ones(rows.shape[0], dtype=bool)
+    for k in todoDF.columns:
+        same &= (rows[k].astype(todoDF[k].dtype).to_numpy() == todoRows[k].to_numpy())
+    if not same.all():
+        raise ValueError('Rows of '+what+' have other knobs than their todo.csv job', rows[~same].head())
+    return
+
+
+# complete.csv files from before the job column only have the run's
+# config to go by, and the old runner dropped their -1 rows and appended
+# the re-runs at the end, so row i isn't todo job i. Their valid rows get
+# matched to todo jobs by config: the k-th valid row of a config is the
+# k-th todo job with that config. -1 rows get dropped (their jobs are
+# still todo). Valid rows beyond the config's todo jobs are extra trials
+# the old runner re-ran, they keep their result under job ids past the end
+# of todo.csv.
+def assignJobIds(completeDF, todoDF):
+    keys = list(todoDF.columns)
+    valid = completeDF[completeDF['xtime'].astype(float) != -1.0].reset_index(drop=True)
+    for k in keys:
+        valid[k] = valid[k].astype(todoDF[k].dtype)
+
+    valid['occurrence'] = valid.groupby(keys, dropna=False).cumcount()
+    todoJobs = todoDF.reset_index(drop=True).rename_axis('job').reset_index()
+    todoJobs['occurrence'] = todoJobs.groupby(keys, dropna=False).cumcount()
+
+    matched = valid.merge(todoJobs, on=keys+['occurrence'], how='left', validate='one_to_one', sort=False)
+    extra = matched['job'].isna()
+    matched.loc[extra, 'job'] = todoDF.shape[0] + np.arange(int(extra.sum()))
+
+    print('matched', int((~extra).sum()), 'complete.csv rows to todo jobs by config,', int(extra.sum()), 'extra trials,',
+          completeDF.shape[0]-valid.shape[0], '-1 rows dropped')
+    return matched.drop(columns=['occurrence']).astype({'job': int})
+
+
+# complete.csv with a job column, matched to the todo jobs when it's from
+# before that column
+def readJobsCSV(completeCSV, todoDF):
+    completeDF = pd.read_csv(completeCSV)
+    if 'job' not in completeDF.columns:
+        completeDF = assignJobIds(completeDF, todoDF)
+    checkJobKnobs(completeDF, todoDF, completeCSV)
+    return completeDF
+
+
+def getJournalPath(completeCSV):
+    return os.path.splitext(completeCSV)[0]+'.journal'
+
+
+# complete.csv along with the records its journal holds on top of it,
+# for readers that don't own the journal (other nodes, the job launcher)
+def readCompleteCSV(completeCSV):
+    csvDir = os.path.dirname(os.path.abspath(completeCSV))
+    todoDF = pd.read_csv([csv for csv in glob.glob(csvDir+'/*.csv') if 'todo' in csv][0])
+    completeDF = readJobsCSV(completeCSV, todoDF) if os.path.exists(completeCSV) else pd.DataFrame(columns=['job'])
+    journalPath = getJournalPath(completeCSV)
+    if not os.path.exists(journalPath):
+        return completeDF
+
+    records = []
+    with open(journalPath, 'rb') as f:
+        for line in f:
+            record = ResultJournal.parseRecord(line, len(records))
+            if record is None:
+                break
+            records += [record]
+    return mergeJournalRecords(completeDF, records, todoDF)
+
+
+# complete.csv (and its journal) is the node's own record of which todo
+# jobs are done. Every run also goes into the result store, that's what the
+# launcher and the database builder read.
 class JobRunner:
-    def __init__(self, csvDir):
+    def __init__(self, csvDir, cutoffFactor=0.0, compactEvery=50, storePath=DEFAULT_STORE_PATH, extrapolate=False):
         self.csvDir = csvDir
 
+        # racing: with a cutoffFactor > 0, each run gets killed once it takes
+        # cutoffFactor x the best xtime seen so far for its (progname, probsize)
+        self.cutoffFactor = cutoffFactor
+
+        # kill runs whose printed progress says they'll go past their limit
+        self.extrapolate = extrapolate
+
+        # num runs between folding the journal into complete.csv
+        self.compactEvery = compactEvery
+
         self.completeCSV = None
         self.todoCSV = None
 
@@ -30,92 +215,265 @@ class JobRunner:
 
         self.todoDF = pd.read_csv(self.todoCSV)
 
+        migrated = False
         if self.completeCSV != None:
-            self.completeDF = pd.read_csv(self.completeCSV)
-
-            # force datatype same-ness
-            for k,v in self.todoDF.dtypes.items():
-                self.completeDF[k] = self.completeDF[k].astype(v)
-
-            print(self.todoDF.dtypes)
-            print(self.completeDF.dtypes)
-            print(self.todoDF.head())
-            print(self.completeDF.tail())
-
-            # drop any jobs with a -1 xtime, these need to be re-run
-            self.completeDF = self.completeDF[self.completeDF['xtime'] != -1.0]
-
-            doneJobs = self.completeDF.drop(columns=['xtime'])
-
-            # remove the completed work items from todoDF
-            self.todoDF = self.todoDF[~self.todoDF.isin(doneJobs)]
-            self.todoDF = self.todoDF.dropna()
-
-            # force datatype same-ness
-            for k,v in self.completeDF.drop(columns=['xtime']).dtypes.items():
-                self.todoDF[k] = self.todoDF[k].astype(v)
-
-
+            migrated = 'job' not in pd.read_csv(self.completeCSV, nrows=0).columns
+            self.completeDF = readJobsCSV(self.completeCSV, self.todoDF)
         else:
-            completeCols = ['xtime']+list(self.todoDF.columns)
+            completeCols = ['job', 'xtime', 'censored', 'invalid']+list(self.todoDF.columns)
             self.completeDF = pd.DataFrame(columns = completeCols)
             self.completeCSV = self.todoCSV.replace('todo', 'complete')
 
+        # replay the runs that finished after the last compaction, an old
+        # complete.csv gets rewritten with its job column right away
+        self.journal = ResultJournal(getJournalPath(self.completeCSV))
+        print('Replayed', len(self.journal.records), 'journal records')
+        if len(self.journal.records) != 0 or migrated:
+            self.compact()
+
+        # runs are keyed by this dir and their todo job id in the store, so
+        # (re-)adding what complete.csv holds catches up on any run that got
+        # journaled right before the node got killed
+        self.store = ResultStore(storePath)
+        self.source = os.path.abspath(csvDir)
+        if self.completeDF.shape[0] != 0:
+            self.store.addRuns(self.completeDF, self.source)
 
         self.envvars = list(self.todoDF.columns)
         self.envvars.remove('progname')
         self.envvars.remove('probsize')
 
-        self.todoDF     = self.todoDF.reset_index(drop=True)
-        self.completeDF = self.completeDF.reset_index(drop=True)
-
-        print('Got', self.todoDF.shape[0], 'jobs todo!')
-        print('Got', self.completeDF.shape[0], 'jobs pre-completed!')
-        print('todo df head:', self.todoDF.head())
+        # any job without a row or with a -1 xtime (these need to be re-run)
+        # is still todo, rows past the end of todo.csv are extra trials.
+        # Runs whose output failed its check are done, re-running won't fix them
+        done = np.zeros(self.todoDF.shape[0], dtype=bool)
+        doneJobs = self.completeDF['job'][self.completeDF['xtime'].astype(float) != -1.0].astype(int).to_numpy()
+        done[doneJobs[doneJobs < self.todoDF.shape[0]]] = True
+        self.todoJobs = np.flatnonzero(~done)
+
+        print('Got', len(self.todoJobs), 'jobs todo!')
+        print('Got', int(done.sum()), 'jobs pre-completed!')
+        print('todo df head:', self.todoDF.iloc[self.todoJobs[:5]])
         print('Using envvars',self.envvars)
         print('CSVs:', self.todoCSV, self.completeCSV, sep='\n')
 
+        self.bestXtimes = self.getBestXtimes()
+
         return
 
+    # folds the journal into complete.csv, the new file replaces the old one
+    # atomically and the journal only gets cleared after that. A kill in
+    # between just replays records that are already in complete.csv.
+    def compact(self):
+        self.completeDF = mergeJournalRecords(self.completeDF, self.journal.records, self.todoDF)
+
+        tmpCSV = self.completeCSV+'.tmp'
+        with open(tmpCSV, 'w') as f:
+            self.completeDF.to_csv(f, index=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmpCSV, self.completeCSV)
+
+        self.journal.clear()
+        return
+
+    # the best uncensored xtime of each (progname, probsize), including what
+    # the other nodes sampling the same program have completed so far
+    def getBestXtimes(self):
+        return self.store.getBestXtimes()
+
+    def getCutoff(self, progname, probsize):
+        if self.cutoffFactor <= 0:
+            return None
+        return self.cutoffFactor * self.bestXtimes.get((progname, probsize), np.inf)
+
     def doJobs(self):
-        while self.todoDF.shape[0] != 0:
+        for numRun,job in enumerate(self.todoJobs, 1):
             # get the next row
-            row = self.todoDF.iloc[0]
+            row = self.todoDF.iloc[job]
 
             progname = row['progname']
             probsize = row['probsize']
 
-            runner = ProgRunner(progname, probsize)
+            runner = ProgRunner(progname, probsize, self.extrapolate)
 
             envvar = row[self.envvars].to_dict()
             
             print('running with envvars:', envvar.items())
 
             # this is a blocking call
-            xtime = runner.runProg(envvar)
+            xtime, censored, invalid = runner.runProgChecked(envvar, self.getCutoff(progname, probsize))
 
-            dictToWrite = {'xtime': xtime, 'progname': progname, 'probsize': probsize}
+            if xtime > 0 and not censored and not invalid:
+                key = (progname, probsize)
+                self.bestXtimes[key] = min(self.bestXtimes.get(key, np.inf), xtime)
+
+            dictToWrite = {'xtime': xtime, 'censored': censored, 'invalid': invalid, 'progname': progname, 'probsize': probsize}
             dictToWrite = {**dictToWrite, **envvar}
 
-            newRow = pd.DataFrame(dictToWrite, index=[0])
-            self.completeDF = pd.concat([self.completeDF, newRow], ignore_index=True)
-            self.completeDF.to_csv(self.completeCSV, index=False)
+            # numpy scalars don't go through json
+            dictToWrite = {k:(v.item() if isinstance(v, np.generic) else v) for k,v in dictToWrite.items()}
+            self.journal.append({'job': int(job), **dictToWrite})
+            self.store.addRun(self.source, int(job), dictToWrite)
 
-            # drop the row from the df
-            self.todoDF = self.todoDF.drop(index=0).reset_index(drop=True)
+            if self.compactEvery > 0 and (numRun % self.compactEvery) == 0:
+                self.compact()
 
+        self.compact()
         return
 
 
 
+# Drains a WorkQueue (see workQueue.py) instead of a todo.csv: it leases
+# one job at a time, keeps the lease alive from a heartbeat thread while the
+# job runs, and reports the result back. Any number of these can share one
+# queue, so no node sits on work another node could be doing.
+class QueueWorker:
+    def __init__(self, queuePath, cutoffFactor=0.0, leaseSecs=120, exportEvery=50, pollSecs=30, 
+                 storePath=DEFAULT_STORE_PATH, extrapolate=False):
+        self.queuePath = queuePath
+        self.cutoffFactor = cutoffFactor
+        self.extrapolate = extrapolate
+        self.leaseSecs = leaseSecs
+        self.exportEvery = exportEvery
+        self.pollSecs = pollSecs
+
+        self.workQueue = WorkQueue(queuePath)
+        self.worker = os.uname().nodename+'-'+str(os.getpid())
+
+        # runs are keyed by the queue file and their job id in the store
+        self.store = ResultStore(storePath)
+        self.source = os.path.abspath(queuePath)
+
+        # results get mirrored to a complete.csv next to the queue
+        self.completeCSV = os.path.dirname(os.path.abspath(queuePath))+'/complete.csv'
+
+        print('Worker', self.worker, 'draining', queuePath, self.workQueue.getStatusCounts())
+        return
+
+    def getCutoff(self, progname, probsize):
+        if self.cutoffFactor <= 0:
+            return None
+        best = self.workQueue.getBestXtimes().get((progname, probsize), np.inf)
+        return self.cutoffFactor * best
+
+    # renews the lease every third of its length until stop gets set,
+    # sqlite connections can't be shared across threads so it opens its own
+    def keepLeaseAlive(self, jobId, stop):
+        workQueue = WorkQueue(self.queuePath)
+        while not stop.wait(self.leaseSecs / 3):
+            if not workQueue.heartbeat(jobId, self.worker, self.leaseSecs):
+                print('lost the lease on job', jobId)
+                break
+        workQueue.close()
+        return
+
+    def doJobs(self):
+        numRun = 0
+        while True:
+            job = self.workQueue.lease(self.worker, self.leaseSecs)
+
+            if job is None:
+                # leased jobs can still come back if their worker dies
+                if self.workQueue.isDrained():
+                    break
+                time.sleep(self.pollSecs)
+                continue
+
+            jobId, progname, probsize, envvar = job
+            print('running job', jobId, 'with envvars:', envvar.items())
+
+            stop = threading.Event()
+            heartbeat = threading.Thread(target=self.keepLeaseAlive, args=(jobId, stop), daemon=True)
+            heartbeat.start()
+
+            # this is a blocking call
+            runner = ProgRunner(progname, probsize, self.extrapolate)
+            xtime, censored, invalid = runner.runProgChecked(envvar, self.getCutoff(progname, probsize))
+
+            stop.set()
+            heartbeat.join()
+
+            # stored first: if we die before completing it, whoever re-runs
+            # the job overwrites this run under the same job id
+            self.store.addRun(self.source, jobId, {'xtime': xtime, 'censored': censored, 'invalid': invalid,
+                                                   'progname': progname, 'probsize': probsize, **envvar})
+            self.workQueue.complete(jobId, self.worker, xtime, censored, invalid)
+
+            numRun += 1
+            if self.exportEvery > 0 and (numRun % self.exportEvery) == 0:
+                self.workQueue.exportComplete(self.completeCSV)
+
+        self.workQueue.exportComplete(self.completeCSV)
+        print('Queue drained:', self.workQueue.getStatusCounts())
+        return
+
+
+# Progress hook that extrapolates the total runtime from the iteration
+# counts a program prints while it runs, and asks for the run to be killed
+# once it's clearly going past limitSecs. It needs the program's
+# 'progress-regex' (the current iteration) and 'iters-regex' (the total
+# number of iterations) from benchmarks.py. The estimate it killed the run
+# on is kept in estimate.
+class ProgressExtrapolator:
+
+    def __init__(self, progressRegex, itersRegex, limitSecs, minFraction=0.1, slack=1.25):
+        self.progressRegex = re.compile(progressRegex)
+        self.itersRegex = re.compile(itersRegex)
+        self.limitSecs = limitSecs
+        self.minFraction = minFraction
+        self.slack = slack
+
+        self.totalIters = None
+        self.startSecs = None
+        self.startIter = None
+        self.estimate = None
+        return
+
+    # returns True when the run should be aborted
+    def __call__(self, line, elapsedSecs):
+        if self.totalIters is None:
+            finds = self.itersRegex.findall(line)
+            if len(finds) != 0:
+                self.totalIters = int(finds[-1])
+            return False
+
+        finds = self.progressRegex.findall(line)
+        if len(finds) == 0:
+            return False
+        iteration = int(finds[-1])
+
+        # setup time before the first iteration isn't part of the rate
+        if self.startSecs is None:
+            self.startSecs = elapsedSecs
+            self.startIter = iteration
+            return False
+
+        done = iteration - self.startIter
+        if done <= 0 or iteration < self.minFraction * self.totalIters:
+            return False
+
+        secsPerIter = (elapsedSecs - self.startSecs) / done
+        estimate = elapsedSecs + secsPerIter * (self.totalIters - iteration)
+        if estimate > self.slack * self.limitSecs:
+            print('\t\textrapolated xtime:', estimate, 'seconds at iteration', iteration, 'of', self.totalIters)
+            self.estimate = estimate
+            return True
+        return False
+
+
 class ProgRunner:
 
-    def __init__(self, progname, probsize):
+    # with extrapolate, programs with a 'progress-regex' get a
+    # ProgressExtrapolator against the timeout of each run
+    def __init__(self, progname, probsize, extrapolate=False):
         self.progname = progname
         self.probsize = probsize
+        self.extrapolate = extrapolate
 
         self.prog = progs[progname]
         self.xtimeRegex = self.prog['xtime-regex']
+        self.validRegex = self.prog['valid-regex']
 
         self.exe = self.prog['exe'][probsize]
 
@@ -131,7 +489,50 @@ class ProgRunner:
         xtime = float(finds[-1].rstrip())
         return xtime
 
+    # the exe strings of benchmarks.py are a '&&' chain of (quoted) shell
+    # commands, e.g. '"rm -f *.txt" && "./xhpcg --nx=64 --ny=64 --nz=64"'.
+    # A stage that's one quoted token is a shell command of its own (with
+    # its globs), the arguments of any other stage get re-quoted since
+    # each stage goes through the shell, e.g. 'python3 -c "print(1)"'
+    def getPipeline(self):
+        pipeline = [[]]
+        for token in shlex.split(self.exe):
+            if token == '&&':
+                pipeline += [[]]
+            else:
+                pipeline[-1] += [token]
+        return [stage[0] if len(stage) == 1 else shlex.join(stage) for stage in pipeline if len(stage) != 0]
+
+    def makeProgressHooks(self, limitSecs):
+        if not self.extrapolate or 'progress-regex' not in self.prog:
+            return []
+        return [ProgressExtrapolator(self.prog['progress-regex'], self.prog['iters-regex'], limitSecs)]
+
     def runProg(self, envvars):
+        xtime, censored = self.runProgCensored(envvars)
+        return xtime
+
+    # for callers that don't record the invalid flag, a run whose output
+    # failed its check comes back as -1 like a failed run
+    def runProgCensored(self, envvars, cutoffSecs=None, progressHooks=None):
+        xtime, censored, invalid = self.runProgChecked(envvars, cutoffSecs, progressHooks)
+        if invalid:
+            return -1.0, False
+        return xtime, censored
+
+    # returns (xtime, censored, invalid).
+    # A run that reaches its timeout (or cutoffSecs, if that's sooner) gets
+    # killed and comes back censored -- its xtime is only a lower bound.
+    # Each progressHook gets called with every line of stdout and the
+    # seconds since the pipeline started, the run gets killed as soon as
+    # one of them returns True. A run killed on a hook's prediction comes
+    # back censored at the hook's estimate (its 'estimate' attribute), or
+    # at the timeout if the hook has none: what it ran so far is no bound.
+    # A failing command comes back as -1, to be re-run. A run that finishes
+    # but doesn't print an xtime or fails the validity check comes back
+    # invalid, with its xtime (or the seconds it ran if it printed none):
+    # re-running it gives the same output.
+    def runProgChecked(self, envvars, cutoffSecs=None, progressHooks=None):
 
         # make sure all the envvars are strings
         for key in envvars:
@@ -141,57 +542,143 @@ class ProgRunner:
 
         exe_dir = ROOT_DIR+'/../'+self.prog['dirname']+'/buildNoApollo'
         timeoutSecs = int(self.prog['timeout'][self.probsize])
+        if cutoffSecs is not None and cutoffSecs < timeoutSecs:
+            timeoutSecs = cutoffSecs
 
-        os.chdir(exe_dir)
-
-        command = self.exe
+        hooks = self.makeProgressHooks(timeoutSecs) + list(progressHooks or [])
 
-        print('executing command:', command, 'with envvars:', envvars, '\n', end="\t")
-        print(shlex.split(command))
-
-        allOutput=''
-        noTimeoutHappened = True
+        os.chdir(exe_dir)
 
-        toExec = command.split('&&')
-        for subcommand in toExec:
-            result = ''
+        pipeline = self.getPipeline()
+        print('executing command:', self.exe, 'with envvars:', envvars, '\n', end="\t")
+        print(pipeline)
+
+        state = {'xtime': -1.0, 'valid': False, 'killed': False, 'predicted': False, 'estimate': None}
+        start = time.time()
+        for command in pipeline:
+            returncode = self.runStreaming(command, vars_to_use, start + timeoutSecs, start, hooks, state)
+
+            if state['predicted']:
+                predicted = max(float(timeoutSecs), state['estimate'] or 0.0)
+                print(self.progname, self.probsize, 'PREDICTED TO PASS MAX EXECUTION TIME -- Killed after:', 
+                      time.time() - start, 'seconds, recording', predicted, 'seconds')
+                return predicted, True, False
+
+            if state['killed']:
+                print(self.progname, self.probsize, 'REACHED MAX EXECUTION TIME -- Killed after:', 
+                      time.time() - start, 'seconds')
+                return float(timeoutSecs), True, False
+
+            # like '&&', a failing command ends the pipeline
+            if returncode != 0:
+                print(self.progname, self.probsize, 'command', command, 'failed with exit code', returncode)
+                return -1.0, False, False
+
+        if state['xtime'] < 0:
+            elapsed = time.time() - start
+            print(self.progname, self.probsize, 'no xtime in the output -- recording the run as invalid after', 
+                  elapsed, 'seconds')
+            return elapsed, False, True
+
+        if self.validRegex != '' and not state['valid']:
+            print(self.progname, self.probsize, 'output did not pass the validity check -- recording the run as invalid, xtime:', 
+                  state['xtime'], 'seconds')
+            return state['xtime'], False, True
+
+        print('\t\textracted xtime:', state['xtime'], 'seconds')
+        return state['xtime'], False, False
+
+    # runs one command of the pipeline, matching the xtime/validity patterns
+    # and calling the progress hooks as its stdout lines come in
+    def runStreaming(self, command, vars_to_use, deadline, start, hooks, state):
+
+        # the command runs in its own process group so killing it also
+        # kills whatever the shell started
+        proc = subprocess.Popen(command, shell=True, env=vars_to_use, start_new_session=True,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, 
+                                text=True, bufsize=1)
+
+        # pipes get drained by threads so that the main thread
+        # can enforce the deadline while waiting on output
+        lines = queue.Queue()
+        def drain(stream, isStdout):
+            for line in stream:
+                lines.put((isStdout, line))
+            lines.put((isStdout, None))
+            return
+
+        readers = [threading.Thread(target=drain, args=(proc.stdout, True), daemon=True),
+                   threading.Thread(target=drain, args=(proc.stderr, False), daemon=True)]
+        for reader in readers:
+            reader.start()
+
+        openStreams = len(readers)
+        while openStreams != 0:
             try:
-                result = subprocess.run(shlex.split(subcommand), shell=True, env=vars_to_use, timeout=timeoutSecs,
-                                        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-                # grab the stdout and errors 
-                errors = result.stderr.decode('utf-8')
-                output = result.stdout.decode('utf-8')
-
-                print(output)
-                print(errors)
-                allOutput += output
-
-                if noTimeoutHappened:
-                    noTimeoutHappened = True
-
-            except subprocess.TimeoutExpired:
-                print(self.progname, self.probsize, 'REACHED MAX EXECUTION TIME -- Killed after:', timeoutSecs, 'seconds')
-                noTimeoutHappened = False
+                isStdout, line = lines.get(timeout=max(deadline - time.time(), 0))
+            except queue.Empty:
+                state['killed'] = True
+                break
+
+            if line is None:
+                openStreams -= 1
+                continue
+
+            print(line, end='')
+            if not isStdout:
+                continue
+
+            xtime = self.extractXtimeFromString(line)
+            if xtime >= 0:
+                state['xtime'] = xtime
+            if self.validRegex != '' and re.search(self.validRegex, line):
+                state['valid'] = True
+
+            elapsed = time.time() - start
+            abortingHooks = [hook for hook in hooks if hook(line, elapsed)]
+            if len(abortingHooks) != 0:
+                state['killed'] = True
+                state['predicted'] = True
+                state['estimate'] = max([getattr(hook, 'estimate', None) or 0.0 for hook in abortingHooks])
+                break
+
+        if state['killed']:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
 
-        # extract the xtime from the output
-        if noTimeoutHappened:
-            xtime = self.extractXtimeFromString(allOutput)
-            print('\t\textracted xtime:', xtime, 'seconds')
-            return xtime
-        else:
-            return float(timeoutSecs)
+        return proc.wait()
 
 # Defining main function
 def main():
     parser = argparse.ArgumentParser(description='Sobol Job Runner')
 
-    parser.add_argument('--csvDir', help='CSV dir with a todo.csv file', required=True, type=str)
+    work = parser.add_mutually_exclusive_group(required=True)
+    work.add_argument('--csvDir', help='CSV dir with a todo.csv file', type=str)
+    work.add_argument('--queue', help='SQLite work queue file to lease jobs from', type=str)
+    parser.add_argument('--cutoffFactor', help='Kill runs slower than this factor x the best xtime so far, 0 disables', 
+                        required=False, type=float, default=0.0)
+    parser.add_argument('--compactEvery', help='Num runs between folding the result journal (or the queue results) into complete.csv, 0 only does it at the end', 
+                        required=False, type=int, default=50)
+    parser.add_argument('--leaseSecs', help='How long a queue lease lasts without a heartbeat', 
+                        required=False, type=int, default=120)
+    parser.add_argument('--resultStore', help='SQLite result store to write the runs into', 
+                        required=False, type=str, default=DEFAULT_STORE_PATH)
+    parser.add_argument('--extrapolate', help='Kill runs whose progress output predicts they will pass their timeout (or cutoff)', 
+                        action='store_true')
     
     args = parser.parse_args()
     print('Got input args:', args)
 
-    runner = JobRunner(args.csvDir)
+    # the runs (and their thread placement) use the machine's cpus
+    applyAffinity()
+
+    if args.queue is not None:
+        runner = QueueWorker(args.queue, args.cutoffFactor, args.leaseSecs, args.compactEvery, 
+                             storePath=args.resultStore, extrapolate=args.extrapolate)
+    else:
+        runner = JobRunner(args.csvDir, args.cutoffFactor, args.compactEvery, args.resultStore, args.extrapolate)
     runner.doJobs()
 
     # if this program manages to get all the runs done, it should
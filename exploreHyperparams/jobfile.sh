@@ -3,7 +3,10 @@
 # this script auto-relaunches the runs if the desired
 # exit code is not returned by the doRunsOnNode.py script
 
-module load ${MOD_LOAD_PYTHON}
+# the local job system has no modules to load
+if [[ -n $MOD_LOAD_PYTHON ]]; then
+	module load ${MOD_LOAD_PYTHON}
+fi
 cd $PYTHON_SCRIPT_EXEC_DIR
 echo "Starting execution ${TODO_WORK_DIR}"
 pwd
@@ -15,7 +18,11 @@ if [[ -z $TODO_WORK_DIR ]]; then
  exit 1
 else
 	echo "executing work file -- xtimelimit: $XTIME_LIMIT minutes"
-	timeout ${XTIME_LIMIT}m python3 -u ./doRunsOnNode.py --csvDir ${TODO_WORK_DIR}
+	if [[ -n $WORK_QUEUE ]]; then
+		timeout ${XTIME_LIMIT}m python3 -u ./doRunsOnNode.py --queue ${WORK_QUEUE} --cutoffFactor ${CUTOFF_FACTOR:-0} ${RESULT_STORE:+--resultStore ${RESULT_STORE}} ${EXTRAPOLATE:+--extrapolate}
+	else
+		timeout ${XTIME_LIMIT}m python3 -u ./doRunsOnNode.py --csvDir ${TODO_WORK_DIR} --cutoffFactor ${CUTOFF_FACTOR:-0} ${RESULT_STORE:+--resultStore ${RESULT_STORE}} ${EXTRAPOLATE:+--extrapolate}
+	fi
 fi
 
 FINISH_WORK_EXIT_CODE=$?
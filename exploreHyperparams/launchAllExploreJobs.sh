@@ -11,21 +11,14 @@ probsizes=(lrgprob)
 for prob in "${probsizes[@]}"; do
 	for prog in "${progs[@]}"; do
 
-		# default is for small problem size (40 runs per node, 60 minutes each node)
-		jobsPerNode=500
+		# nodes get packed with as many runs as their estimated xtimes
+		# fit in timePerNode minutes, jobsPerNode=0 puts no cap on the count
+		jobsPerNode=0
 		timePerNode=480
 
-		if [ "$prob" = "medprob" ]; then
-			jobsPerNode=300
-			timePerNode=480
-		elif [ "$prob" = "lrgprob" ]; then
-			jobsPerNode=200
-			timePerNode=480
-		fi
-
 		printf "\n\n\n"
 		echo "launching ${prog} ${prob} with: ${jobsPerNode} ${timePerNode}"
-		python3 setupAndLaunchSbatchJobs.py --progName=${prog} --probSize=${prob} --numTrials=3 --jobsPerNode=${jobsPerNode} --nodeRuntime=${timePerNode}
+		python3 setupAndLaunchSbatchJobs.py --progName=${prog} --probSize=${prob} --numTrials=3 --packBy=runtime --jobsPerNode=${jobsPerNode} --nodeRuntime=${timePerNode}
 	done
 done
 
@@ -0,0 +1,74 @@
+import subprocess
+import threading
+import time
+import os
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+# jobfile.sh runs $PROPAGATE_CMD when its work isn't done yet. On a cluster
+# that resubmits the job, here PROPAGATE_CMD is 'exit <this code>' and the
+# pool gives the job a fresh allocation instead.
+LOCAL_RELAUNCH_EXIT_CODE = 112
+
+# Stand-in for sbatch/bsub that runs the same jobfile.sh work units on the
+# current machine. Each job is one "node allocation": it gets nodeRuntime
+# minutes before it gets killed (like a walltime kill, which doesn't
+# relaunch), and at most numSlots allocations run at the same time.
+# Output goes to each job's log file, appended across relaunches like
+# sbatch --open-mode=append.
+class LocalJobPool:
+
+    def __init__(self, numSlots, maxLaunches=1000):
+        self.numSlots = max(int(numSlots), 1)
+        self.maxLaunches = maxLaunches
+        self.jobs = []
+        self.printLock = threading.Lock()
+        return
+
+    # command is run with bash from cwd, env is its whole environment
+    def submit(self, command, env, logfile, nodeRuntime, cwd):
+        env = {**env, 'PROPAGATE_CMD': f'exit {LOCAL_RELAUNCH_EXIT_CODE}'}
+        self.jobs += [{'command': command, 'env': env, 'logfile': logfile,
+                       'nodeRuntime': float(nodeRuntime), 'cwd': cwd}]
+        return
+
+    def log(self, *args):
+        with self.printLock:
+            print(*args, flush=True)
+        return
+
+    def runJob(self, job):
+        os.makedirs(os.path.dirname(job['logfile']), exist_ok=True)
+
+        start = time.time()
+        for launch in range(1, self.maxLaunches+1):
+            with open(job['logfile'], 'a') as logfile:
+                # its own process group, so the walltime kill gets everything it started
+                proc = subprocess.Popen(['/bin/bash']+job['command'].split(), cwd=job['cwd'], env=job['env'],
+                                        stdout=logfile, stderr=subprocess.STDOUT, start_new_session=True)
+                try:
+                    exitcode = proc.wait(timeout=job['nodeRuntime']*60)
+                except subprocess.TimeoutExpired:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                    proc.wait()
+                    exitcode = None
+
+            if exitcode is None:
+                self.log('allocation hit its', job['nodeRuntime'], 'minute walltime:', job['logfile'])
+                break
+            if exitcode != LOCAL_RELAUNCH_EXIT_CODE:
+                break
+            self.log('relaunching', job['logfile'])
+
+        self.log('finished with exit code', exitcode, 'after', launch, 'allocations,',
+                 round(time.time()-start), 'seconds:', job['logfile'])
+        return exitcode, launch
+
+    # blocks until every submitted job is done, returns (exitcode, numLaunches)
+    # of each job -- a None exitcode means its last allocation hit walltime
+    def run(self):
+        print('running', len(self.jobs), 'jobs on', self.numSlots, 'local slots')
+        with ThreadPoolExecutor(max_workers=self.numSlots) as pool:
+            results = list(pool.map(self.runJob, self.jobs))
+        self.jobs = []
+        return results
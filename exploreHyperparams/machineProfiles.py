@@ -0,0 +1,217 @@
+import argparse
+import platform
+import json
+import glob
+import re
+import os
+
+# Generates the profile of a node type from its topology in sysfs, so new
+# machines can be swept without hand-writing their entries. It writes two
+# files into the machineProfiles dir at the top of the repo:
+#   <name>.json       the machines[] entry that both benchmarks.py files pick
+#                     up on hosts whose short name starts with its hostPrefix
+#   apolloProfile.h   the nthreads/sched/chunk tables apollo.h uses when the
+#                     build isn't for ruby or lassen. A checkout only holds
+#                     the binaries of one node type, so this is the header
+#                     of the last profile generated in it.
+# Run it on a compute node of the new machine, the login nodes can differ.
+
+ROOT_DIR = os.path.dirname(os.path.realpath(__file__))
+PROFILES_DIR = os.path.realpath(ROOT_DIR+'/../machineProfiles')
+SYSFS_DIR = '/sys/devices/system'
+
+# the schedule space is the same on every machine
+SCHEDULES = ['static']+[ a+','+str(b) for a in ['static', 'guided', 'dynamic'] for b in [1,4,8,32,64,128,256,512] ]
+APOLLO_SCHED_KINDS = ['static', 'dynamic', 'guided']
+
+
+# '0-3,8,10-11' -> [0,1,2,3,8,10,11]
+def parseCpuList(cpuList):
+    cpus = []
+    for part in cpuList.strip().split(','):
+        if part == '':
+            continue
+        first, _, last = part.partition('-')
+        cpus += list(range(int(first), int(last or first)+1))
+    return cpus
+
+
+def readSysfs(path, default=None):
+    try:
+        with open(path) as sysfsFile:
+            return sysfsFile.read().strip()
+    except OSError:
+        return default
+
+
+# '48K' -> 48
+def parseCacheSize(size):
+    units = {'K': 1, 'M': 1024, 'G': 1024*1024}
+    return int(size[:-1])*units[size[-1]] if size[-1] in units else int(size)//1024
+
+
+# returns the sockets (a dict of socket -> core -> cpus), the cpus of each
+# NUMA node and the caches, each with its level, type, size in KB and cpus
+def readTopology(sysfsDir=SYSFS_DIR):
+    cpus = parseCpuList(readSysfs(sysfsDir+'/cpu/online', '0'))
+
+    sockets = {}
+    caches = {}
+    for cpu in cpus:
+        cpuDir = sysfsDir+'/cpu/cpu'+str(cpu)
+        socket = int(readSysfs(cpuDir+'/topology/physical_package_id', 0))
+        core = int(readSysfs(cpuDir+'/topology/core_id', cpu))
+        sockets.setdefault(socket, {}).setdefault(core, []).append(cpu)
+
+        # a cache shared by several cpus shows up under each of them
+        for cacheDir in glob.glob(cpuDir+'/cache/index*'):
+            sharedCpus = tuple(parseCpuList(readSysfs(cacheDir+'/shared_cpu_list', str(cpu))))
+            level, kind = int(readSysfs(cacheDir+'/level')), readSysfs(cacheDir+'/type')
+            caches[(level, kind, sharedCpus)] = {'level': level, 'type': kind,
+                                                 'sizeKB': parseCacheSize(readSysfs(cacheDir+'/size')),
+                                                 'cpus': list(sharedCpus)}
+
+    # without NUMA support everything is one node
+    numaNodes = {}
+    for nodeDir in glob.glob(sysfsDir+'/node/node[0-9]*'):
+        nodeCpus = [cpu for cpu in parseCpuList(readSysfs(nodeDir+'/cpulist', '')) if cpu in cpus]
+        if len(nodeCpus) != 0:
+            numaNodes[int(re.search(r'\d+$', nodeDir).group())] = nodeCpus
+    if len(numaNodes) == 0:
+        numaNodes = {0: cpus}
+
+    return sockets, numaNodes, sorted(caches.values(), key=lambda cache: (cache['level'], cache['type'], cache['cpus']))
+
+
+# the first reservedCores cores of each socket are left to the OS and the
+# harness (like lassen's cpus 0-7 and 88-95), at least one core per socket
+# stays usable. Returns the usable and reserved cpus of each socket.
+def reserveCores(sockets, reservedCores):
+    usable, reserved = [], []
+    for socket,cores in sorted(sockets.items()):
+        coreCpus = [cpus for _,cpus in sorted(cores.items())]
+        numReserved = min(reservedCores, len(coreCpus)-1)
+        reserved += [sorted(cpu for cpus in coreCpus[:numReserved] for cpu in cpus)]
+        usable += [sorted(cpu for cpus in coreCpus[numReserved:] for cpu in cpus)]
+    return usable, reserved
+
+
+# steps of a quarter socket up to the whole node, plus the powers of two
+# from 4 below the first step. On ruby (2 sockets x 28 cores x 2 SMT)
+# without reserved cores that is its 4,8,14,28,...,112 ladder.
+def makeThreadLadder(usable):
+    numCpus = sum(len(cpus) for cpus in usable)
+    step = max(min(len(cpus) for cpus in usable)//4, 1)
+    ladder = set(range(step, numCpus+1, step)) | {numCpus}
+    power = 4
+    while power < step:
+        ladder.add(power)
+        power *= 2
+    return sorted(ladder)
+
+
+# threads, cores and sockets are always valid places. numa_domains and
+# ll_caches (OpenMP 5.1) only get swept when they split the node
+# differently than the sockets do.
+def makePlaces(sockets, numaNodes, caches):
+    places = ['threads', 'cores', 'sockets']
+    if len(numaNodes) != len(sockets):
+        places += ['numa_domains']
+
+    lastLevel = max([cache['level'] for cache in caches], default=0)
+    numLLCs = len([cache for cache in caches if cache['level'] == lastLevel])
+    if lastLevel != 0 and numLLCs != len(sockets) and numLLCs != len(numaNodes):
+        places += ['ll_caches']
+    return places
+
+
+def makeProfile(name, hostPrefix, sysfsDir, reservedCores, jobSystem, pythonModule):
+    sockets, numaNodes, caches = readTopology(sysfsDir)
+    usable, reserved = reserveCores(sockets, reservedCores)
+
+    cores = [cpus for _,socketCores in sorted(sockets.items()) for _,cpus in sorted(socketCores.items())]
+    summary = {'sockets': len(sockets),
+               'coresPerSocket': max(len(socketCores) for socketCores in sockets.values()),
+               'threadsPerCore': max(len(cpus) for cpus in cores),
+               'numaNodes': len(numaNodes),
+               # sizes of the caches (in KB) each cpu sees, e.g. 'L1-Data'
+               'cachesKB': {f"L{cache['level']}-{cache['type']}": cache['sizeKB'] for cache in caches}}
+
+    return {
+        'name': name,
+        'hostPrefix': hostPrefix,
+        'topology': summary,
+        'envvars': {
+            'OMP_NUM_THREADS': [str(a) for a in makeThreadLadder(usable)],
+            'OMP_PROC_BIND': ['close', 'spread'],
+            'OMP_PLACES': makePlaces(sockets, numaNodes, caches),
+            'OMP_SCHEDULE': SCHEDULES,
+        },
+        'affinity': [cpu for cpus in usable for cpu in cpus],
+        'reservedCpus': [cpu for cpus in reserved for cpu in cpus],
+        'pythonToModLoad': pythonModule,
+        # benchmarks.py fills in the job system's commands
+        'jobsystem': jobSystem,
+    }
+
+
+# the same tables apollo.h hard-codes for ruby and lassen
+def makeApolloHeader(profile):
+    chunks = sorted({int(sched.partition(',')[2]) for sched in SCHEDULES if ',' in sched})
+    topo = profile['topology']
+    return (f"// Generated by exploreHyperparams/machineProfiles.py for {profile['name']}: "
+            f"{topo['sockets']} sockets x {topo['coresPerSocket']} cores x {topo['threadsPerCore']} threads, "
+            f"{topo['numaNodes']} NUMA nodes\n"
+            f"static const int nthreads[] = {{{','.join(profile['envvars']['OMP_NUM_THREADS'])}}};\n"
+            f"static const omp_sched_t sched[] = {{{', '.join('omp_sched_'+kind for kind in APOLLO_SCHED_KINDS)}}};\n"
+            f"static const int chunk[] = {{{','.join(str(chunk) for chunk in [0]+chunks)}}};\n")
+
+
+def writeProfile(profile, outDir):
+    if not os.path.exists(outDir):
+        os.makedirs(outDir)
+
+    profilePath = outDir+'/'+profile['name']+'.json'
+    with open(profilePath, 'w') as profileFile:
+        json.dump(profile, profileFile, indent=4)
+
+    headerPath = outDir+'/apolloProfile.h'
+    with open(headerPath, 'w') as headerFile:
+        headerFile.write(makeApolloHeader(profile))
+
+    print('wrote', profilePath, 'and', headerPath)
+    return
+
+
+def main():
+    # e.g. dane1234 -> dane
+    hostPrefix = re.sub(r'\d+$', '', platform.uname().node.split('.')[0])
+
+    parser = argparse.ArgumentParser(description='Machine profile generator')
+
+    parser.add_argument('--name', help='Name of the machine profile', required=False, type=str, default=hostPrefix)
+    parser.add_argument('--hostPrefix', help='Hosts whose short name starts with this use the profile', required=False, type=str, default=hostPrefix)
+    parser.add_argument('--reservedCores', help='Num cores per socket left to the OS and the harness', required=False, type=int, default=1)
+    parser.add_argument('--jobSystem', help='Job system of the machine', required=False, type=str, default='local', choices=['slurm', 'lsf', 'local'])
+    parser.add_argument('--pythonModule', help='Python module to load in the jobs, if any', required=False, type=str, default='')
+    parser.add_argument('--sysfsDir', help='Where to read the topology from', required=False, type=str, default=SYSFS_DIR)
+    parser.add_argument('--outDir', help='Where to write the profile and the Apollo header', required=False, type=str, default=PROFILES_DIR)
+
+    args = parser.parse_args()
+    print('Got input args:', args)
+
+    if args.name in ['ruby', 'lassen', 'local'] or args.name == '':
+        raise ValueError('Machine profile name is taken or empty', args.name)
+    if args.hostPrefix == '':
+        raise ValueError('Empty host prefix would match every host')
+
+    profile = makeProfile(args.name, args.hostPrefix, args.sysfsDir, args.reservedCores,
+                          args.jobSystem, args.pythonModule)
+    print(json.dumps({key:profile[key] for key in ['topology', 'envvars']}, indent=4))
+    writeProfile(profile, args.outDir)
+
+    return
+
+
+if __name__ == "__main__":
+    main()
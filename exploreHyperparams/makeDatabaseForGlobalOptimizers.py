@@ -3,77 +3,77 @@
 import pandas as pd
 import numpy as np
 from benchmarks import *
-import glob
 import os, sys
+from resultStore import ResultStore, DEFAULT_STORE_PATH, importCSVTree
 
 
 # for each of the programs/prob sizes in the explorData directory,
 # load up all their CSV data
 
-MACHINE = 'lassen' if 'lassen' in ROOT_DIR else 'ruby'
+MACHINE = getMachine()
+if MACHINE in ['lassen', 'ruby']:
+	MACHINE = 'lassen' if 'lassen' in ROOT_DIR else 'ruby'
 
 print(ROOT_DIR)
-os.chdir(ROOT_DIR+'/explorData')
+
+# the runs of every sampling dir are in the result store, complete.csv
+# files it hasn't seen yet (e.g. sweeps from before it) get imported first
+store = ResultStore(DEFAULT_STORE_PATH)
+importCSVTree(store, ROOT_DIR+'/explorData')
 
 # extract the names and problem sizes of the done codes
-dirs = list(os.listdir())
+dirs = [dir for dir in os.listdir(ROOT_DIR+'/explorData') if os.path.isdir(ROOT_DIR+'/explorData/'+dir)]
 
 dirs.sort()
 
-globalDataset = pd.DataFrame()
+completeProgSizes = []
 
 for dir in dirs:
 	progname = dir.split('-')[0]
 	probsize = dir.split('-')[1]
 
-	allJobs = glob.glob('./'+dir+'/allUniquePointsToSample.csv')[0]
-	doneFiles = glob.glob('./'+dir+'/*/complete.csv')
-
-	allData = pd.read_csv(allJobs)
-
-	doneData = pd.DataFrame(columns=['xtime']+list(allData.columns))
-
-	donefilelist = []
-	# join all the done files into one csv
-	for doneFile in doneFiles:
-		comp = pd.read_csv(doneFile)
-		donefilelist += [comp]
-
-	doneData = pd.concat([doneData]+donefilelist, ignore_index=True)
-
-	doneData = doneData.reset_index(drop=True)
-
-	# we remove this line just to get the plots up
-	doneData = doneData[doneData['xtime'] != -1.0]
+	# one header line and a line per point to sample
+	with open(ROOT_DIR+'/explorData/'+dir+'/allUniquePointsToSample.csv') as allJobs:
+		numPoints = sum(1 for line in allJobs) - 1
 
+	# the -1 xtimes don't count, they still need to be re-run
+	numDone = store.countRuns(progname, probsize)
 
 	# if we have all the data, let's analyze it
-	if doneData.shape[0] == allData.shape[0]:
-		# some of the runs didn't get the schedule chunk-size of 4.
-		# they must be some newer runs we forgot about, so we're dropping them
-		# we're not including them in the analysis or the final report
-		doneData = doneData[(doneData['OMP_SCHEDULE'] != 'static,4' ) & 
-							          (doneData['OMP_SCHEDULE'] != 'dynamic,4') &
-							          (doneData['OMP_SCHEDULE'] != 'guided,4' ) ]
+	if numDone == numPoints:
 		print(progname, probsize, end='\t')
-		print(doneData.shape, allData.shape, 'all samples collected!')
-		globalDataset = pd.concat([globalDataset, doneData], ignore_index=True)
+		print(numDone, numPoints, 'all samples collected!')
+		completeProgSizes += [(progname, probsize)]
 	else:
 		print('\t', progname, probsize, end='\t')
-		print('incomplete data! Collected', doneData.shape[0], '/', allData.shape[0], 'samples')
+		print('incomplete data! Collected', numDone, '/', numPoints, 'samples')
 
 
+# average out the xtimes of each config - include a column for stddev.
+# A config with any censored trial is censored and keeps its largest
+# xtime, see ResultStore.getAggregates
+# some of the runs didn't get the schedule chunk-size of 4.
+# they must be some newer runs we forgot about, so we're dropping them
+# we're not including them in the analysis or the final report
+avrgd = store.getAggregates(completeProgSizes, {'OMP_SCHEDULE': ['static,4', 'dynamic,4', 'guided,4']})
 
-# now that we've read in all the results, let's save them to a file
-print(globalDataset.shape, globalDataset.columns)
-#print(globalDataset.head(), globalDataset.tail())
+# runs whose output failed its check have no xtime to go by, a config with
+# nothing but those counts as (censored) timing out, like it does when
+# tuning live, so the optimizers steer away from it
+for progname, probsize in completeProgSizes:
+	print(progname, probsize, store.countInvalidRuns(progname, probsize), 'invalid runs')
+store.close()
 
-# group and average out all the xtimes - include a column for stddev
-hparams = list(globalDataset.columns)
-hparams.remove('xtime')
+invalid = avrgd['invalid'].to_numpy(dtype=bool)
+timeouts = [float(progs[prog]['timeout'][size]) for prog,size in zip(avrgd['progname'][invalid], avrgd['probsize'][invalid])]
+avrgd.loc[invalid, 'xtime'] = timeouts
+avrgd.loc[invalid, 'censored'] = True
+avrgd = avrgd.drop(columns=['invalid'])
+print('invalid configs', int(invalid.sum()), '/', avrgd.shape[0], '-- counted as timeouts')
 
-avrgd = globalDataset.groupby(hparams).mean().reset_index()
-avrgd['stddev'] = globalDataset.groupby(hparams).std().reset_index()['xtime']
+print(avrgd.shape, avrgd.columns)
+
+print('censored configs', avrgd['censored'].sum(), '/', avrgd.shape[0])
 
 print(avrgd.tail())
 
@@ -82,8 +82,15 @@ print('OMP_PROC_BIND unique', len(list(avrgd['OMP_PROC_BIND'].unique())))
 print('OMP_PLACES unique', len(list(avrgd['OMP_PLACES'].unique())))
 print('OMP_SCHEDULE unique', len(list(avrgd['OMP_SCHEDULE'].unique())))
 
-# need to then copy this file over to the exploreGlobalOptimizations/databases directory
-avrgd.to_csv(ROOT_DIR+'/'+MACHINE+'-fullExploreDataset.csv', index=False)
+# need to then copy this file over to the exploreGlobalOptimizations/databases directory,
+# along with the dir of its precompiled (prog, probsize) slices
+databaseCSV = ROOT_DIR+'/'+MACHINE+'-fullExploreDataset.csv'
+avrgd.to_csv(databaseCSV, index=False)
+
+# the optimizers memory-map these instead of parsing the CSV, see databaseArtifacts.py
+sys.path.append(ROOT_DIR+'/../exploreGlobalOptimizations')
+from databaseArtifacts import writeDatabaseArtifacts
+writeDatabaseArtifacts(avrgd, databaseCSV)
 #globalDataset.to_csv(ROOT_DIR+'/'+MACHINE+'-fullExplorDataset.csv', index=False)
 
 
@@ -0,0 +1,379 @@
+import sqlite3
+import argparse
+import json
+import zlib
+import glob
+import time
+import os
+import numpy as np
+import pandas as pd
+from contextlib import contextmanager
+
+# the store every doRunsOnNode.py writes its runs into, next to the sampling dirs
+DEFAULT_STORE_PATH = os.path.dirname(os.path.realpath(__file__))+'/explorData/results.sqlite'
+
+# One SQLite file holding the runs of every sampling dir, so the launcher
+# and the database builder query it instead of globbing and re-reading all
+# the complete.csv files. Each run is keyed by where it came from (the
+# job dir or queue file) and its job id there (the todo.csv row of a job
+# dir's run, see doRunsOnNode.assignJobIds), so writing the same run
+# again (a re-run of a -1 job, a node replaying its journal, an import of
+# an old complete.csv) replaces it instead of adding a trial.
+#
+# Invalid runs (their output failed its check, see
+# ProgRunner.runProgChecked) count as done but stay out of the xtimes.
+#
+# The knob columns get NUMERIC affinity: OMP_NUM_THREADS comes back as an
+# int like it does from pd.read_csv, and sorts like one.
+#
+# Triggers fold every run into per-config running sums (configStats) as it
+# gets written, and fold it back out when it gets replaced, so aggregating
+# takes time proportional to the num of configs instead of the num of runs.
+# The sums are shifted by one xtime of the config: the variance from sums
+# of squares loses everything on trials with near identical xtimes
+# otherwise.
+#
+# Same locking caveats as the work queue: fine on local disks and on
+# Lustre/GPFS mounted with flock support, not on plain NFS.
+class ResultStore:
+
+    def __init__(self, storePath=DEFAULT_STORE_PATH, knobs=(), timeoutSecs=60):
+        self.storePath = storePath
+        self.conn = sqlite3.connect(storePath, timeout=timeoutSecs, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+
+        with self.transaction() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS runs (
+                                source TEXT, job INTEGER,
+                                progname TEXT, probsize TEXT,
+                                xtime REAL, censored INTEGER, invalid INTEGER DEFAULT 0, finished REAL,
+                                PRIMARY KEY (source, job))''')
+            conn.execute('''CREATE TABLE IF NOT EXISTS importedFiles (
+                                source TEXT PRIMARY KEY, size INTEGER, mtime REAL, hash TEXT)''')
+
+            # stores from before complete.csv had a job column keyed the runs
+            # of job dirs by their row in complete.csv, which isn't their
+            # todo job. Those runs get dropped along with the import manifest,
+            # importCSVTree and the nodes add them back under their job ids.
+            if conn.execute('PRAGMA user_version').fetchone()[0] < 1:
+                dirSources = [row['source'] for row in conn.execute('SELECT DISTINCT source FROM runs')
+                              if not os.path.isfile(row['source'])]
+                conn.executemany('DELETE FROM runs WHERE source=?', [(source,) for source in dirSources])
+                conn.execute('DELETE FROM importedFiles')
+                conn.execute('PRAGMA user_version = 1')
+                if len(dirSources) != 0:
+                    print('dropped the runs of', len(dirSources), 'job dirs keyed by row, the next import re-adds them')
+
+            # stores from before the invalid flag get the column, their
+            # running sums get rebuilt to count the invalid runs apart
+            if conn.execute('PRAGMA user_version').fetchone()[0] < 2:
+                cols = [row['name'] for row in conn.execute('PRAGMA table_info(runs)')]
+                if 'invalid' not in cols:
+                    conn.execute('ALTER TABLE runs ADD COLUMN invalid INTEGER DEFAULT 0')
+                conn.execute('PRAGMA user_version = 2')
+                self.rebuildConfigStats(conn)
+
+        self.addKnobs(knobs)
+        return
+
+    # BEGIN IMMEDIATE takes the write lock up front, see WorkQueue
+    @contextmanager
+    def transaction(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield self.conn
+        except:
+            self.conn.execute('ROLLBACK')
+            raise
+        self.conn.execute('COMMIT')
+        return
+
+    def close(self):
+        self.conn.close()
+        return
+
+    # other writers can add knobs, so this always asks the table
+    @property
+    def knobs(self):
+        cols = [row['name'] for row in self.conn.execute('PRAGMA table_info(runs)')]
+        return [col for col in cols if col not in ['source', 'job', 'progname', 'probsize', 'xtime', 'censored', 'invalid', 'finished']]
+
+    # knob columns get added the first time a run sets them, the
+    # (progname, probsize, knobs) index gets rebuilt to cover them
+    def addKnobs(self, knobs):
+        known = self.knobs
+        if all(knob in known for knob in knobs):
+            return
+
+        with self.transaction() as conn:
+            # another writer may have added them since we looked
+            known = self.knobs
+            newKnobs = [knob for knob in knobs if knob not in known]
+            if len(newKnobs) == 0:
+                return
+            for knob in newKnobs:
+                conn.execute(f'ALTER TABLE runs ADD COLUMN "{knob}" NUMERIC')
+            conn.execute('DROP INDEX IF EXISTS runsByConfig')
+            conn.execute(f'CREATE INDEX runsByConfig ON runs ({self.configCols()})')
+
+            # the new knobs are part of every config's key
+            self.rebuildConfigStats(conn)
+        return
+
+    # key of a config in configStats
+    def configKey(self, prefix=''):
+        return ' || char(31) || '.join(f"IFNULL({prefix}\"{col}\", '')" for col in ['progname', 'probsize']+self.knobs)
+
+    # recomputes the running sums of every config from scratch and (re)creates
+    # the triggers that keep them up to date, the caller holds the transaction
+    def rebuildConfigStats(self, conn):
+        conn.execute('DROP TRIGGER IF EXISTS foldRun')
+        conn.execute('DROP TRIGGER IF EXISTS unfoldRun')
+        conn.execute('DROP TABLE IF EXISTS configStats')
+
+        knobCols = ''.join(f', "{knob}" NUMERIC' for knob in self.knobs)
+        conn.execute(f'''CREATE TABLE configStats (
+                             configKey TEXT PRIMARY KEY, progname TEXT, probsize TEXT{knobCols},
+                             shift REAL, numRuns INTEGER, sumDiff REAL, sumSqDiff REAL,
+                             maxXtime REAL, numCensored INTEGER, numInvalid INTEGER)''')
+
+        statsCols = f'configKey, {self.configCols()}, shift, numRuns, sumDiff, sumSqDiff, maxXtime, numCensored, numInvalid'
+
+        # invalid runs only add to numInvalid, a config with nothing but
+        # invalid runs has numRuns 0 and a -1 maxXtime
+        conn.execute(f'''WITH keyed AS (SELECT {self.configKey()} AS configKey, * FROM runs WHERE xtime != -1),
+                              shifts AS (SELECT configKey, MIN(xtime) AS shift FROM keyed GROUP BY configKey)
+                         INSERT INTO configStats ({statsCols})
+                         SELECT k.configKey, {self.configCols('k.')}, s.shift, SUM(1-k.invalid), SUM((1-k.invalid)*(k.xtime-s.shift)),
+                                SUM((1-k.invalid)*(k.xtime-s.shift)*(k.xtime-s.shift)),
+                                MAX(CASE WHEN k.invalid THEN -1 ELSE k.xtime END), SUM(k.censored), SUM(k.invalid)
+                         FROM keyed k JOIN shifts s ON k.configKey = s.configKey GROUP BY k.configKey''')
+
+        # -1 xtimes still need to be re-run, they aren't part of any aggregate
+        conn.execute(f'''CREATE TRIGGER foldRun AFTER INSERT ON runs WHEN new.xtime != -1 BEGIN
+                             INSERT OR IGNORE INTO configStats ({statsCols})
+                             VALUES ({self.configKey('new.')}, {self.configCols('new.')}, new.xtime, 0, 0.0, 0.0, -1, 0, 0);
+                             UPDATE configStats SET numRuns=numRuns+1-new.invalid, sumDiff=sumDiff+(1-new.invalid)*(new.xtime-shift),
+                                                    sumSqDiff=sumSqDiff+(1-new.invalid)*(new.xtime-shift)*(new.xtime-shift),
+                                                    maxXtime=MAX(maxXtime, CASE WHEN new.invalid THEN -1 ELSE new.xtime END),
+                                                    numCensored=numCensored+new.censored, numInvalid=numInvalid+new.invalid
+                             WHERE configKey={self.configKey('new.')};
+                         END''')
+
+        # the max can't be unfolded, it gets looked up again in the runs index
+        sameConfig = ' AND '.join(f'"{col}" IS old."{col}"' for col in ['progname', 'probsize']+self.knobs)
+        conn.execute(f'''CREATE TRIGGER unfoldRun AFTER DELETE ON runs WHEN old.xtime != -1 BEGIN
+                             UPDATE configStats SET numRuns=numRuns-1+old.invalid, sumDiff=sumDiff-(1-old.invalid)*(old.xtime-shift),
+                                                    sumSqDiff=sumSqDiff-(1-old.invalid)*(old.xtime-shift)*(old.xtime-shift),
+                                                    numCensored=numCensored-old.censored, numInvalid=numInvalid-old.invalid,
+                                                    maxXtime=IFNULL((SELECT MAX(xtime) FROM runs WHERE {sameConfig} AND xtime != -1 AND invalid=0), -1)
+                             WHERE configKey={self.configKey('old.')};
+                             DELETE FROM configStats WHERE configKey={self.configKey('old.')} AND numRuns+numInvalid <= 0;
+                         END''')
+        return
+
+    # quoted column list of a config: progname, probsize and the knobs
+    def configCols(self, prefix=''):
+        return ', '.join(f'{prefix}"{col}"' for col in ['progname', 'probsize']+self.knobs)
+
+    # df has job, xtime, progname, probsize, the knob columns and
+    # optionally censored and invalid (False where missing)
+    def addRuns(self, df, source):
+        if 'job' not in df.columns:
+            raise ValueError('Runs need a job column to be keyed on', list(df.columns))
+
+        df = df.reset_index(drop=True)
+        knobs = [col for col in df.columns if col not in ['job', 'xtime', 'censored', 'invalid', 'progname', 'probsize']]
+        self.addKnobs(knobs)
+
+        jobs = df['job']
+        censored = df['censored'] if 'censored' in df.columns else pd.Series(False, index=df.index)
+        invalid = df['invalid'] if 'invalid' in df.columns else pd.Series(False, index=df.index)
+
+        cols = ['source', 'job', 'progname', 'probsize', 'xtime', 'censored', 'invalid', 'finished']+knobs
+        rows = list(zip([source]*df.shape[0], jobs.astype(int).tolist(), df['progname'].tolist(), df['probsize'].tolist(),
+                        df['xtime'].astype(float).tolist(), censored.eq(True).astype(int).tolist(), invalid.eq(True).astype(int).tolist(),
+                        [time.time()]*df.shape[0], *[df[knob].tolist() for knob in knobs]))
+
+        # an explicit delete instead of INSERT OR REPLACE, so the old run
+        # gets unfolded (REPLACE only fires delete triggers with
+        # recursive_triggers on)
+        quoted = ', '.join(f'"{col}"' for col in cols)
+        with self.transaction() as conn:
+            conn.executemany('DELETE FROM runs WHERE source=? AND job=?', [row[:2] for row in rows])
+            conn.executemany(f'INSERT INTO runs ({quoted}) VALUES ({", ".join(["?"]*len(cols))})', rows)
+        return
+
+    def addRun(self, source, job, record):
+        self.addRuns(pd.DataFrame([{'job': job, **record}]), source)
+        return
+
+    # the runs of a (progname, probsize) in the complete.csv layout, without
+    # the -1 xtimes that still need to be re-run
+    def getRuns(self, progname, probsize):
+        return pd.read_sql(f'''SELECT xtime, censored, invalid, {self.configCols()} FROM runs
+                               WHERE progname=? AND probsize=? AND xtime != -1 ORDER BY source, job''',
+                           self.conn, params=(progname, probsize)).astype({'censored': bool, 'invalid': bool})
+
+    # num done runs, invalid ones included
+    def countRuns(self, progname, probsize):
+        return self.conn.execute('SELECT IFNULL(SUM(numRuns+numInvalid), 0) FROM configStats WHERE progname=? AND probsize=?',
+                                 (progname, probsize)).fetchone()[0]
+
+    def countInvalidRuns(self, progname, probsize):
+        return self.conn.execute('SELECT IFNULL(SUM(numInvalid), 0) FROM configStats WHERE progname=? AND probsize=?',
+                                 (progname, probsize)).fetchone()[0]
+
+    def getProgSizes(self):
+        return [(row['progname'], row['probsize']) for row in
+                self.conn.execute('SELECT DISTINCT progname, probsize FROM configStats ORDER BY progname, probsize')]
+
+    # best uncensored, valid xtime of each (progname, probsize)
+    def getBestXtimes(self):
+        rows = self.conn.execute('''SELECT progname, probsize, MIN(xtime) AS best FROM runs
+                                    WHERE censored=0 AND invalid=0 AND xtime > 0 GROUP BY progname, probsize''')
+        return {(row['progname'], row['probsize']):row['best'] for row in rows}
+
+    # per config of the given (progname, probsize) pairs: the mean xtime of
+    # its trials and their stddev. A config with any censored trial is
+    # censored, averaging lower bounds with real xtimes means nothing so it
+    # keeps its largest lower bound. The invalid runs are left out, a config
+    # with nothing but invalid runs gets a NaN xtime and is flagged invalid.
+    # Configs with a knob value in excludeKnobs ({knob: [values]}) are left out.
+    def getAggregates(self, progSizes, excludeKnobs={}):
+        if len(progSizes) == 0:
+            return pd.DataFrame(columns=['progname', 'probsize']+self.knobs+['xtime', 'stddev', 'censored', 'invalid'])
+
+        where = ['('+' OR '.join(['(progname=? AND probsize=?)']*len(progSizes))+')']
+        params = [val for progSize in progSizes for val in progSize]
+        for knob,values in excludeKnobs.items():
+            where += [f'"{knob}" NOT IN ('+', '.join(['?']*len(values))+')']
+            params += list(values)
+
+        stats = pd.read_sql(f'''SELECT {self.configCols()}, shift, numRuns, sumDiff, sumSqDiff, maxXtime, numCensored, numInvalid
+                                FROM configStats WHERE {' AND '.join(where)} ORDER BY {self.configCols()}''',
+                            self.conn, params=params)
+
+        numRuns = stats['numRuns'].astype(float).where(stats['numRuns'] > 0)
+        meanXtimes = stats['shift'] + stats['sumDiff'] / numRuns
+        variances = (stats['sumSqDiff'] - stats['sumDiff']**2 / numRuns) / (numRuns - 1)
+
+        aggregates = stats[['progname', 'probsize']+self.knobs].copy()
+        aggregates['censored'] = stats['numCensored'] > 0
+        aggregates['xtime'] = meanXtimes.where(~aggregates['censored'], stats['maxXtime'])
+        # a single trial has no stddev, like pandas' std
+        aggregates['stddev'] = np.sqrt(variances.clip(lower=0).where(numRuns > 1))
+        aggregates['invalid'] = stats['numRuns'] == 0
+        return aggregates[['progname', 'probsize']+self.knobs+['xtime', 'stddev', 'censored', 'invalid']]
+
+    # size, mtime and crc32 of the files a source got imported from
+    def getImportedFingerprint(self, source):
+        row = self.conn.execute('SELECT size, mtime, hash FROM importedFiles WHERE source=?', (source,)).fetchone()
+        return None if row is None else tuple(row)
+
+    def setImportedFingerprint(self, source, size, mtime, hash):
+        with self.transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO importedFiles (source, size, mtime, hash) VALUES (?, ?, ?, ?)',
+                         (source, size, mtime, hash))
+        return
+
+
+# crc32 of the contents of files, read 1MB at a time
+def hashFiles(files):
+    crc = 0
+    for path in files:
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(1 << 20)
+                if len(block) == 0:
+                    break
+                crc = zlib.crc32(block, crc)
+    return '%08x' % crc
+
+
+# Import of an existing explorData tree: every job dir's complete.csv (plus
+# its result journal) and every work queue's done jobs. The keys are the
+# ones doRunsOnNode.py uses, so importing twice, or importing dirs whose
+# nodes are still running, doesn't double count. The size, mtime and hash
+# of each source's files go in a manifest, re-imports only read the
+# sources whose files changed since.
+def importCSVTree(store, explorDataDir):
+    from doRunsOnNode import readCompleteCSV, getJournalPath
+    from benchmarks import progs
+
+    numUnchanged = 0
+    for completeCSV in sorted(glob.glob(explorDataDir+'/*/*/complete.csv')):
+        csvDir = os.path.dirname(os.path.abspath(completeCSV))
+
+        queuePath = csvDir+'/workQueue.sqlite'
+        if os.path.exists(queuePath):
+            source, inputs = queuePath, [queuePath]
+        else:
+            source, inputs = csvDir, [path for path in [completeCSV, getJournalPath(completeCSV)] if os.path.exists(path)]
+
+        # the hash only gets computed when the size or mtime changed
+        size = sum(os.path.getsize(path) for path in inputs)
+        mtime = max(os.path.getmtime(path) for path in inputs)
+        imported = store.getImportedFingerprint(source)
+        if imported is not None and imported[:2] == (size, mtime):
+            numUnchanged += 1
+            continue
+        hash = hashFiles(inputs)
+        if imported is not None and imported[2] == hash:
+            store.setImportedFingerprint(source, size, mtime, hash)
+            numUnchanged += 1
+            continue
+
+        if source == queuePath:
+            queueConn = sqlite3.connect(queuePath)
+            df = pd.read_sql("SELECT * FROM jobs WHERE status='done'", queueConn)
+            queueConn.close()
+            # queues from before the invalid flag
+            if 'invalid' not in df.columns:
+                df['invalid'] = 0
+            envvars = pd.DataFrame(df['envvars'].map(json.loads).tolist())
+            df = pd.concat([df[['id', 'progname', 'probsize', 'xtime', 'censored', 'invalid']].rename(columns={'id': 'job'}), envvars], axis=1)
+        else:
+            df = readCompleteCSV(completeCSV)
+
+        if df.shape[0] == 0:
+            continue
+
+        # older complete.csv files don't have the column, for those only
+        # the runs that hit the timeout are censored
+        if 'censored' not in df.columns or df['censored'].isna().any():
+            timeouts = np.array([float(progs[prog]['timeout'][size]) for prog,size in zip(df['progname'], df['probsize'])])
+            fill = df['xtime'].astype(float).to_numpy() >= timeouts
+            censored = df['censored'] if 'censored' in df.columns else pd.Series(np.nan, index=df.index)
+            df['censored'] = censored.astype(object).where(censored.notna(), fill).astype(bool)
+
+        store.addRuns(df, source)
+        store.setImportedFingerprint(source, size, mtime, hash)
+        print('imported', df.shape[0], 'runs from', source)
+
+    print('skipped', numUnchanged, 'unchanged sources')
+    return
+
+
+# Defining main function
+def main():
+    parser = argparse.ArgumentParser(description='Import the complete.csv files of an explorData tree into the result store')
+
+    parser.add_argument('--explorData', help='explorData dir to import', type=str,
+                        default=os.path.dirname(DEFAULT_STORE_PATH))
+    parser.add_argument('--resultStore', help='SQLite result store to import into', type=str, default=DEFAULT_STORE_PATH)
+
+    args = parser.parse_args()
+    print('Got input args:', args)
+
+    store = ResultStore(args.resultStore)
+    importCSVTree(store, args.explorData)
+    for progname, probsize in store.getProgSizes():
+        print(progname, probsize, store.countRuns(progname, probsize), 'runs')
+    store.close()
+
+    return
+
+
+if __name__=="__main__":
+    main()
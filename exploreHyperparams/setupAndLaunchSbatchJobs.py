@@ -5,56 +5,136 @@ import time
 import os, sys
 import re
 from benchmarks import *
+from resultStore import ResultStore, DEFAULT_STORE_PATH, importCSVTree
+from workQueue import WorkQueue
+from localJobSystem import LocalJobPool
 import numpy as np
 import pandas as pd
 import math
 import glob
-from itertools import product
+
+
+# encodes every row of df into one integer key per config: the codes of its
+# values among the (sorted) levels of each col, combined mixed-radix, so the
+# keys order the same way as sorting the rows by cols does. Rows with a
+# value that isn't one of the levels get -1.
+def encodeConfigs(df, cols, levels):
+    keys = np.zeros(df.shape[0], dtype=np.int64)
+    planned = np.ones(df.shape[0], dtype=bool)
+    for col,colLevels in zip(cols, levels):
+        codes = pd.Index(colLevels).get_indexer(df[col])
+        planned &= codes >= 0
+        keys = keys * len(colLevels) + codes
+    return np.where(planned, keys, -1)
 
 
 # generate the samples we want to take
+# Points are never materialized as a whole: point i of the cartesian
+# product of the knobs (with every config repeated numTrials times in a
+# row) is decoded from its flat index, so any range or subset of points
+# can be built with a few vectorized index operations.
 class SamplesManager:
-    def __init__(self, progname, probsize):
+    def __init__(self, progname, probsize, numTrials=1):
         self.progname = progname
         self.probsize = probsize
-        return
-
-    def generatePointsToSample(self):
-        envvars = machines[MACHINE]['envvars']
-
-        # let's make all the combinations of envvars
-        toexpand = list(envvars.values())
-        combos = list(product(*toexpand))
-        #print(len(combos))
+        self.numTrials = numTrials
 
         # based on the machine, make the columns of hyperparameters
-        hparams = list(envvars.keys())
-        cols = ['progname', 'probsize'] + hparams
-        df = pd.DataFrame(columns=cols)
-        #print(df.columns)
+        envvars = machines[getMachine()]['envvars']
+        self.hparams = list(envvars.keys())
+        self.cols = ['progname', 'probsize'] + self.hparams
 
-        # now populate the dataframe
-        for combo in combos:
-            vals = [self.progname, self.probsize]+list(combo)
-            toappend = pd.DataFrame([dict(zip(cols, vals))])
-            df = pd.concat([df, toappend], ignore_index=True)
+        # the levels of each knob are sorted (as strings), so that points
+        # come out in flat index order sorted by the hparams
+        self.levels = [np.array(sorted(envvars[hparam]), dtype=object) for hparam in self.hparams]
+        self.dims = [len(levels) for levels in self.levels]
 
-        df = df.reset_index()
-        #print(df.shape)
-        #print(df.head())
-        #print(df.tail())
+        self.numConfigs = int(np.prod(self.dims, dtype=np.int64))
+        self.numPoints = self.numConfigs * self.numTrials
+        return
+
+    # flat point indices -> (config index, trial number)
+    def splitIndices(self, pointIdxs):
+        return np.divmod(np.asarray(pointIdxs, dtype=np.int64), self.numTrials)
+
+    def pointsFromIndices(self, pointIdxs):
+        configIdxs, _ = self.splitIndices(pointIdxs)
+        knobIdxs = np.unravel_index(configIdxs, self.dims)
+
+        df = {'progname': np.full(len(configIdxs), self.progname, dtype=object),
+              'probsize': np.full(len(configIdxs), self.probsize, dtype=object)}
+        for hparam,levels,idxs in zip(self.hparams, self.levels, knobIdxs):
+            df[hparam] = levels[idxs]
+        return pd.DataFrame(df, columns=self.cols)
+
+    # streams the points (all of them, or just pointIdxs) chunkSize rows at a time
+    def iterPointChunks(self, chunkSize, pointIdxs=None):
+        numPoints = self.numPoints if pointIdxs is None else len(pointIdxs)
+        for start in range(0, numPoints, chunkSize):
+            stop = min(start + chunkSize, numPoints)
+            if pointIdxs is None:
+                yield self.pointsFromIndices(np.arange(start, stop))
+            else:
+                yield self.pointsFromIndices(pointIdxs[start:stop])
+        return
 
-        return df
+    # config index of each row of df, -1 for rows that aren't one of our
+    # points. progname and probsize have one level each, so the keys of
+    # encodeConfigs are the config indices.
+    def configIndices(self, df):
+        levels = [np.array([self.progname], dtype=object), np.array([self.probsize], dtype=object)] + self.levels
+        return encodeConfigs(df[self.cols].astype(str), self.cols, levels)
+
+    # a config planned numTrials times with m completed runs still needs its
+    # last numTrials-m trials, returns their flat point indices in order.
+    # The completed runs get counted per config with a bincount of their keys.
+    def remainingPointIndices(self, completedDF):
+        configIdxs = self.configIndices(completedDF)
+        numDone = np.bincount(configIdxs[configIdxs >= 0], minlength=self.numConfigs)
+        firstTodo = np.minimum(numDone, self.numTrials)
+
+        numTodo = self.numTrials - firstTodo
+        configs = np.repeat(np.arange(self.numConfigs, dtype=np.int64), numTodo)
+
+        # trial numbers count up from firstTodo within each config
+        starts = np.cumsum(numTodo) - numTodo
+        trials = np.arange(len(configs)) - np.repeat(starts, numTodo) + np.repeat(firstTodo, numTodo)
+        return configs * self.numTrials + trials
 
 class JobManager:
 
-    def __init__(self, progname, probsize, nodeRuntime, jobsPerNode, numTrials, useDebugNodes):
+    # num rows per write when streaming out the sample points
+    CHUNK_SIZE = 100000
+
+    # seconds each run costs on top of its xtime (program startup, output parsing, journaling)
+    RUN_OVERHEAD_SECS = 5
+
+    # nodes get packed up to this fraction of their runtime to absorb estimation error
+    NODE_FILL_FRACTION = 0.85
+
+    # packBy 'count' puts jobsPerNode jobs on each node, 'runtime' packs each
+    # node with as many jobs as its estimated runtimes fit in nodeRuntime
+    # (jobsPerNode is then a cap on the jobs per node, 0 for no cap)
+    # with useQueue, the nodes all drain one shared work queue (see workQueue.py)
+    # instead of each getting its own todo.csv, the packing only decides
+    # how many nodes get launched
+    # completed runs come from the result store (see resultStore.py) the nodes write into
+    # with extrapolate, the nodes kill runs their progress output says will time out
+    def __init__(self, progname, probsize, nodeRuntime, jobsPerNode, numTrials, useDebugNodes, cutoffFactor=0.0,
+                 packBy='count', database=None, useQueue=False, storePath=DEFAULT_STORE_PATH, extrapolate=False):
         self.progname = progname
         self.probsize = probsize
         self.nodeRuntime = nodeRuntime
         self.jobsPerNode = jobsPerNode
+        self.packBy = packBy
+        self.database = database
         self.numTrials = numTrials
         self.useDebugNodes = useDebugNodes
+        self.cutoffFactor = cutoffFactor
+        self.useQueue = useQueue
+        self.queuePath = None
+        self.storePath = storePath
+        self.extrapolate = extrapolate
         self.runDirs = []
 
         self.samplingDir = ROOT_DIR+'/explorData/'+progname+'-'+probsize
@@ -65,58 +145,104 @@ class JobManager:
         if not os.path.exists(self.samplingDir):
             os.mkdir(self.samplingDir)
 
-        self.samplMan = SamplesManager(progname, probsize)
-        self.uniquePointsDF = self.samplMan.generatePointsToSample()
+        self.samplMan = SamplesManager(progname, probsize, numTrials)
 
-        self.pointsDF = self.setupSamplingFile()
-
-        # check whether the main CSV file already exists, if it matches this shape
-        # ignore writing it out
+        # streamed out in chunks, the points only ever exist one chunk at a time
         CSVFile = self.samplingDir+'/allUniquePointsToSample.csv'
-        #if (not os.path.isfile(CSVFile)) or ((os.path.isfile(CSVFile)) and (pd.read_csv(CSVFile).shape[0] != self.pointsDF.shape[0])):
-
-        self.pointsDF.to_csv(CSVFile, index=False)
-        print('wrote sample points CSV to:', CSVFile)
+        for idx,chunk in enumerate(self.samplMan.iterPointChunks(self.CHUNK_SIZE)):
+            chunk.to_csv(CSVFile, index=False, mode='w' if idx == 0 else 'a', header=(idx == 0))
+        print('wrote', self.samplMan.numPoints, 'sample points CSV to:', CSVFile)
 
         # create a unique timestamp for the directory names to avoid overwriting
         self.timestamp = str(int(time.time()))
 
         return
 
-    def setupSamplingFile(self):
-
-        df = self.uniquePointsDF.copy(deep=True)
-
-        # let's make a new df with the repeated trials
-        for i in range(self.numTrials-1):
-            df = pd.concat([df, self.uniquePointsDF], ignore_index=True)
-
-        hparams = list(machines[MACHINE]['envvars'].keys())
-        df = df.sort_values(by=hparams)
-        df = df.reset_index()
-
-        df = df[['progname', 'probsize']+hparams]
-
-        return df
+    # estimated xtime of every config, from (in order of preference) its own
+    # runs in the database and the completed runs of this sampling dir, the
+    # runs with the same OMP_NUM_THREADS, any run of this program, or the timeout
+    def estimateConfigXtimes(self):
+        timeoutSecs = float(progs[self.progname]['timeout'][self.probsize])
+
+        measured = [self.completedData]
+        if self.database is not None and os.path.exists(self.database):
+            measured += [pd.read_csv(self.database)]
+        measured = pd.concat(measured, ignore_index=True)
+
+        configIdxs = self.samplMan.configIndices(measured)
+        xtimes = measured['xtime'].astype(float).to_numpy()
+        known = (configIdxs >= 0) & (xtimes > 0)
+        configIdxs, xtimes = configIdxs[known], np.minimum(xtimes[known], timeoutSecs)
+
+        if len(xtimes) == 0:
+            print('no runtime data for', self.progname, self.probsize, '-- assuming every run takes the timeout')
+            return np.full(self.samplMan.numConfigs, timeoutSecs)
+
+        counts = np.bincount(configIdxs, minlength=self.samplMan.numConfigs)
+        sums = np.bincount(configIdxs, weights=xtimes, minlength=self.samplMan.numConfigs)
+
+        # neighbours: configs that share the thread count
+        threadKnob = self.samplMan.hparams.index('OMP_NUM_THREADS')
+        threadIdxs = np.unravel_index(np.arange(self.samplMan.numConfigs), self.samplMan.dims)[threadKnob]
+        threadCounts = np.bincount(threadIdxs, weights=counts, minlength=self.samplMan.dims[threadKnob])
+        threadSums = np.bincount(threadIdxs, weights=sums, minlength=self.samplMan.dims[threadKnob])
+
+        estimates = np.full(self.samplMan.numConfigs, np.median(xtimes))
+        hasThreads = threadCounts[threadIdxs] > 0
+        estimates[hasThreads] = threadSums[threadIdxs[hasThreads]] / threadCounts[threadIdxs[hasThreads]]
+        hasOwn = counts > 0
+        estimates[hasOwn] = sums[hasOwn] / counts[hasOwn]
+
+        print('estimated runtimes for', hasOwn.sum(), 'of', len(estimates), 'configs from their own runs')
+        return estimates
+
+    # splits the todo point indices into the groups that each run on a node
+    def packJobs(self):
+        if self.packBy == 'count':
+            return [self.todoIdxs[start:start+self.jobsPerNode] for start in range(0, len(self.todoIdxs), self.jobsPerNode)]
+        elif self.packBy != 'runtime':
+            raise ValueError('Unknown job packing requested', self.packBy)
+
+        # XTIME_LIMIT of jobfile.sh leaves 3 minutes of the allocation unused
+        capacity = (int(self.nodeRuntime)-3) * 60 * self.NODE_FILL_FRACTION
+        maxJobs = self.jobsPerNode if self.jobsPerNode > 0 else len(self.todoIdxs)
+
+        configIdxs, _ = self.samplMan.splitIndices(self.todoIdxs)
+        runtimes = self.estimateConfigXtimes()[configIdxs] + self.RUN_OVERHEAD_SECS
+
+        # first-fit decreasing, a job longer than a node's capacity gets a node to itself
+        order = np.argsort(-runtimes, kind='stable')
+        remaining = np.zeros(0)
+        numJobs = np.zeros(0, dtype=int)
+        groupOf = np.empty(len(runtimes), dtype=int)
+        for idx in order:
+            fits = np.flatnonzero((remaining >= runtimes[idx]) & (numJobs < maxJobs))
+            if len(fits) == 0:
+                remaining = np.append(remaining, capacity)
+                numJobs = np.append(numJobs, 0)
+                group = len(remaining)-1
+            else:
+                group = fits[0]
+            remaining[group] -= runtimes[idx]
+            numJobs[group] += 1
+            groupOf[idx] = group
+
+        loads = capacity - remaining
+        print(f'packed {len(runtimes)} jobs into {len(loads)} nodes of {capacity/60:.1f} usable minutes,',
+              f'estimated node loads: {loads.min()/60:.1f} to {loads.max()/60:.1f} minutes')
+
+        # within a node the jobs keep their todo order
+        return [self.todoIdxs[np.flatnonzero(groupOf == group)] for group in range(len(loads))]
 
     def setupAllNewJobs(self):
-        numJobs = self.todoDF.shape[0]
-        totalNumGroups = math.ceil(numJobs/self.jobsPerNode)
-
-        groupIdx = 0
+        groups = self.packJobs()
+        totalNumGroups = len(groups)
 
-        hparams = list(machines[MACHINE]['envvars'].keys())
-        
         toRunDirs = []
 
-        while numJobs > 0:
-            todoJobs = self.jobsPerNode if numJobs > self.jobsPerNode else numJobs
-
-            # get the next set of jobs
-            startIdx = groupIdx*self.jobsPerNode
-            endIdx = startIdx + todoJobs
-            jobs = self.todoDF.iloc[startIdx:endIdx]
-            jobs = jobs.reset_index()
+        # each node's todo CSV gets built straight from its group of point indices
+        for groupIdx,group in enumerate(groups):
+            jobs = self.samplMan.pointsFromIndices(group)
 
             # create a directory for this group
             dirname = self.samplingDir+'/job_'+str(groupIdx+1)+'_of_'+str(totalNumGroups)+'-'+self.timestamp
@@ -125,98 +251,41 @@ class JobManager:
 
             toRunDirs.append(dirname)
 
-            jobs = jobs[['progname', 'probsize']+hparams]
             # create the todo CSV in the group dir
             csvname = dirname+'/todo.csv'
             jobs.to_csv(csvname, index=False)
 
-            numJobs -= self.jobsPerNode
-            groupIdx += 1
-
         return toRunDirs
 
-    def getIncompleteRuns(self):
-        # open up all the directories and concatenate their
-        # complete.csv
-
-        # check against the pointsDF to see what's missing
-
-        # setup run dirs to complete missing work
-
-        # job_X_of_Y directories
-
-        # get all the complete.csv files
-        completeFiles = list(glob.glob(f'{self.samplingDir}/*/complete.csv'))
+    # puts all the todo points in a new queue, returns its dir once per node
+    # to launch. The queue mirrors its results to a complete.csv in its dir.
+    def setupWorkQueue(self):
+        dirname = self.samplingDir+'/queue-'+self.timestamp
+        os.mkdir(dirname)
 
-        #print('\n', '\n'.join(completeFiles))
+        self.queuePath = dirname+'/workQueue.sqlite'
+        workQueue = WorkQueue(self.queuePath)
+        for chunk in self.samplMan.iterPointChunks(self.CHUNK_SIZE, self.todoIdxs):
+            workQueue.addJobs(chunk)
+        print('queued', workQueue.getStatusCounts()['todo'], 'jobs in', self.queuePath)
+        workQueue.close()
 
-        completedData = pd.DataFrame()
+        numNodes = len(self.packJobs())
+        return [dirname]*numNodes
 
-        tojoin = []
-        # open and concatenate all of them
-        for compFile in completeFiles:
-            df = pd.read_csv(compFile)
-            tojoin += [df]
-
-        completedData = pd.concat([completedData]+tojoin, ignore_index=True)
-
-        #print('completeddata shape', completedData.shape)
-        #print('pointsdf shape', self.pointsDF.shape)
-
-        if completedData.shape[0] == 0:
-            # if there are no complete files, no runs have been done
-            # or if the files were started and nothing written to them
-            return self.pointsDF
-
-        # drop any -1 xtimes
-        completedData = completedData[completedData['xtime'] != -1.0]
-
-        #print('completeddata shape', completedData.shape)
-        #print('pointsdf shape', self.pointsDF.shape)
-
-        # drop the xtime column
-        completedData = completedData.drop('xtime', axis=1)
-        assert len(list(completedData)) == len(list(self.pointsDF.columns))
-
-        colsToSort = list(self.pointsDF.columns)
-
-        # force the column datatypes to be the same
-        self.pointsDF['OMP_NUM_THREADS'] = self.pointsDF['OMP_NUM_THREADS'].astype(completedData.dtypes['OMP_NUM_THREADS'])
-
-        completedData = completedData.sort_values(by=colsToSort).reset_index(drop=True)
-        self.pointsDF = self.pointsDF.sort_values(by=colsToSort).reset_index(drop=True)
-
-        #print(completedData.head(), self.pointsDF.head(), sep='\n')
-        #print(completedData.tail(), self.pointsDF.tail(), sep='\n')
-        #print(completedData.head(), completedData.tail(), sep='\n')
-        #print('completeddata shape', completedData.shape)
-        #print('pointsdf shape', self.pointsDF.shape)
-
-        #print(completedData.dtypes, self.pointsDF.dtypes, sep='\n')
-
-        # it's not playing nice with duplicates, let's make a new column of 1s
-        # cumsum after groupby to "index" them, then do the isin check
-        # drop the extra column after
-
-        self.pointsDF['indic'] = 1
-        completedData['indic'] = 1
-
-        self.pointsDF['cumsum'] = self.pointsDF.groupby(colsToSort, as_index=False)['indic'].cumsum().reset_index(drop=True)
-        completedData['cumsum'] = completedData.groupby(colsToSort, as_index=False)['indic'].cumsum().reset_index(drop=True)
-
-        completedData = completedData.drop('indic', axis=1)
-        self.pointsDF = self.pointsDF.drop('indic', axis=1)
-
-        # let's check against the pointsDF to see what we're missing
-        todoRuns = self.pointsDF[~self.pointsDF.apply(tuple,1).isin(completedData.apply(tuple,1))]
-
-        todoRuns = todoRuns.drop('cumsum', axis=1)
-
-        #print('todoruns shape', todoRuns.shape, todoRuns.head())
+    # flat indices (see SamplesManager) of the points still left to run
+    def getIncompleteRuns(self):
+        # the runs of all the job_X_of_Y dirs and queues of this program,
+        # without the -1 xtimes. complete.csv files the store hasn't seen
+        # (sweeps from before the store, nodes writing to another store)
+        # get imported first, unchanged ones are skipped.
+        store = ResultStore(self.storePath, self.samplMan.hparams)
+        importCSVTree(store, os.path.dirname(self.samplingDir))
+        self.completedData = store.getRuns(self.progname, self.probsize)
+        store.close()
 
-        todoRuns = todoRuns.reset_index(drop=True)
+        return self.samplMan.remainingPointIndices(self.completedData)
 
-        return todoRuns
 
 
     #def findIncompleteJobs(self):
@@ -270,14 +339,16 @@ class JobManager:
         #    print(self.progname, self.probsize, 'incomplete jobs:', '\n'.join(self.runDirs))
         #return
 
-        self.todoDF = self.getIncompleteRuns()
+        self.todoIdxs = self.getIncompleteRuns()
 
-        print(f'Number of samples left to execute: {self.todoDF.shape[0]}')
+        print(f'Number of samples left to execute: {len(self.todoIdxs)}')
 
         # if there's no work to be done
-        if self.todoDF.shape[0] == 0:
+        if len(self.todoIdxs) == 0:
             print('no incomplete jobs!')
             self.runDirs = []
+        elif self.useQueue:
+            self.runDirs = self.setupWorkQueue()
         else:
             self.runDirs = self.setupAllNewJobs()
             print(self.progname, self.probsize, 'incomplete jobs:', '\n'.join(self.runDirs))
@@ -285,27 +356,35 @@ class JobManager:
         return
 
 
-    def launchJobs(self):
+    def launchJobs(self, jobSystem=None, localSlots=1):
         '''
-            This will make multiple sbatch script invocations
+            This will make multiple sbatch script invocations, or
+            with the local job system, run them all in a process pool
+            of localSlots concurrent node allocations on this machine
         '''
-        jobSys = machines[MACHINE]['jobsystem']
-        jobRunner = jobSys['runner']
-        jobNodetime = jobSys['nodetime']
-        jobOutput = jobSys['output']
-        jobDebug = jobSys['debug']
+        jobSys = machines[getMachine()]['jobsystem']
+        if jobSystem is None:
+            jobSystem = jobSys['runner']
 
-        modloadPy =  machines[MACHINE]['pythonToModLoad']
+        modloadPy =  machines[getMachine()]['pythonToModLoad']
 
         if len(self.runDirs) == 0:
             print('All runs complete, none needed!', self.progname, self.probsize)
             return
 
-        for csvDir in self.runDirs: 
+        localPool = LocalJobPool(localSlots) if jobSystem == 'local' else None
+
+        for nodeIdx,csvDir in enumerate(self.runDirs): 
+
+            # queue workers share a dir, so they each get their own log
+            logfile = csvDir+'/runOutput.log' if not self.useQueue else csvDir+'/runOutput-'+str(nodeIdx)+'.log'
 
-            command = jobRunner+jobNodetime+self.nodeRuntime+' '+jobOutput+csvDir+'/runOutput.log '
-            if self.useDebugNodes:
-                command += jobDebug
+            if localPool is None:
+                command = jobSys['runner']+jobSys['nodetime']+self.nodeRuntime+' '+jobSys['output']+logfile+' '
+                if self.useDebugNodes:
+                    command += jobSys['debug']
+            else:
+                command = ''
 
             command += ' jobfile.sh'
 
@@ -314,10 +393,18 @@ class JobManager:
                        'PYTHON_SCRIPT_EXEC_DIR':ROOT_DIR,
                        'CLEAN_FINISH_EXIT_CODE':str(CLEAN_FINISH_EXIT_CODE),
                        'XTIME_LIMIT':str(int(self.nodeRuntime)-3),
+                       'CUTOFF_FACTOR':str(self.cutoffFactor),
+                       'WORK_QUEUE':self.queuePath if self.useQueue else '',
+                       'RESULT_STORE':self.storePath,
+                       'EXTRAPOLATE':'1' if self.extrapolate else '',
                        'PROPAGATE_CMD':command}
 
             vars_to_use = {**os.environ.copy(), **envvars}
 
+            if localPool is not None:
+                localPool.submit(command, vars_to_use, logfile, self.nodeRuntime, ROOT_DIR)
+                continue
+
             print(f'executing command: [{command}] \n', '\nwith envvars', envvars)
             print(shlex.split(command))
             result = subprocess.run(shlex.split(command), shell=False, env=vars_to_use,
@@ -330,6 +417,9 @@ class JobManager:
             print(output)
             print(errors)
 
+        if localPool is not None:
+            localPool.run()
+
         return
 
 # Defining main function
@@ -339,17 +429,33 @@ def main():
     parser.add_argument('--progName', help='What benchmark should we test with?', default='bt_nas', type=str)
     parser.add_argument('--probSize', help='What problem size should we test with?', default='medprob', type=str)
     parser.add_argument('--numTrials', help='How many repeat trials should we do?', default=2, type=int)
-    parser.add_argument('--jobsPerNode', help='How many jobs to have per node', default=100, type=int)
+    parser.add_argument('--jobsPerNode', help='How many jobs to have per node (the max per node with --packBy=runtime, 0 for no max)', default=100, type=int)
+    parser.add_argument('--packBy', help='Split jobs into nodes by job count, or pack nodes by estimated runtime (count,runtime)', 
+                        default='count', type=str, choices=['count', 'runtime'])
+    parser.add_argument('--useQueue', help='Have all the nodes drain one shared work queue instead of their own todo.csv', 
+                        action='store_true')
+    parser.add_argument('--jobSystem', help='Submit with the machine\'s job system, or run the jobs in a process pool on this machine (local)', 
+                        default=None, type=str, choices=['local'])
+    parser.add_argument('--localSlots', help='Num jobs the local job system runs at once, each job times its runs so 1 keeps them from interfering', 
+                        default=1, type=int)
+    parser.add_argument('--database', help='Database of past xtimes for estimating runtimes with --packBy=runtime', 
+                        default=ROOT_DIR+'/'+getMachine()+'-fullExploreDataset.csv', type=str)
+    parser.add_argument('--resultStore', help='SQLite result store the nodes write their runs into (unseen complete.csv files get imported into it)', 
+                        default=DEFAULT_STORE_PATH, type=str)
     parser.add_argument('--useDebugNodes', help='Should we use debug nodes for testing launches?', default=False, type=bool)
     parser.add_argument('--nodeRuntime', help='How long for each node to run in MINUTES format', required=True, type=str)
+    parser.add_argument('--cutoffFactor', help='Kill runs slower than this factor x the best xtime so far, 0 disables', default=0.0, type=float)
+    parser.add_argument('--extrapolate', help='Kill runs whose progress output predicts they will pass their timeout (or cutoff)', 
+                        action='store_true')
     
     args = parser.parse_args()
     print('Got input args:', args)
 
     jobMan = JobManager(args.progName, args.probSize, args.nodeRuntime, 
-                          args.jobsPerNode, args.numTrials, args.useDebugNodes)
+                          args.jobsPerNode, args.numTrials, args.useDebugNodes, args.cutoffFactor,
+                          args.packBy, args.database, args.useQueue, args.resultStore, args.extrapolate)
     jobMan.setupJobs()
-    jobMan.launchJobs()
+    jobMan.launchJobs(args.jobSystem, args.localSlots)
 
     return
   
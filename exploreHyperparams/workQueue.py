@@ -0,0 +1,146 @@
+import sqlite3
+import json
+import time
+import os
+import pandas as pd
+from contextlib import contextmanager
+
+# A work queue kept in one SQLite file next to the sampling data, so that
+# any number of nodes (or local processes) can drain the same sweep without
+# a server. Workers lease the next job, keep the lease alive with heartbeats
+# while it runs, and hand back its result. A lease that isn't renewed in
+# time (e.g. the node got killed) expires and the job goes back in the queue.
+#
+# SQLite relies on file locks for this, which is fine on local disks and
+# on Lustre/GPFS mounted with flock support -- but not on plain NFS.
+class WorkQueue:
+
+    # runs that come back with a -1 xtime get re-queued this many times
+    MAX_ATTEMPTS = 3
+
+    def __init__(self, queuePath, timeoutSecs=60):
+        self.queuePath = queuePath
+        self.conn = sqlite3.connect(queuePath, timeout=timeoutSecs, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+
+        with self.transaction():
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS jobs (
+                                     id INTEGER PRIMARY KEY,
+                                     progname TEXT, probsize TEXT, envvars TEXT,
+                                     status TEXT DEFAULT 'todo',
+                                     worker TEXT, leaseExpires REAL,
+                                     attempts INTEGER DEFAULT 0,
+                                     xtime REAL, censored INTEGER, invalid INTEGER DEFAULT 0, finished REAL)''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS jobsByStatus ON jobs (status, id)')
+
+            # queues from before the invalid flag
+            cols = [row['name'] for row in self.conn.execute('PRAGMA table_info(jobs)')]
+            if 'invalid' not in cols:
+                self.conn.execute('ALTER TABLE jobs ADD COLUMN invalid INTEGER DEFAULT 0')
+        return
+
+    # BEGIN IMMEDIATE takes the write lock up front, so two workers can't
+    # both read the same todo job before one of them marks it leased
+    @contextmanager
+    def transaction(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield self.conn
+        except:
+            self.conn.execute('ROLLBACK')
+            raise
+        self.conn.execute('COMMIT')
+        return
+
+    def close(self):
+        self.conn.close()
+        return
+
+    # df has progname, probsize and one column per envvar
+    def addJobs(self, df):
+        envvarCols = [col for col in df.columns if col not in ['progname', 'probsize']]
+        rows = [(progname, probsize, json.dumps({k:str(v) for k,v in zip(envvarCols, vals)}))
+                for progname, probsize, *vals in df[['progname', 'probsize']+envvarCols].itertuples(index=False)]
+        with self.transaction() as conn:
+            conn.executemany('INSERT INTO jobs (progname, probsize, envvars) VALUES (?, ?, ?)', rows)
+        return
+
+    # returns the next job as (jobId, progname, probsize, envvars), or None
+    # when nothing is left to lease right now
+    def lease(self, worker, leaseSecs):
+        now = time.time()
+        with self.transaction() as conn:
+            expired = conn.execute('''UPDATE jobs SET status='todo', worker=NULL
+                                      WHERE status='leased' AND leaseExpires < ?''', (now,)).rowcount
+            if expired != 0:
+                print('re-queued', expired, 'jobs with expired leases')
+
+            job = conn.execute("SELECT id, progname, probsize, envvars FROM jobs WHERE status='todo' ORDER BY id LIMIT 1").fetchone()
+            if job is None:
+                return None
+
+            conn.execute("UPDATE jobs SET status='leased', worker=?, leaseExpires=? WHERE id=?",
+                         (worker, now + leaseSecs, job['id']))
+
+        return job['id'], job['progname'], job['probsize'], json.loads(job['envvars'])
+
+    # returns False when the lease was lost (it expired and got re-queued)
+    def heartbeat(self, jobId, worker, leaseSecs):
+        with self.transaction() as conn:
+            renewed = conn.execute("UPDATE jobs SET leaseExpires=? WHERE id=? AND status='leased' AND worker=?",
+                                   (time.time() + leaseSecs, jobId, worker)).rowcount
+        return renewed == 1
+
+    # results of a lease that was lost in the meantime get dropped, whoever
+    # holds the job now will report it. Invalid runs (see
+    # ProgRunner.runProgChecked) are done, re-running them won't help.
+    def complete(self, jobId, worker, xtime, censored, invalid=False):
+        with self.transaction() as conn:
+            job = conn.execute("SELECT attempts FROM jobs WHERE id=? AND status='leased' AND worker=?",
+                               (jobId, worker)).fetchone()
+            if job is None:
+                print('lost the lease on job', jobId, '-- dropping its result')
+                return False
+
+            # like a -1 in complete.csv, the run has to be redone
+            if xtime == -1.0 and job['attempts']+1 < self.MAX_ATTEMPTS:
+                conn.execute("UPDATE jobs SET status='todo', worker=NULL, attempts=attempts+1 WHERE id=?", (jobId,))
+                return True
+
+            conn.execute('''UPDATE jobs SET status='done', xtime=?, censored=?, invalid=?, finished=?, attempts=attempts+1
+                            WHERE id=?''', (xtime, int(censored), int(invalid), time.time(), jobId))
+        return True
+
+    def getStatusCounts(self):
+        counts = {'todo':0, 'leased':0, 'done':0}
+        for row in self.conn.execute('SELECT status, COUNT(*) AS num FROM jobs GROUP BY status'):
+            counts[row['status']] = row['num']
+        return counts
+
+    def isDrained(self):
+        counts = self.getStatusCounts()
+        return counts['todo'] == 0 and counts['leased'] == 0
+
+    # best uncensored, valid xtime of each (progname, probsize) done so far
+    def getBestXtimes(self):
+        rows = self.conn.execute('''SELECT progname, probsize, MIN(xtime) AS best FROM jobs
+                                    WHERE status='done' AND censored=0 AND invalid=0 AND xtime > 0
+                                    GROUP BY progname, probsize''')
+        return {(row['progname'], row['probsize']):row['best'] for row in rows}
+
+    # the done jobs in the complete.csv layout, so the launcher and the
+    # database scripts pick the queue's results up like any node's
+    def exportComplete(self, completeCSV):
+        rows = []
+        for job in self.conn.execute("SELECT * FROM jobs WHERE status='done' ORDER BY id"):
+            rows += [{'xtime': job['xtime'], 'censored': bool(job['censored']), 'invalid': bool(job['invalid']),
+                      'progname': job['progname'], 'probsize': job['probsize'], **json.loads(job['envvars'])}]
+
+        if len(rows) == 0:
+            return
+
+        # every worker exports, so each one writes its own temp file
+        tmpCSV = completeCSV+'.'+str(os.getpid())+'.tmp'
+        pd.DataFrame(rows).to_csv(tmpCSV, index=False)
+        os.replace(tmpCSV, completeCSV)
+        return